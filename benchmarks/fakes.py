@@ -0,0 +1,110 @@
+"""
+Offline stand-ins for the benchmark suite: small deterministic models with the
+Keras interface the meal services use, synthetic images, a synthetic dish
+catalog, and a small nutrition forest trained on the bundled CSV.
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+MEAL_BACKEND_DIR = Path(__file__).parent.parent / 'meal prediction - backend'
+NUTRITION_BACKEND_DIR = Path(__file__).parent.parent / 'nutrition_backend'
+N_INGREDIENT_CLASSES = 75   # model/class_encoding.json
+
+
+class _FakeKerasModel:
+    """Seeded random projection of 8x8 average-pooled pixels; same call styles as a keras.Model."""
+
+    def __init__(self, n_outputs, seed):
+        rng = np.random.default_rng(seed)
+        self.weights = rng.normal(0, 1 / 8, (8 * 8 * 3, n_outputs)).astype(np.float32)
+        self.bias = rng.normal(0, 0.5, n_outputs).astype(np.float32)
+
+    def _forward(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        n, h, w, c = x.shape
+        pooled = x[:, :h // 8 * 8, :w // 8 * 8].reshape(n, 8, h // 8, 8, w // 8, c).mean(axis=(2, 4))
+        z = (pooled.reshape(n, -1) / 255.0 - 0.5) @ self.weights + self.bias
+        return 1 / (1 + np.exp(-z))
+
+    def __call__(self, x, training=False):
+        return self._outputs(self._forward(x))
+
+    def predict(self, x, verbose=0):
+        return self(x)
+
+
+class FakeNutrientModel(_FakeKerasModel):
+    """Portion-independent nutrient model: {'protein', 'fat', 'carbs'} per gram, each (n, 1)."""
+
+    def __init__(self, seed=1):
+        super().__init__(3, seed)
+
+    def _outputs(self, y):
+        y = y * 0.3   # plausible grams of macro per gram of food
+        return {'protein': y[:, 0:1], 'fat': y[:, 1:2], 'carbs': y[:, 2:3]}
+
+
+class FakeIngredientModel(_FakeKerasModel):
+    """Multi-label ingredient model: (n, N_INGREDIENT_CLASSES) sigmoid outputs."""
+
+    def __init__(self, seed=2, n_classes=N_INGREDIENT_CLASSES):
+        super().__init__(n_classes, seed)
+
+    def _outputs(self, y):
+        return y
+
+
+def fake_load_model(path, compile=False, **kwargs):
+    """Drop-in for tf.keras.models.load_model that picks the fake by file name."""
+    return FakeIngredientModel() if 'ingredient' in os.path.basename(str(path)) else FakeNutrientModel()
+
+
+def synthetic_image(seed, size=(480, 640)):
+    """Smooth random RGB image (uint8 HxWx3), roughly photo-like for JPEG size and decode cost."""
+    rng = np.random.default_rng(seed)
+    h, w = size
+    coarse = rng.integers(0, 256, (h // 32 + 2, w // 32 + 2, 3)).astype(np.float32)
+    img = np.repeat(np.repeat(coarse, 32, axis=0), 32, axis=1)[:h, :w]
+    img += rng.normal(0, 12, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def synthetic_jpeg(seed, size=(480, 640)):
+    """JPEG bytes of synthetic_image (needs TensorFlow, like the services that decode it)."""
+    import tensorflow as tf
+    return tf.io.encode_jpeg(synthetic_image(seed, size), quality=90).numpy()
+
+
+def load_class_map():
+    """The ingredient model's class map (index -> name), read without TensorFlow."""
+    with open(MEAL_BACKEND_DIR / 'model' / 'class_encoding.json') as f:
+        return {int(i): name for i, name in json.load(f)['ingr'].items()}
+
+
+def write_catalog(directory, n_dishes=2000, n_ingredients=300, seed=0):
+    """Write a synthetic dataset/ folder (the four files load_catalog reads) with generate_catalog.py."""
+    if str(MEAL_BACKEND_DIR) not in sys.path:
+        sys.path.append(str(MEAL_BACKEND_DIR))
+    from generate_catalog import default_profile, generate_tables, write_catalog as write_tables
+
+    profile = default_profile(n_ingredients, seed=seed)
+    return write_tables(directory, *generate_tables(n_dishes, profile, seed=seed))
+
+
+def train_small_nutrition_model(path, n_estimators=20):
+    """The production pipeline with a small forest, fitted on the bundled CSV (deterministic)."""
+    import joblib
+    from train import build_model, load_dataset, split_dataset
+
+    X, y = load_dataset(NUTRITION_BACKEND_DIR / 'sri_lanka_dataset_1000_inputs_outputs_only.csv')
+    X_train, _, y_train, _ = split_dataset(X, y)
+    pipeline = build_model('multioutput_rf')
+    pipeline.set_params(regressor__estimator__n_estimators=n_estimators)
+    pipeline.fit(X_train, y_train)
+    joblib.dump(pipeline, path)
+    return X.to_dict('records')
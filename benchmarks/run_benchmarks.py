@@ -0,0 +1,476 @@
+"""
+Offline benchmark suite for both backends.
+
+Everything runs in-process against scratch data, with no network, Postgres or
+trained Keras models needed:
+
+- nutrition_backend on a SQLite file (DATABASE_URL), serving a small forest
+  trained on the bundled CSV and a seeded prediction history;
+- the meal backend on a synthetic dish catalog (MEAL_DATASET_DIR), with the Keras
+  models replaced by deterministic stand-ins of the same interface (fakes.py)
+  and synthetic JPEGs as uploads.
+
+Two kinds of numbers are reported:
+
+- micro: per-stage latency (image decode, model inference, planning, swaps,
+  filters, nutrition inference, DB writes and reads), repeated calls in a loop;
+- load: an async load generator driving the ASGI apps through httpx at each
+  --concurrency level, reporting throughput and p50/p95/p99 per endpoint.
+
+Results are written as JSON (--output) so runs on two commits can be diffed,
+or compared directly with --compare baseline.json.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --concurrency 1 8 32 --requests 500 --compare bench.json
+
+Stages that need TensorFlow (image decode, the image-model path of
+/api/analyze-meal and the whole meal app, whose services import it) are listed
+under "skipped" when it is not installed. Load scenarios whose requests fail
+(every request, or any warm-up request) are listed under "failed" instead of
+reported, and the run exits non-zero.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+import fakes  # noqa: E402
+
+PROFILE = {
+    "age": 34, "gender": "Female", "height_cm": 162.0, "weight_kg": 64.0, "goal": "Lose",
+    "has_diabetes": 0, "has_hypertension": 0, "steps_per_day": 8500, "active_minutes": 45,
+    "calories_burned_active": 320.0, "resting_heart_rate": 66.0, "avg_heart_rate": 92.0,
+    "stress_score": 38.0,
+}
+# created_at of the rows db.insert_batch100 writes, inside the seeded history's range
+BENCH_NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def summarize(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "n": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def measure(fn, repeat, warmup=2):
+    """Latency summary of repeat calls fn(i)."""
+    for i in range(warmup):
+        fn(i)
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - t0)
+    return summarize(times)
+
+
+def git_revision():
+    root = Path(__file__).parent.parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Scratch environment
+# ---------------------------------------------------------------------------
+
+def prepare(workdir, args):
+    """Write the scratch data and point both backends at it (before they are imported)."""
+    workdir = Path(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["MEAL_DATASET_DIR"] = str(workdir / "dataset")
+    os.environ["MEAL_PLAN_CACHE_PREWARM_FILE"] = ""
+    os.environ["NUTRITION_MODEL_PATH"] = str(workdir / "nutrition_model.pkl")
+    os.environ.setdefault("NUTRITION_SAVE_DELAY_S", "0.02")
+    for path in (fakes.NUTRITION_BACKEND_DIR, fakes.MEAL_BACKEND_DIR):
+        if str(path) not in sys.path:
+            sys.path.append(str(path))
+
+    log(f"Writing a {args.dishes}-dish synthetic catalog")
+    fakes.write_catalog(workdir / "dataset", n_dishes=args.dishes)
+    log("Training the benchmark nutrition model")
+    fakes.train_small_nutrition_model(workdir / "nutrition_model.pkl")
+
+    # The meal services load their models from a path that must exist; the fakes ignore the contents
+    for name in ("nutrient_model_portion_independent.keras", "ingredient_model_EfficientNetV2B0.keras"):
+        (workdir / name).touch()
+
+    log(f"Seeding {args.history_rows} history rows")
+    with contextlib.redirect_stdout(io.StringIO()):
+        import init_db  # noqa: F401  creates the tables
+        import benchmark_history
+        benchmark_history.seed(args.history_rows, n_users=max(1, args.history_rows // 50),
+                               heavy_rows=min(args.history_rows, 5000))
+    logging.getLogger("services.meal_plan_predictor").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def load_meal_app(workdir):
+    """The meal FastAPI app with the fake Keras models patched in (needs TensorFlow)."""
+    import tensorflow as tf
+    tf.keras.models.load_model = fakes.fake_load_model
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main as meal_main
+    meal_main.predict_nutrients_from_image = functools.partial(
+        meal_main.predict_nutrients_from_image,
+        model_path=str(Path(workdir) / "nutrient_model_portion_independent.keras"))
+    meal_main.predict_ingredients_from_image = functools.partial(
+        meal_main.predict_ingredients_from_image,
+        model_path=str(Path(workdir) / "ingredient_model_EfficientNetV2B0.keras"))
+    return meal_main.app
+
+
+# ---------------------------------------------------------------------------
+# Micro-benchmarks
+# ---------------------------------------------------------------------------
+
+def meal_micro(workdir, repeat, skipped):
+    from services.dish_neighbours import build_neighbour_index
+    from services.ingredient_nutrition import build_nutrition_matrix
+    from services.meal_plan_predictor import generate_meal_plan, get_catalog, meal_alternatives
+    from services.plan_cache import get_meal_plan
+
+    results = {}
+    t0 = time.perf_counter()
+    catalog = get_catalog()
+    results["meal.catalog_load"] = summarize([time.perf_counter() - t0])
+    results["meal.neighbour_index_build"] = measure(
+        lambda i: build_neighbour_index(catalog.available_dishes), max(1, repeat // 20), warmup=0)
+
+    rng = np.random.default_rng(0)
+    targets = rng.uniform(1400, 2800, repeat + 2)
+    results["meal.plan_uncached"] = measure(lambda i: generate_meal_plan(targets[i], 3), repeat)
+    results["meal.plan_cached"] = measure(lambda i: get_meal_plan(2000, 3), repeat)
+
+    names = sorted(catalog.filters.ingredient_index)
+    exclude = names[:5]
+    results["meal.filter_mask"] = measure(
+        lambda i: catalog.filters.mask(exclude_ingredients=exclude, tags=["high_protein"]), repeat)
+    filters = {"exclude_ingredients": exclude}
+    results["meal.plan_filtered"] = measure(
+        lambda i: generate_meal_plan(targets[i], 3, dietary_filters=filters), repeat)
+
+    dishes = catalog.available_dishes["dish"].to_numpy()
+    results["meal.swap"] = measure(
+        lambda i: meal_alternatives(dishes[i % len(dishes)], target_calories=650, k=5), repeat)
+
+    class_map = fakes.load_class_map()
+    matrix = build_nutrition_matrix(class_map, catalog.ingredients)
+    probabilities = fakes.FakeIngredientModel()(np.stack([fakes.synthetic_image(i, (320, 320)) for i in range(32)]))
+    results["meal.ingredient_estimate_batch32"] = measure(lambda i: matrix.estimate(probabilities), repeat)
+
+    try:
+        import tensorflow as tf
+        from services.ingredient_predictor import top_ingredients
+        from services.nutrients_predictor import make_portion_independent_prediction
+    except ImportError as e:
+        skipped["meal.decode"] = skipped["meal.inference"] = f"TensorFlow stack not importable: {e}"
+        return results
+
+    image_path = Path(workdir) / "upload.jpg"
+    image_path.write_bytes(fakes.synthetic_jpeg(0))
+
+    def decode(i):
+        return np.expand_dims(np.array(tf.keras.utils.load_img(str(image_path), target_size=(320, 320))), 0)
+
+    results["meal.decode"] = measure(decode, repeat)
+    x = decode(0)
+    nutrient_model, ingredient_model = fakes.FakeNutrientModel(), fakes.FakeIngredientModel()
+    results["meal.inference"] = measure(
+        lambda i: (make_portion_independent_prediction(x, nutrient_model, 100),
+                   top_ingredients(ingredient_model.predict(x)[0], class_map)), repeat)
+    return results
+
+
+def nutrition_micro(repeat):
+    import app as nutrition_app
+    from sqlalchemy import insert
+    from benchmark_history import HEAVY_USER
+    from db import SessionLocal
+    from history import history_page_query
+    from models import Prediction
+    from rollups import trends_query, upsert_rollups
+
+    results = {}
+    rng = np.random.default_rng(1)
+    profiles = [{**PROFILE, "steps_per_day": int(s)} for s in rng.integers(2000, 20000, repeat + 2)]
+    results["nutrition.inference"] = measure(lambda i: nutrition_app._predict_uncached(profiles[i]), repeat)
+
+    def insert_batch(i, size=100):
+        rows = []
+        for p in profiles[:size]:
+            pred = nutrition_app._predict_uncached(p)
+            rows.append({**p, "id": nutrition_app.id_allocator.next_id(), "user_id": f"user_bench_{i:04d}",
+                         "daily_kcal_need": int(pred[0]), "protein_g_per_day": float(pred[1]),
+                         "carbs_g_per_day": float(pred[2]), "fat_g_per_day": float(pred[3]),
+                         "created_at": BENCH_NOW})
+        with SessionLocal() as db:
+            db.execute(insert(Prediction), rows)
+            upsert_rollups(db, rows)
+            db.commit()
+
+    # includes predicting the rows; DB cost is the difference to 100x nutrition.inference
+    results["db.insert_batch100"] = measure(insert_batch, max(1, repeat // 5))
+
+    def fetch(stmt):
+        with SessionLocal() as db:
+            return db.execute(stmt).all()
+
+    results["db.history_page50"] = measure(lambda i: fetch(history_page_query(HEAVY_USER, 50)), repeat)
+    as_of = BENCH_NOW.date()
+    results["db.trends"] = measure(lambda i: fetch(trends_query(HEAVY_USER, as_of)), repeat)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Load generator
+# ---------------------------------------------------------------------------
+
+class ScenarioFailed(RuntimeError):
+    """A load scenario whose requests fail, so its numbers would time error responses."""
+
+
+async def drive(app, request, n_requests, concurrency, warmup=5):
+    """
+    n_requests calls of request(client, i) from `concurrency` workers; throughput + latency.
+    Raises ScenarioFailed if a warm-up request or every measured request fails.
+    """
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for i in range(warmup):
+            response = await request(client, i)
+            if response.status_code >= 400:
+                raise ScenarioFailed(f"warm-up request returned {response.status_code}: {response.text[:200]}")
+
+        pending = iter(range(n_requests))
+        latencies, errors = [], 0
+
+        async def worker():
+            nonlocal errors
+            for i in pending:
+                t0 = time.perf_counter()
+                try:
+                    response = await request(client, i)
+                    ok = response.status_code < 400
+                except Exception:
+                    ok = False
+                latencies.append(time.perf_counter() - t0)
+                errors += not ok
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    if errors == n_requests:
+        raise ScenarioFailed(f"all {n_requests} requests failed")
+    return {"concurrency": concurrency, "requests": n_requests, "errors": errors,
+            "rps": round(n_requests / elapsed, 1), **summarize(latencies)}
+
+
+def nutrition_scenarios():
+    import app as nutrition_app
+    from benchmark_history import HEAVY_USER
+
+    rng = np.random.default_rng(2)
+    steps = rng.integers(2000, 20000, 100_000)
+
+    async def predict(client, i):
+        return await client.post("/predict", json={**PROFILE, "steps_per_day": int(steps[i % len(steps)])})
+
+    async def predict_and_save(client, i):
+        return await client.post("/predict-and-save", json={**PROFILE, "steps_per_day": int(steps[i % len(steps)])})
+
+    async def history(client, i):
+        return await client.get(f"/history/{HEAVY_USER}", params={"limit": 50})
+
+    app = nutrition_app.app
+    return {"nutrition POST /predict": (app, predict),
+            "nutrition POST /predict-and-save": (app, predict_and_save),
+            "nutrition GET /history": (app, history)}
+
+
+def meal_scenarios(workdir, skipped):
+    try:
+        app = load_meal_app(workdir)
+    except ImportError as e:
+        skipped["meal load"] = f"meal app not importable (TensorFlow stack): {e}"
+        return {}
+    from services.meal_plan_predictor import get_catalog
+
+    rng = np.random.default_rng(3)
+    targets = rng.uniform(1400, 2800, 100_000)
+    dishes = get_catalog().available_dishes["dish"].to_numpy()
+    images = [fakes.synthetic_jpeg(i) for i in range(8)]
+
+    async def suggest(client, i):
+        return await client.post("/api/suggest-meals",
+                                 json={"total_calories": float(targets[i % len(targets)]), "meals_per_day": 3})
+
+    async def alternatives(client, i):
+        return await client.post("/api/meal-alternatives",
+                                 json={"dish_id": str(dishes[i % len(dishes)]), "target_calories": 650,
+                                       "meals_per_day": 3, "meal_index": i % 3})
+
+    async def analyze(client, i):
+        return await client.post("/api/analyze-meal",
+                                 files={"image": ("meal.jpg", images[i % len(images)], "image/jpeg")})
+
+    return {"meal POST /api/suggest-meals": (app, suggest),
+            "meal POST /api/meal-alternatives": (app, alternatives),
+            "meal POST /api/analyze-meal": (app, analyze)}
+
+
+def run_load(scenarios, concurrency_levels, n_requests, failed):
+    """Load results per scenario; scenarios that fail are left out and listed in `failed`."""
+    results = {}
+    for name, (app, request) in scenarios.items():
+        runs = []
+        try:
+            for concurrency in concurrency_levels:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = asyncio.run(drive(app, request, n_requests, concurrency))
+                log(f"  {name} @ {concurrency}: {result['rps']} req/s, p95 {result['p95_ms']} ms")
+                runs.append(result)
+        except ScenarioFailed as e:
+            log(f"  {name}: FAILED ({e})")
+            failed[name] = str(e)
+            continue
+        results[name] = runs
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def flatten(report):
+    """metric name -> value for the numbers worth comparing between runs."""
+    flat = {}
+    for stage, summary in report.get("micro", {}).items():
+        flat[f"{stage} p50_ms"] = summary["p50_ms"]
+    for scenario, runs in report.get("load", {}).items():
+        for run in runs:
+            flat[f"{scenario} c={run['concurrency']} rps"] = run["rps"]
+            flat[f"{scenario} c={run['concurrency']} p95_ms"] = run["p95_ms"]
+    return flat
+
+
+def compare(report, baseline):
+    current, before = flatten(report), flatten(baseline)
+    print(f"\n=== vs {baseline['meta'].get('git_commit')} ===")
+    for name in sorted(current):
+        if name not in before:
+            continue
+        old, new = before[name], current[name]
+        change = (new - old) / old * 100 if old else float("nan")
+        # throughput: higher is better; latency: lower is better
+        worse = change < 0 if name.endswith("rps") else change > 0
+        flag = " !" if abs(change) >= 10 and worse else ""
+        print(f"{name:60s} {old:>10.3f} -> {new:>10.3f}  {change:+6.1f}%{flag}")
+
+
+def print_report(report):
+    print("\n=== Micro-benchmarks (ms) ===")
+    for stage, s in report["micro"].items():
+        print(f"{stage:36s} p50 {s['p50_ms']:>9.3f}  p95 {s['p95_ms']:>9.3f}  p99 {s['p99_ms']:>9.3f}  (n={s['n']})")
+    print("\n=== Load ===")
+    for scenario, runs in report["load"].items():
+        for r in runs:
+            print(f"{scenario:36s} c={r['concurrency']:<4d} {r['rps']:>8.1f} req/s  p50 {r['p50_ms']:>8.2f}  "
+                  f"p95 {r['p95_ms']:>8.2f}  p99 {r['p99_ms']:>8.2f} ms  errors {r['errors']}")
+    for stage, reason in report["skipped"].items():
+        print(f"skipped {stage}: {reason}")
+    for scenario, reason in report["failed"].items():
+        print(f"FAILED {scenario}: {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro + load benchmarks for both backends")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint and concurrency level")
+    parser.add_argument("--repeat", type=int, default=100, help="calls per micro-benchmark")
+    parser.add_argument("--dishes", type=int, default=3000, help="synthetic catalog size")
+    parser.add_argument("--history-rows", type=int, default=50_000)
+    parser.add_argument("--only", choices=["micro", "load"], default=None)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "git_commit": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": vars(args),
+        },
+        "micro": {},
+        "load": {},
+        "skipped": {},
+        "failed": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="fitnourish-bench-") as workdir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepare(workdir, args)
+            import app as nutrition_app
+        try:
+            if args.only != "load":
+                log("Micro-benchmarks")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    report["micro"].update(meal_micro(workdir, args.repeat, report["skipped"]))
+                    report["micro"].update(nutrition_micro(args.repeat))
+            if args.only != "micro":
+                log("Load")
+                scenarios = {**nutrition_scenarios(), **meal_scenarios(workdir, report["skipped"])}
+                report["load"] = run_load(scenarios, args.concurrency, args.requests, report["failed"])
+        finally:
+            nutrition_app.write_queue.close()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nReport saved to: {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
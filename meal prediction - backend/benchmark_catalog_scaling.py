@@ -0,0 +1,176 @@
+"""
+Meal planner scaling benchmark
+
+Generates catalogs of growing size with generate_catalog.py and measures, at
+each size:
+
+- catalog load: reading the .xlsx files (where they fit in a sheet) and building
+  the DishCatalog (macro columns, filter bitsets, neighbour lists);
+- memory: resident set with the catalog loaded, the size of its tables, and the
+  process peak (each size runs in a fresh process);
+- latency of data_preparation, one select_dish_for_meal call and whole
+  generate_meal_plan calls for random daily targets (the plan cache is bypassed);
+- plan quality: how far the planned day lands from the calorie target, and how
+  far each meal's macro split is from the target split.
+
+    python benchmark_catalog_scaling.py --sizes 10000 100000 1000000
+    python benchmark_catalog_scaling.py --sizes 10000 --reference dataset/ --output scaling.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# generated catalogs are installed directly; never fall back to reading dataset/
+os.environ['MEAL_DATASET_DIR'] = os.path.join(tempfile.gettempdir(), 'meal-scaling-no-dataset')
+
+from generate_catalog import EXCEL_MAX_ROWS, default_profile, fit_profile, generate_tables, write_catalog  # noqa: E402
+from services.meal_plan_predictor import (DEFAULT_MACRO_RATIOS, build_catalog, data_preparation,  # noqa: E402
+                                          generate_meal_plan, load_catalog, select_dish_for_meal, use_catalog)
+
+MACROS = [('fat', 'total_fat', 9), ('carb', 'total_carb', 4), ('protein', 'total_protein', 4)]
+
+
+def rss_mb():
+    """Current resident set size (Linux), or None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KiB on Linux
+
+
+def plan_quality(plan, daily_target, meal_targets, macro_ratios):
+    """Calorie deviation of the day (%), and per-meal calorie (%) and macro (percentage points) deviation."""
+    day_kcal = sum(meal['total_calories'] for meal in plan)
+    meal_kcal = [abs(meal['total_calories'] - target) / target * 100 for meal, target in zip(plan, meal_targets)]
+    meal_macro = [np.mean([abs(meal[f'{macro}_pc'] - macro_ratios[macro] * 100) for macro, _, _ in MACROS])
+                  for meal in plan]
+    day_macro = np.mean([abs(sum(m[col] for m in plan) * kcal / max(day_kcal, 1e-9) * 100 - macro_ratios[macro] * 100)
+                         for macro, col, kcal in MACROS])
+    return {
+        'day_kcal_dev_%': abs(day_kcal - daily_target) / daily_target * 100,
+        'meal_kcal_dev_%': float(np.mean(meal_kcal)),
+        'meal_macro_dev_pp': float(np.mean(meal_macro)),
+        'day_macro_dev_pp': float(day_macro),
+    }
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def run_size(n_dishes, profile, args):
+    """All measurements for one catalog size (run in a fresh process, so memory numbers are its own)."""
+    logging.getLogger('services.meal_plan_predictor').setLevel(logging.WARNING)
+    rng = np.random.default_rng(args.seed)
+    row = {'dishes': n_dishes}
+    (dishes, dish_ingredients, ingredients), row['generate_s'] = _timed(
+        lambda: generate_tables(n_dishes, profile, seed=args.seed))
+    row['generate_s'] /= 1000
+    row['ingredient_rows'] = len(dish_ingredients)
+    images = pd.DataFrame({'dish': dishes['dish_id'], 'rgb_image': [b''] * n_dishes})
+
+    catalog, build_ms = _timed(lambda: build_catalog(images, dishes, dish_ingredients, ingredients))
+    row['build_s'] = build_ms / 1000
+    del images
+    gc.collect()
+    row['rss_mb'] = rss_mb()   # the catalog plus the generated tables it was built from
+    row['tables_mb'] = (catalog.available_dishes.memory_usage(deep=True).sum()
+                        + catalog.dish_ingredients.memory_usage(deep=True).sum()) / 2 ** 20
+    use_catalog(catalog)
+
+    # the same tables through the .xlsx files load_catalog reads, where they fit in a sheet
+    row['xlsx_read_s'] = None
+    if not args.in_memory and len(dish_ingredients) + 1 <= EXCEL_MAX_ROWS:
+        with tempfile.TemporaryDirectory() as directory:
+            write_catalog(directory, dishes, dish_ingredients, ingredients)
+            t0 = time.perf_counter()
+            for name in ('dishes', 'dish_ingredients', 'ingredients'):
+                pd.read_excel(os.path.join(directory, f'{name}.xlsx'))
+            pd.read_pickle(os.path.join(directory, 'dish_images.pkl'))
+            row['xlsx_read_s'] = time.perf_counter() - t0
+            if args.check_load:
+                load_catalog(directory)   # the files load_catalog reads are valid
+    row['load_s'] = row['xlsx_read_s'] + row['build_s'] if row['xlsx_read_s'] is not None else None
+    del dishes
+
+    macro_ratios = DEFAULT_MACRO_RATIOS
+    ratios = [0.25, 0.40, 0.35]
+    prep_ms = [_timed(lambda: data_preparation(2000, 3, ratios, macro_ratios))[1] for _ in range(args.repeat)]
+    candidates = data_preparation(2000, 3, ratios, macro_ratios)['available_dishes']
+    select_ms = [_timed(lambda: select_dish_for_meal(700, candidates, macro_ratios))[1] for _ in range(args.repeat)]
+
+    plan_ms, quality = [], []
+    for _ in range(args.plans):
+        target = float(rng.uniform(1400, 2800))
+        meals = int(rng.integers(2, 5))
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan, ms = _timed(lambda: generate_meal_plan(target, meals))
+        plan_ms.append(ms)
+        meal_targets = [target * r for r in {2: [0.40, 0.60], 3: ratios, 4: [0.20, 0.15, 0.35, 0.30]}[meals]]
+        quality.append(plan_quality(plan, target, meal_targets, macro_ratios))
+
+    row['data_preparation_ms'] = float(np.median(prep_ms))
+    row['select_dish_ms'] = float(np.median(select_ms))
+    row['plan_p50_ms'] = float(np.percentile(plan_ms, 50))
+    row['plan_p95_ms'] = float(np.percentile(plan_ms, 95))
+    quality = pd.DataFrame(quality)
+    for col in quality:
+        row[f'{col}_mean'] = float(quality[col].mean())
+    row['day_kcal_dev_%_p95'] = float(quality['day_kcal_dev_%'].quantile(0.95))
+    row['peak_rss_mb'] = peak_rss_mb()
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meal planner load time, memory, latency and plan quality by catalog size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--reference", help="dataset/ to learn the catalog profile from (default: built-in profile)")
+    parser.add_argument("--plans", type=int, default=30, help="generate_meal_plan calls per size")
+    parser.add_argument("--repeat", type=int, default=5, help="data_preparation / select_dish_for_meal calls per size")
+    parser.add_argument("--in-memory", action="store_true", help="skip writing and reading the .xlsx files")
+    parser.add_argument("--check-load", action="store_true", help="also run load_catalog on the written files")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    profile = fit_profile(args.reference) if args.reference else default_profile(seed=args.seed)
+
+    rows = []
+    context = multiprocessing.get_context('spawn')
+    for n in args.sizes:
+        with context.Pool(1) as pool:
+            row = pool.apply(run_size, (n, profile, args))
+        rows.append(row)
+        load = f"{row['load_s']:.1f}s load" if row['load_s'] is not None else "no xlsx"
+        print(f"{n:>9,} dishes: {load}, {row['build_s']:.1f}s build, plan p50 {row['plan_p50_ms']:.1f} ms, "
+              f"day kcal off by {row['day_kcal_dev_%_mean']:.1f}%", flush=True)
+
+    print("\n=== Summary ===")
+    print(pd.DataFrame(rows).round(3).T.to_string(header=False))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'results': rows}, f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
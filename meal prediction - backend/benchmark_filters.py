@@ -0,0 +1,161 @@
+"""
+Dietary filter benchmark
+
+Times include/exclude/tag filtering with the precomputed bitsets in
+services/dish_filters.py against the DataFrame way (isin over dish_ingredients,
+then groupby / set lookups) on synthetic catalogs of growing size. Before timing,
+the ingredient tags are checked against hand-labelled ingredient names
+(TAG_CASES), and both filters must agree on every tag.
+
+    python benchmark_filters.py --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.dish_filters import INGREDIENT_TAGS, build_filter_index, excluded_tags, normalize
+
+_NOT_VEGETARIAN = {"vegetarian", "vegan"}
+# Ingredient name -> ingredient tags it rules out, labelled by hand (names from model/class_encoding.json
+# and the dataset, including ones a substring match gets wrong)
+TAG_CASES = {
+    "eggplant": set(),
+    "eggs": {"vegan"},
+    "scrambled eggs": {"vegan"},
+    "egg whites": {"vegan"},
+    "honeydew melons": set(),
+    "honey": {"vegan"},
+    "olives": set(),
+    "olive oil": set(),
+    "peanut butter": set(),
+    "coconut milk": set(),
+    "butternut squash": set(),
+    "buttermilk": {"vegan"},
+    "greek yogurt": {"vegan"},
+    "bacon": _NOT_VEGETARIAN | {"hypertension_friendly"},
+    "ham": _NOT_VEGETARIAN | {"hypertension_friendly"},
+    "hash browns": set(),
+    "chicken apple sausage": _NOT_VEGETARIAN | {"hypertension_friendly"},
+    "grilled chicken": _NOT_VEGETARIAN,
+    "salmon": _NOT_VEGETARIAN,
+    "soy sauce": {"hypertension_friendly"},
+    "cheese pizza": {"vegan", "gluten_free", "hypertension_friendly"},
+    "pepperoni pizza": _NOT_VEGETARIAN | {"gluten_free", "hypertension_friendly"},
+    "wheat berry": {"gluten_free"},
+    "whole wheat bread": {"gluten_free"},
+    "graham crackers": {"gluten_free"},
+    "tortilla": {"gluten_free"},
+    "oatmeal": set(),
+    "brown rice": set(),
+    "tofu": set(),
+}
+
+
+def check_tag_cases():
+    """excluded_tags() agrees with the hand labels in TAG_CASES."""
+    wrong = {name: (excluded_tags(name), expected) for name, expected in TAG_CASES.items()
+             if excluded_tags(name) != expected}
+    assert not wrong, f"ingredient tags differ from TAG_CASES (got, expected): {wrong}"
+
+
+def synthetic_catalog(n_dishes, n_ingredients=500, per_dish=(2, 10), seed=0):
+    """(available_dishes, dish_ingredients) shaped like the planner's catalog; TAG_CASES names included."""
+    rng = np.random.default_rng(seed)
+    dish_ids = np.array([f"dish_{i:07d}" for i in range(n_dishes)])
+    counts = rng.integers(per_dish[0], per_dish[1] + 1, n_dishes)
+    names = np.array([f"ingredient {i}" for i in range(n_ingredients)] + list(TAG_CASES))
+    ingr = rng.integers(0, len(names), counts.sum())
+    dish_ingredients = pd.DataFrame({
+        "dish_id": np.repeat(dish_ids, counts),
+        "ingr_name": names[ingr],
+    }).drop_duplicates()
+
+    pcs = rng.dirichlet([3, 4.5, 2.5], n_dishes) * 100
+    available_dishes = pd.DataFrame({
+        "dish": dish_ids,
+        "fat_pc": pcs[:, 0], "carb_pc": pcs[:, 1], "protein_pc": pcs[:, 2],
+    })
+    return available_dishes, dish_ingredients
+
+
+def dataframe_filter(available_dishes, dish_ingredients, include, exclude, tags):
+    """Reference implementation: the same semantics with pandas joins."""
+    names = dish_ingredients["ingr_name"].str.strip().str.lower()
+    keep = pd.Series(True, index=available_dishes.index)
+    if include:
+        has = dish_ingredients.loc[names.isin([normalize(n) for n in include]), "dish_id"].unique()
+        keep &= available_dishes["dish"].isin(has)
+    if exclude:
+        has = dish_ingredients.loc[names.isin([normalize(n) for n in exclude]), "dish_id"].unique()
+        keep &= ~available_dishes["dish"].isin(has)
+    for tag in tags:
+        if tag == "low_carb":
+            keep &= available_dishes["carb_pc"] < 26
+        elif tag == "high_protein":
+            keep &= available_dishes["protein_pc"] >= 30
+        elif tag in INGREDIENT_TAGS:
+            ruled_out = [name for name, excluded in TAG_CASES.items() if tag in excluded]
+            keep &= ~available_dishes["dish"].isin(dish_ingredients.loc[names.isin(ruled_out), "dish_id"].unique())
+    return keep.to_numpy()
+
+
+def _best_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitset vs DataFrame dietary filter cost by catalog size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    include = ["ingredient 1", "ingredient 2", "ingredient 3", "ingredient 4", "ingredient 5"]
+    exclude = ["ingredient 10", "ingredient 11", "ingredient 12"]
+    tags = ["low_carb", "high_protein", "vegetarian"]
+
+    check_tag_cases()
+    rows = []
+    for n in args.sizes:
+        available_dishes, dish_ingredients = synthetic_catalog(n)
+        t0 = time.perf_counter()
+        index = build_filter_index(available_dishes, dish_ingredients)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        expected = dataframe_filter(available_dishes, dish_ingredients, include, exclude, tags)
+        got = index.to_bool(index.mask(include, exclude, tags))
+        assert np.array_equal(expected, got), "bitset and DataFrame filters disagree"
+        for tag in INGREDIENT_TAGS:
+            assert np.array_equal(dataframe_filter(available_dishes, dish_ingredients, [], [], [tag]),
+                                  index.to_bool(index.mask([], [], [tag]))), f"filters disagree on {tag}"
+
+        bitset_ms = _best_ms(lambda: index.mask(include, exclude, tags), args.repeat)
+        select_ms = _best_ms(lambda: available_dishes[index.to_bool(index.mask(include, exclude, tags))], args.repeat)
+        frame_ms = _best_ms(
+            lambda: dataframe_filter(available_dishes, dish_ingredients, include, exclude, tags), args.repeat)
+        rows.append({
+            "dishes": n,
+            "matching": int(got.sum()),
+            "index_build_ms": build_ms,
+            "index_kb": (index.ingredient_bits.nbytes + sum(b.nbytes for b in index.tag_bits.values())) / 1024,
+            "bitset_mask_ms": bitset_ms,
+            "bitset_select_ms": select_ms,
+            "dataframe_ms": frame_ms,
+            "speedup": frame_ms / select_ms,
+        })
+        print(f"{n:>9,} dishes: bitset {bitset_ms:.3f} ms (+select {select_ms:.3f} ms), "
+              f"DataFrame {frame_ms:.2f} ms")
+
+    print("\n=== Summary ===")
+    print(pd.DataFrame(rows).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Offline model evaluation
+
+Batched evaluation of the nutrient and ingredient models on a labelled image
+set, replacing the per-image loop in
+notebooks/Nutrient_prediction_model_performance_evaluation.ipynb. Images are
+read, decoded and resized to 320x320 in parallel by a prefetching tf.data
+pipeline while the previous batch runs through both models.
+
+The source is either a manifest (the preprocess step's filtered_data.json, or a
+CSV/JSONL with the same columns: id, total_calories, total_mass, total_fat,
+total_carb, total_protein, label, image_link, split) or a directory of images
+plus --labels, where each image's dish id is its parent directory name
+(data/<dish_id>/rgb.png).
+
+    python evaluate_models.py filtered_data.json --image-root preprocess/data --split test
+    python evaluate_models.py images/ --labels dishes.csv --batch-size 64 --output predictions.csv
+"""
+
+import argparse
+import ast
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from services.ingredient_predictor import load_class_map
+from services.nutrients_predictor import calories_from_macro
+
+IMAGE_SIZE = (320, 320)
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+NUTRIENTS = ['protein', 'fat', 'carbs', 'calories']
+# manifest column with the ground truth for each nutrient
+TRUTH_COLUMNS = {'protein': 'total_protein', 'fat': 'total_fat', 'carbs': 'total_carb', 'calories': 'total_calories'}
+
+
+def default_model_path(file_name):
+    """Same lookup as the prediction services: model/, then models/, then /models."""
+    base_path = Path(__file__).parent
+    for path in (base_path / 'model' / file_name, base_path / 'models' / file_name, Path('/models') / file_name):
+        if path.exists():
+            return path
+    return base_path / 'model' / file_name
+
+
+def resolve_image_path(link, image_root):
+    # manifest links look like ./data/<dish>/<file>; image_root already points at data/
+    link = str(link)
+    if image_root is None or os.path.isabs(link):
+        return os.path.normpath(link)
+    for prefix in ('./data/', 'data/'):
+        if link.startswith(prefix):
+            link = link[len(prefix):]
+            break
+    return os.path.normpath(os.path.join(image_root, link))
+
+
+def read_table(path):
+    path = str(path)
+    if path.endswith('.csv'):
+        return pd.read_csv(path, dtype={'total_mass': 'float64'})
+    return pd.read_json(path, dtype={'total_mass': 'float64'}, lines=path.endswith('.jsonl'))
+
+
+def load_examples(source, labels=None, image_root=None, split=None, limit=None):
+    """
+    Ground truth and image paths for every image to evaluate.
+
+    Returns:
+        tuple: (examples DataFrame with an 'image_path' column, number of rows skipped
+               because their image file is missing)
+    """
+    source = Path(source)
+    if source.is_dir():
+        if labels is None:
+            raise SystemExit("--labels is required when the source is an image directory")
+        truth = read_table(labels).drop_duplicates('id').set_index('id')
+        paths = sorted(p for p in source.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        examples = pd.DataFrame({'image_path': [str(p) for p in paths], 'id': [p.parent.name for p in paths]})
+        examples = examples[examples['id'].isin(truth.index)]
+        examples = examples.join(truth, on='id')
+    else:
+        examples = read_table(source)
+        examples['image_path'] = [resolve_image_path(link, image_root) for link in examples['image_link']]
+
+    if split is not None and 'split' in examples:
+        examples = examples[examples['split'] == split]
+    if limit:
+        examples = examples.head(limit)
+    exists = examples['image_path'].map(os.path.exists)
+    return examples[exists].reset_index(drop=True), int((~exists).sum())
+
+
+def image_dataset(paths, batch_size):
+    """Parallel read + decode + resize, batched and prefetched."""
+    def load(path):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        # nearest matches tf.keras.utils.load_img(target_size=...) used by the services
+        img = tf.image.resize(img, IMAGE_SIZE, method='nearest')
+        return tf.cast(img, tf.float32)
+
+    options = tf.data.Options()
+    options.deterministic = True   # keep batches aligned with the manifest rows
+    return (
+        tf.data.Dataset.from_tensor_slices(list(paths))
+        .map(load, num_parallel_calls=tf.data.AUTOTUNE)
+        .batch(batch_size)
+        .prefetch(tf.data.AUTOTUNE)
+        .with_options(options)
+    )
+
+
+def nutrient_outputs(predictions):
+    """(batch, 3) protein/fat/carbs per gram from the nutrient model's output structure."""
+    if isinstance(predictions, dict):
+        keys = ['protein', 'fat', 'carbs'] if 'protein' in predictions else list(predictions)[:3]
+        columns = [np.asarray(predictions[k]).reshape(-1) for k in keys]
+    elif isinstance(predictions, (list, tuple)):
+        columns = [np.asarray(p).reshape(-1) for p in predictions[:3]]
+    else:
+        array = np.asarray(predictions)
+        columns = [array.reshape(len(array), -1)[:, i] for i in range(3)]
+    return np.stack(columns, axis=1)
+
+
+def tolerance_accuracy(actual, predicted, tolerances, slack=2.0):
+    """
+    % of predictions within tolerance, by the notebook's rule:
+    |actual - predicted| <= slack * tolerance * actual.
+    """
+    actual, predicted = np.asarray(actual), np.asarray(predicted)
+    if len(actual) == 0:
+        return {f"{int(t * 100)}%": 0.0 for t in tolerances}
+    error = np.abs(actual - predicted)
+    return {f"{int(t * 100)}%": float((error <= slack * t * actual).mean() * 100) for t in tolerances}
+
+
+def ingredient_metrics(probabilities, labels, class_map, top=5):
+    """Top-1 hit rate and top-k precision / recall of the ingredient model against label lists."""
+    index = {name.strip().lower(): i for i, name in class_map.items()}
+    order = np.argsort(-probabilities, axis=1)[:, :top]
+    hit1, precision, recall, counted = 0, 0.0, 0.0, 0
+    for row, label in zip(order, labels):
+        if isinstance(label, str):
+            label = ast.literal_eval(label)
+        truth = {index[n.strip().lower()] for n in label if n.strip().lower() in index}
+        if not truth:
+            continue
+        predicted = [i for i in row if i in class_map]
+        found = truth.intersection(predicted)
+        hit1 += bool(predicted) and predicted[0] in truth
+        precision += len(found) / max(1, len(predicted))
+        recall += len(found) / len(truth)
+        counted += 1
+    counted = max(1, counted)
+    return {'images': counted, 'top1_hit_%': hit1 / counted * 100,
+            f'top{top}_precision_%': precision / counted * 100, f'top{top}_recall_%': recall / counted * 100}
+
+
+def evaluate(examples, nutrient_model, ingredient_model, class_map, batch_size):
+    """Run both models over every example; returns (per-image predictions, ingredient probabilities, timings)."""
+    masses = examples['total_mass'].to_numpy(dtype=np.float64)
+    nutrient_rows, probability_rows = [], []
+    infer_s = 0.0
+    started = time.perf_counter()
+    for batch in image_dataset(examples['image_path'], batch_size):
+        t0 = time.perf_counter()
+        nutrient_rows.append(nutrient_outputs(nutrient_model(batch, training=False)))
+        probability_rows.append(np.asarray(ingredient_model(batch, training=False)))
+        infer_s += time.perf_counter() - t0
+    elapsed = time.perf_counter() - started
+
+    per_gram = np.concatenate(nutrient_rows)
+    # like the notebook: per-gram outputs scaled by the dish's true mass
+    protein, fat, carbs = (per_gram[:, i] * masses for i in range(3))
+    predicted = pd.DataFrame({
+        'id': examples['id'],
+        'protein': protein, 'fat': fat, 'carbs': carbs,
+        'calories': calories_from_macro(protein=protein, carbs=carbs, fat=fat),
+    })
+    for name, column in TRUTH_COLUMNS.items():
+        predicted[f'actual_{name}'] = examples[column].to_numpy(dtype=np.float64)
+
+    probabilities = np.concatenate(probability_rows)
+    top1 = probabilities.argmax(axis=1)
+    predicted['top_ingredient'] = [class_map.get(int(i), '') for i in top1]
+    timings = {'images': len(examples), 'elapsed_s': elapsed, 'inference_s': infer_s}
+    return predicted, probabilities, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched offline evaluation of the nutrient and ingredient models")
+    parser.add_argument("source", help="manifest (.json/.jsonl/.csv) or image directory")
+    parser.add_argument("--labels", help="ground-truth table keyed by dish id (directory sources)")
+    parser.add_argument("--image-root", help="directory the manifest's image_link paths are relative to")
+    parser.add_argument("--split", default=None, help="only rows of this split, e.g. test")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[0.10, 0.25])
+    parser.add_argument("--nutrient-model", default=None)
+    parser.add_argument("--ingredient-model", default=None)
+    parser.add_argument("--class-map", default=None, help="class_encoding.json (default: model/)")
+    parser.add_argument("--output", help="write per-image predictions to this CSV")
+    args = parser.parse_args()
+
+    examples, skipped = load_examples(args.source, args.labels, args.image_root, args.split, args.limit)
+    if skipped:
+        print(f"Skipped {skipped} rows whose image file is missing")
+    if examples.empty:
+        raise SystemExit("No images to evaluate")
+
+    class_map = load_class_map(args.class_map)
+    nutrient_path = args.nutrient_model or default_model_path('nutrient_model_portion_independent.keras')
+    ingredient_path = args.ingredient_model or default_model_path('ingredient_model_EfficientNetV2B0.keras')
+    nutrient_model = tf.keras.models.load_model(str(nutrient_path), compile=False)
+    ingredient_model = tf.keras.models.load_model(str(ingredient_path), compile=False)
+
+    print(f"Evaluating {len(examples)} images in batches of {args.batch_size}")
+    predicted, probabilities, timings = evaluate(examples, nutrient_model, ingredient_model, class_map,
+                                                 args.batch_size)
+
+    rows = []
+    for name in NUTRIENTS:
+        actual, pred = predicted[f'actual_{name}'], predicted[name]
+        rows.append({'nutrient': name, 'mae': float(np.abs(actual - pred).mean()),
+                     **tolerance_accuracy(actual, pred, args.tolerances)})
+    print("\n=== Nutrient model: MAE and tolerance accuracy (%) ===")
+    print(pd.DataFrame(rows).round(2).to_string(index=False))
+
+    if 'label' in examples:
+        print("\n=== Ingredient model ===")
+        metrics = ingredient_metrics(probabilities, examples['label'], class_map)
+        print(json.dumps({k: round(v, 2) for k, v in metrics.items()}, indent=2))
+
+    print("\n=== Throughput ===")
+    print(f"{timings['images'] / timings['elapsed_s']:.1f} images/s end to end "
+          f"({timings['elapsed_s']:.1f}s), {timings['images'] / timings['inference_s']:.1f} images/s in the models")
+
+    if args.output:
+        predicted.to_csv(args.output, index=False)
+        print(f"Predictions saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
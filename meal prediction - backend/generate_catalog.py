@@ -0,0 +1,338 @@
+"""
+Synthetic Dish Catalog
+
+Generates the four dataset/ files the meal planner reads (dishes.xlsx,
+dish_ingredients.xlsx, ingredients.xlsx, dish_images.pkl) at any size, for
+scaling tests of data_preparation / select_dish_for_meal / generate_meal_plan
+beyond the bundled catalog.
+
+Dishes are sampled from a CatalogProfile:
+
+- how many ingredients a dish has,
+- how popular each ingredient is (a few staples appear in most dishes, most
+  ingredients are rare),
+- the portion of each ingredient (log-normal grams per ingredient: oils come
+  in grams, rice and vegetables in tens to hundreds of grams),
+- the per-gram nutrition of each ingredient.
+
+Dish totals are the sums over their ingredients, as in the real dataset, so the
+calorie and macro distributions follow from the ingredients. fit_profile()
+learns the profile from an existing catalog (--reference dataset/). Without one,
+default_profile() uses built-in food categories keyed on the ingredient model's
+class names.
+
+    python generate_catalog.py generated/ --dishes 100000
+    python generate_catalog.py generated/ --dishes 10000 --reference dataset/ --images
+    MEAL_DATASET_DIR=generated/ python main.py
+"""
+
+import argparse
+import json
+import struct
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Per-gram nutrition columns of ingredients.xlsx, in (fat, carb, protein) order
+PER_GRAM_COLUMNS = ['fat(g)', 'carb(g)', 'protein(g)']
+# openpyxl / Excel limit on rows per sheet (header included)
+EXCEL_MAX_ROWS = 1_048_576
+
+# Food categories for the built-in profile:
+# (fat, carb, protein) per-gram ranges, median portion in grams, log-sd of the portion
+CATEGORIES = {
+    'vegetable': ((0.000, 0.005), (0.03, 0.09), (0.01, 0.03), 45, 0.7),
+    'greens':    ((0.000, 0.007), (0.01, 0.05), (0.01, 0.03), 25, 0.7),
+    'fruit':     ((0.000, 0.005), (0.08, 0.20), (0.004, 0.012), 70, 0.6),
+    'starch':    ((0.002, 0.050), (0.15, 0.50), (0.02, 0.09), 90, 0.6),
+    'lean':      ((0.010, 0.080), (0.00, 0.02), (0.10, 0.30), 80, 0.5),
+    'fatty':     ((0.100, 0.400), (0.00, 0.03), (0.12, 0.28), 60, 0.6),
+    'fat':       ((0.150, 1.000), (0.00, 0.20), (0.00, 0.20), 15, 0.8),
+    'mixed':     ((0.050, 0.150), (0.10, 0.35), (0.04, 0.12), 110, 0.6),
+    'condiment': ((0.000, 0.100), (0.02, 0.30), (0.00, 0.03), 12, 0.8),
+}
+# Share of each category among ingredients that are not model classes
+CATEGORY_WEIGHTS = {'vegetable': 0.22, 'greens': 0.08, 'fruit': 0.12, 'starch': 0.14, 'lean': 0.1,
+                    'fatty': 0.1, 'fat': 0.08, 'mixed': 0.08, 'condiment': 0.08}
+# First matching keyword decides the category of a model class name
+CATEGORY_KEYWORDS = [
+    ('pizza', 'mixed'), ('salad', 'mixed'), ('fried rice', 'mixed'), ('hash browns', 'mixed'),
+    ('salsa', 'condiment'), ('lemon', 'condiment'),
+    ('sausage', 'fatty'), ('bacon', 'fatty'), ('beef', 'fatty'), ('pork', 'fatty'), ('steak', 'fatty'),
+    ('ham', 'fatty'), ('salmon', 'fatty'), ('scrambled', 'fatty'), ('thighs', 'fatty'), ('eggs', 'fatty'),
+    ('egg whites', 'lean'), ('chicken', 'lean'), ('fish', 'lean'), ('tuna', 'lean'), ('tofu', 'lean'),
+    ('olives', 'fat'), ('avocado', 'fat'), ('almonds', 'fat'), ('nuts', 'fat'), ('oil', 'fat'), ('butter', 'fat'),
+    ('rice', 'starch'), ('potato', 'starch'), ('yam', 'starch'), ('quinoa', 'starch'), ('oatmeal', 'starch'),
+    ('wheat', 'starch'), ('tortilla', 'starch'), ('corn', 'starch'), ('bread', 'starch'), ('pasta', 'starch'),
+    ('greens', 'greens'), ('spinach', 'greens'), ('arugula', 'greens'), ('lettuce', 'greens'),
+    ('kale', 'greens'), ('chard', 'greens'), ('bok choy', 'greens'),
+    ('berries', 'fruit'), ('apple', 'fruit'), ('pineapple', 'fruit'), ('melon', 'fruit'), ('cantaloupe', 'fruit'),
+    ('grapes', 'fruit'), ('pears', 'fruit'), ('orange', 'fruit'), ('strawberries', 'fruit'), ('banana', 'fruit'),
+    ('kiwi', 'fruit'),
+]
+
+
+class CatalogProfile:
+    """
+    Everything generate_tables() samples from.
+
+    Args:
+        ingredients (pd.DataFrame): ingredients.xlsx rows ('ingr', 'id', 'cal/g' and PER_GRAM_COLUMNS).
+        popularity (np.ndarray): Probability of each ingredient row being picked for a dish slot.
+        log_grams (np.ndarray): (n_ingredients, 2) mean and sd of log(grams) per ingredient.
+        ingredient_counts (np.ndarray): Observed or sampled ingredients-per-dish values to resample.
+    """
+
+    def __init__(self, ingredients, popularity, log_grams, ingredient_counts):
+        self.ingredients = ingredients.reset_index(drop=True)
+        self.popularity = popularity / popularity.sum()
+        self.log_grams = log_grams
+        self.ingredient_counts = ingredient_counts
+
+
+def _category(name):
+    name = name.lower()
+    for keyword, category in CATEGORY_KEYWORDS:
+        if keyword in name:
+            return category
+    return 'vegetable'
+
+
+def _class_names():
+    path = Path(__file__).parent / 'model' / 'class_encoding.json'
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return list(json.load(f)['ingr'].values())
+
+
+def default_profile(n_ingredients=500, mean_ingredients=5.0, seed=0):
+    """
+    Built-in profile: the ingredient model's classes plus generic ingredients of each category.
+
+    Args:
+        n_ingredients (int): Size of the ingredient table.
+        mean_ingredients (float): Mean ingredients per dish (1 + negative binomial, so single-item
+                                  plates and long recipes both occur).
+        seed (int): Random seed.
+
+    Returns:
+        CatalogProfile: The profile.
+    """
+    rng = np.random.default_rng(seed)
+    names = _class_names()[:n_ingredients]
+    n_classes = len(names)
+    categories = [_category(name) for name in names]
+    extra = rng.choice(list(CATEGORY_WEIGHTS), n_ingredients - len(names), p=list(CATEGORY_WEIGHTS.values()))
+    names += [f'{category} {i}' for i, category in enumerate(extra, start=len(names))]
+    categories += list(extra)
+
+    per_gram = np.empty((n_ingredients, 3))
+    log_grams = np.empty((n_ingredients, 2))
+    for i, category in enumerate(categories):
+        fat, carb, protein, portion, sd = CATEGORIES[category]
+        per_gram[i] = [rng.uniform(*fat), rng.uniform(*carb), rng.uniform(*protein)]
+        # ingredients of a category differ in typical portion too
+        log_grams[i] = [np.log(portion) + rng.normal(0, 0.3), sd]
+
+    ingredients = pd.DataFrame({'ingr': names, 'id': np.arange(1, n_ingredients + 1)})
+    ingredients['cal/g'] = per_gram[:, 0] * 9 + (per_gram[:, 1] + per_gram[:, 2]) * 4
+    for col, values in zip(PER_GRAM_COLUMNS, per_gram.T):
+        ingredients[col] = values
+
+    # Zipf-like popularity: the model's classes (common foods) first, then a shuffled long tail
+    rank = np.concatenate([np.arange(n_classes), n_classes + rng.permutation(len(extra))])
+    popularity = 1.0 / (rank + 2.0)
+
+    # 1 + NB(r=2, p): mean 1 + r (1 - p) / p
+    p = 2.0 / (2.0 + mean_ingredients - 1)
+    counts = np.minimum(1 + rng.negative_binomial(2, p, 100_000), 30)
+    return CatalogProfile(ingredients, popularity, log_grams, counts)
+
+
+def fit_profile(dataset_dir, min_observations=3):
+    """
+    Learn a profile from an existing catalog's ingredients.xlsx and dish_ingredients.xlsx.
+
+    Ingredients seen fewer than min_observations times get the catalog-wide portion
+    distribution; every ingredient keeps some popularity so it can still be drawn.
+    """
+    dataset_dir = Path(dataset_dir)
+    ingredients = pd.read_excel(dataset_dir / 'ingredients.xlsx')
+    dish_ingredients = pd.read_excel(dataset_dir / 'dish_ingredients.xlsx')
+
+    rows = pd.Series(np.arange(len(ingredients)), index=ingredients['id'])
+    used = dish_ingredients[dish_ingredients['ingr_id'].isin(rows.index) & (dish_ingredients['grams'] > 0)]
+    row = rows[used['ingr_id']].to_numpy()
+    log_g = np.log(used['grams'].to_numpy(dtype=np.float64))
+
+    n = len(ingredients)
+    seen = np.bincount(row, minlength=n)
+    mean = np.bincount(row, weights=log_g, minlength=n) / np.maximum(seen, 1)
+    var = np.bincount(row, weights=log_g ** 2, minlength=n) / np.maximum(seen, 1) - mean ** 2
+    sparse = seen < min_observations
+    mean[sparse] = log_g.mean()
+    sd = np.sqrt(np.maximum(var, 0.0))
+    sd[sparse] = log_g.std()
+
+    counts = dish_ingredients.groupby('dish_id').size().to_numpy()
+    return CatalogProfile(ingredients, seen + 0.5, np.stack([mean, sd], axis=1), counts)
+
+
+def generate_tables(n_dishes, profile, seed=0):
+    """
+    Sample a catalog.
+
+    Args:
+        n_dishes (int): Number of dishes.
+        profile (CatalogProfile): What to sample from.
+        seed (int): Random seed.
+
+    Returns:
+        tuple: (dishes, dish_ingredients, ingredients) DataFrames with the dataset files' columns.
+    """
+    rng = np.random.default_rng(seed)
+    ingredients = profile.ingredients
+    n_ingredients = len(ingredients)
+
+    counts = rng.choice(profile.ingredient_counts, n_dishes)
+    dish = np.repeat(np.arange(n_dishes), counts)
+    ingr = rng.choice(n_ingredients, len(dish), p=profile.popularity)
+    # an ingredient appears once per dish: drop repeated draws, keep draw order
+    _, first = np.unique(dish * n_ingredients + ingr, return_index=True)
+    first.sort()
+    dish, ingr = dish[first], ingr[first]
+
+    grams = np.exp(profile.log_grams[ingr, 0] + profile.log_grams[ingr, 1] * rng.standard_normal(len(ingr)))
+    grams = np.round(grams, 1) + 0.1   # scales read to 0.1 g; nothing weighs 0
+    per_gram = ingredients[['cal/g'] + PER_GRAM_COLUMNS].to_numpy(dtype=np.float64)[ingr]
+    amounts = per_gram * grams[:, None]
+
+    width = max(7, len(str(n_dishes - 1)))
+    dish_ids = np.array([f'dish_{i:0{width}d}' for i in range(n_dishes)], dtype=object)
+    dish_ingredients = pd.DataFrame({
+        'dish_id': dish_ids[dish],
+        'ingr_id': ingredients['id'].to_numpy()[ingr],
+        'ingr_name': ingredients['ingr'].to_numpy(dtype=object)[ingr],
+        'grams': grams,
+        'calories': amounts[:, 0],
+        'fat': amounts[:, 1],
+        'carb': amounts[:, 2],
+        'protein': amounts[:, 3],
+    })
+
+    totals = {col: np.bincount(dish, weights=values, minlength=n_dishes)
+              for col, values in zip(['total_calories', 'total_fat', 'total_carb', 'total_protein'], amounts.T)}
+    dishes = pd.DataFrame({
+        'dish_id': dish_ids,
+        'total_calories': totals['total_calories'],
+        'total_mass': np.bincount(dish, weights=grams, minlength=n_dishes),
+        'total_fat': totals['total_fat'],
+        'total_carb': totals['total_carb'],
+        'total_protein': totals['total_protein'],
+    })
+    return dishes, dish_ingredients, ingredients.copy()
+
+
+def _png(width, height, rgb):
+    """Bytes of a solid-colour RGB PNG (no imaging library needed)."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    row = b'\x00' + bytes(rgb) * width
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * height, 9))
+            + chunk(b'IEND', b''))
+
+
+def dummy_images(dishes, size=64):
+    """
+    One placeholder image per dish, tinted by its macro mix (fat red, carb green, protein blue).
+
+    Colours are quantized to 8 levels per channel, so at most 512 distinct images
+    are encoded however large the catalog.
+    """
+    macros = dishes[['total_fat', 'total_carb', 'total_protein']].to_numpy(dtype=np.float64)
+    share = macros / np.maximum(macros.sum(axis=1, keepdims=True), 1e-9)
+    levels = np.minimum((share * 8).astype(np.int64), 7)
+    cache = {}
+    images = []
+    for key in map(tuple, levels):
+        if key not in cache:
+            cache[key] = _png(size, size, [int(64 + v * 27) for v in key])
+        images.append(cache[key])
+    return images
+
+
+def write_catalog(directory, dishes, dish_ingredients, ingredients, images=None):
+    """
+    Write the tables as the dataset files load_catalog() reads.
+
+    Args:
+        directory (str | Path): Output directory (created if missing).
+        dishes, dish_ingredients, ingredients (pd.DataFrame): generate_tables() output.
+        images (list): Image bytes per dish (dummy_images()); empty images if None.
+
+    Raises:
+        ValueError: If a table does not fit in one Excel sheet.
+    """
+    for name, table in (('dishes', dishes), ('dish_ingredients', dish_ingredients)):
+        if len(table) + 1 > EXCEL_MAX_ROWS:
+            raise ValueError(f"{name} has {len(table):,} rows; an .xlsx sheet holds at most "
+                             f"{EXCEL_MAX_ROWS - 1:,}. Generate fewer dishes.")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    dishes.to_excel(directory / 'dishes.xlsx', index=False)
+    dish_ingredients.to_excel(directory / 'dish_ingredients.xlsx', index=False)
+    ingredients.to_excel(directory / 'ingredients.xlsx', index=False)
+    if images is None:
+        images = [b''] * len(dishes)
+    # written last: it is the file whose change makes a running server reload the catalog
+    pd.DataFrame({'dish': dishes['dish_id'], 'rgb_image': images}).to_pickle(directory / 'dish_images.pkl')
+    return directory
+
+
+def describe(dishes, dish_ingredients):
+    """Summary statistics to compare a generated catalog with a real one."""
+    kcal = dishes['total_calories']
+    macro_kcal = dishes['total_fat'] * 9 + (dishes['total_carb'] + dishes['total_protein']) * 4
+    per_dish = dish_ingredients.groupby('dish_id', sort=False).size()
+    return {
+        'dishes': len(dishes),
+        'ingredient_rows': len(dish_ingredients),
+        'ingredients_per_dish_mean': round(float(per_dish.mean()), 2),
+        'kcal_p10/p50/p90': [round(float(q), 1) for q in kcal.quantile([0.1, 0.5, 0.9])],
+        'mass_g_p10/p50/p90': [round(float(q), 1) for q in dishes['total_mass'].quantile([0.1, 0.5, 0.9])],
+        'fat_carb_protein_kcal_%': [round(float((dishes[c] * f).sum() / macro_kcal.sum() * 100), 1)
+                                    for c, f in (('total_fat', 9), ('total_carb', 4), ('total_protein', 4))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dish catalog for the meal planner")
+    parser.add_argument("output", help="directory for the dataset files")
+    parser.add_argument("--dishes", type=int, default=10000)
+    parser.add_argument("--ingredients", type=int, default=500, help="ingredient table size (built-in profile)")
+    parser.add_argument("--reference", help="existing dataset/ to learn the profile from")
+    parser.add_argument("--images", action="store_true", help="store a small placeholder image per dish")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    profile = fit_profile(args.reference) if args.reference else default_profile(args.ingredients, seed=args.seed)
+    dishes, dish_ingredients, ingredients = generate_tables(args.dishes, profile, seed=args.seed)
+    images = dummy_images(dishes) if args.images else None
+    print(f"Generated {len(dishes):,} dishes in {time.perf_counter() - t0:.1f}s")
+    print(json.dumps(describe(dishes, dish_ingredients), indent=2))
+
+    t0 = time.perf_counter()
+    write_catalog(args.output, dishes, dish_ingredients, ingredients, images)
+    print(f"Catalog written to {args.output} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,48 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 import uvicorn
 import random
 from services.nutrients_predictor import predict_nutrients_from_image
-from services.ingredient_predictor import predict_ingredients_from_image
-from services.meal_plan_predictor import generate_meal_plan
+from services.ingredient_predictor import get_class_map, predict_ingredients_from_image
+from services.ingredient_nutrition import ensemble_estimates, estimate_from_ingredients
+from services.dish_filters import UnknownFilterError
+from services.meal_plan_predictor import (NotEnoughDishesError, format_meal_suggestions, get_catalog,
+                                         meal_alternatives, reload_catalog)
+from services.plan_cache import get_meal_plan, plan_cache, prewarm_keys, save_hot_keys
+from services.intake_ledger import LedgerFullError, NoTargetsError, intake_ledger, plan_for_rest_of_day
+from services.request_profiler import (PROFILE_HEADER, PROFILE_ID_HEADER, PROFILING_ENABLED, RequestProfile,
+                                       capture_directory, list_captures, should_profile, token_matches)
+from contextlib import asynccontextmanager
+import threading
 
-app = FastAPI(title="Meal Prediction API")
+
+def prewarm_plan_cache():
+    """Fill the plan cache for the most common target buckets (runs in the background)."""
+    try:
+        warmed = plan_cache.warm(prewarm_keys(plan_cache))
+        print(f"Plan cache pre-warmed with {warmed} plans")
+    except Exception as e:
+        print(f"Plan cache pre-warm skipped: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if plan_cache is not None:
+        threading.Thread(target=prewarm_plan_cache, name="plan-cache-prewarm", daemon=True).start()
+    yield
+    if plan_cache is not None:
+        # Remember today's hottest buckets for the next start's pre-warm
+        save_hot_keys(plan_cache)
+    if intake_ledger is not None:
+        # Write the meals still queued for the intake ledger
+        intake_ledger.close()
+
+
+app = FastAPI(title="Meal Prediction API", lifespan=lifespan)
 
 # Enable CORS for React frontend
 app.add_middleware(
@@ -23,14 +56,52 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[PROFILE_ID_HEADER],
 )
 
 
+# Opt-in per-request profiling (MEAL_PROFILING=1, see services/request_profiler.py).
+# When it is off the middleware is not installed, so requests pay nothing for it.
+if PROFILING_ENABLED:
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        trigger = should_profile(request.url.path, request.headers)
+        if trigger is None:
+            return await call_next(request)
+
+        profile = RequestProfile(request.method, request.url.path, trigger)
+        await run_in_threadpool(profile.start)
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            await run_in_threadpool(profile.finish, status_code)
+        response.headers[PROFILE_ID_HEADER] = profile.id
+        return response
+
+
 class MealSuggestionRequest(BaseModel):
     total_calories: float
     meals_per_day: int
     calorie_distribution_ratios: Optional[List[float]] = None  # Optional, will use defaults if not provided
     target_macro_ratios: Optional[Dict[str, float]] = None  # Optional, will use defaults if not provided
+    include_ingredients: Optional[List[str]] = None  # Dish must contain at least one of these
+    exclude_ingredients: Optional[List[str]] = None  # Dish must contain none of these
+    tags: Optional[List[str]] = None  # Dish must have every tag, e.g. "vegetarian", "low_carb"
+
+
+class MealAlternativesRequest(BaseModel):
+    dish_id: str  # The dish being swapped out
+    meals_per_day: int
+    meal_index: int  # Which meal of the plan (0-based) is being swapped
+    target_calories: Optional[float] = None  # That meal's calorie target; defaults to the dish's calories
+    target_macro_ratios: Optional[Dict[str, float]] = None
+    exclude_dishes: Optional[List[str]] = None  # The other dishes in the current plan
+    k: int = 5
+    include_ingredients: Optional[List[str]] = None
+    exclude_ingredients: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
 
 
 class Nutrient(BaseModel):
@@ -51,6 +122,26 @@ class MealAnalysisResponse(BaseModel):
     ingredients: List[Ingredient]
     nutrients: List[Nutrient]
     calories_per_100g: float
+    # Per-100 g estimates behind `nutrients`: "image_model", "ingredients" (when available) and "ensemble"
+    estimates: Optional[Dict[str, Dict[str, float]]] = None
+    intake: Optional[Dict] = None  # The user's day after logging this meal, when user_id was sent
+
+
+class IntakeTargets(BaseModel):
+    # The nutrition backend's /predict response
+    daily_kcal_need: float
+    protein_g_per_day: float
+    carbs_g_per_day: float
+    fat_g_per_day: float
+
+
+class RemainingMealsRequest(BaseModel):
+    meals_per_day: int  # Meals the whole day is planned around
+    meals_remaining: Optional[int] = None  # Defaults to meals_per_day minus the meals logged today
+    day: Optional[str] = None  # ISO date, defaults to today (UTC)
+    include_ingredients: Optional[List[str]] = None
+    exclude_ingredients: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
 
 
 class MealNutrient(BaseModel):
@@ -67,13 +158,23 @@ class MealSuggestion(BaseModel):
     ingredients: List[str]
     nutrients: List[MealNutrient]
     mass: float  # Total mass in grams
+    dish_id: Optional[str] = None  # Catalog ID, for /api/meal-alternatives
+
+
+def _log_meal_intake(user_id, nutrients, portion_g, description):
+    """Record an analyzed meal in the intake ledger; the user's day afterwards."""
+    intake_ledger.record(user_id, nutrients, mass_g=portion_g, description=description)
+    return intake_ledger.summary(user_id)
 
 
 @app.post("/api/analyze-meal", response_model=MealAnalysisResponse)
-async def analyze_meal(image: UploadFile = File(...)):
+async def analyze_meal(image: UploadFile = File(...), user_id: Optional[str] = Form(None),
+                       portion_g: float = Form(100.0, gt=0, allow_inf_nan=False)):
     """
     Analyze uploaded meal image and return ingredients, nutrients, and calories.
     Uses ML models to predict both ingredients and nutrients from the image.
+    With user_id, the meal (portion_g grams of it) is logged to the user's intake
+    for today and the response carries the day's consumed and remaining budget.
     """
     try:
         # Read image bytes once
@@ -110,6 +211,17 @@ async def analyze_meal(image: UploadFile = File(...)):
         ingredient_names = ingredients_output.get('predictions', [])
         ingredient_probabilities = ingredients_output.get('probabilities', [])
         
+        # Second estimate from the ingredient model's full probability vector and the
+        # ingredient nutrition table (no extra CNN pass), blended with the nutrient model's
+        image_estimate = {'calories': calories_per_100g, 'fat': fat, 'carbs': carbs, 'protein': protein}
+        ingredient_estimate = estimate_from_ingredients(ingredients_output.get('class_probabilities'), get_class_map())
+        ensemble = ensemble_estimates(image_estimate, ingredient_estimate)
+        estimates = {'image_model': image_estimate, 'ensemble': ensemble}
+        if ingredient_estimate is not None:
+            estimates['ingredients'] = ingredient_estimate
+        protein, fat, carbs = ensemble['protein'], ensemble['fat'], ensemble['carbs']
+        calories_per_100g = ensemble['calories']
+        
         # Calculate total macronutrients for percentage calculations
         total_macros = protein + carbs + fat
         total_calories = protein * 4 + carbs * 4 + fat * 9
@@ -183,8 +295,24 @@ async def analyze_meal(image: UploadFile = File(...)):
         response = {
             "ingredients": ingredients,
             "nutrients": nutrients,
-            "calories_per_100g": round(calories_per_100g, 2)
+            "calories_per_100g": round(calories_per_100g, 2),
+            "estimates": {
+                source: {name: round(value, 2) for name, value in values.items()}
+                for source, values in estimates.items()
+            }
         }
+
+        if user_id and intake_ledger is not None:
+            scale = portion_g / 100
+            # SQLite reads: off the event loop
+            response["intake"] = await run_in_threadpool(
+                _log_meal_intake,
+                user_id,
+                {'calories': calories_per_100g * scale, 'protein': protein * scale,
+                 'carbs': carbs * scale, 'fat': fat * scale},
+                portion_g,
+                ', '.join(ingredient["name"] for ingredient in ingredients),
+            )
         
         return response
         
@@ -193,6 +321,8 @@ async def analyze_meal(image: UploadFile = File(...)):
             status_code=503,
             detail=f"ML model not available: {str(e)}. Please ensure the model file is in the correct location."
         )
+    except LedgerFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         import traceback
         error_detail = f"Error processing image: {str(e)}"
@@ -219,95 +349,30 @@ async def suggest_meals(request: MealSuggestionRequest):
     Suggest meals based on total daily calories and number of meals per day.
     Uses ML model to generate personalized meal plans.
     """
-    import base64
-    
     try:
         total_calories = request.total_calories
         meals_per_day = request.meals_per_day
         
-        # Meal templates for meal names and times
-        meal_templates = {
-            2: [
-                {"meal_name": "Breakfast", "time": "09:00 AM"},
-                {"meal_name": "Dinner", "time": "07:00 PM"}
-            ],
-            3: [
-                {"meal_name": "Breakfast", "time": "08:00 AM"},
-                {"meal_name": "Lunch", "time": "12:30 PM"},
-                {"meal_name": "Dinner", "time": "07:00 PM"}
-            ],
-            4: [
-                {"meal_name": "Breakfast", "time": "08:00 AM"},
-                {"meal_name": "Mid-Morning Snack", "time": "11:00 AM"},
-                {"meal_name": "Lunch", "time": "01:00 PM"},
-                {"meal_name": "Dinner", "time": "07:00 PM"}
-            ]
-        }
-        
         # Use provided ratios or defaults
         calorie_distribution_ratios = request.calorie_distribution_ratios
         target_macro_ratios = request.target_macro_ratios
+        dietary_filters = {
+            "include_ingredients": request.include_ingredients,
+            "exclude_ingredients": request.exclude_ingredients,
+            "tags": request.tags,
+        }
         
-        # Get meal plan from ML model
-        meal_plan_data = generate_meal_plan(total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios)
-        
-        # Get meal names and times
-        meal_info = meal_templates.get(meals_per_day, meal_templates[2])
+        # Get meal plan from ML model (memoized on quantized targets, see services/plan_cache.py)
+        meal_plan_data = get_meal_plan(total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios,
+                                       dietary_filters)
         
         # Format meal plan for frontend
-        suggestions = []
-        for i, meal_detail in enumerate(meal_plan_data):
-            # Convert RGB image bytes to base64
-            rgb_bytes = meal_detail.get('rgb_image', b'')
-            if rgb_bytes:
-                image_base64 = base64.b64encode(rgb_bytes).decode('utf-8')
-                image_data_url = f"data:image/jpeg;base64,{image_base64}"
-            else:
-                image_data_url = ""
-            
-            # Get meal name and time
-            meal_template = meal_info[i] if i < len(meal_info) else {"meal_name": f"Meal {i+1}", "time": "12:00 PM"}
-            
-            # Format ingredients list
-            ingredients_list = meal_detail.get('ingredients_list', [])
-            
-            # Format nutrients
-            nutrients = [
-                {
-                    "name": "Fat",
-                    "amount": round(meal_detail.get('total_fat', 0), 2),
-                    "unit": "g"
-                },
-                {
-                    "name": "Carbohydrates",
-                    "amount": round(meal_detail.get('total_carb', 0), 2),
-                    "unit": "g"
-                },
-                {
-                    "name": "Protein",
-                    "amount": round(meal_detail.get('total_protein', 0), 2),
-                    "unit": "g"
-                }
-            ]
-            
-            # Create description from dish name and ingredients
-            dish_name = meal_detail.get('dish', 'Meal')
-            ingredients_str = ', '.join(ingredients_list[:5])  # First 5 ingredients
-            description = f"Ingredients {ingredients_str}" if ingredients_str else dish_name
-            
-            suggestions.append({
-                "meal_name": meal_template["meal_name"],
-                "calories": round(meal_detail.get('total_calories', 0), 1),
-                "time": meal_template["time"],
-                "description": description,
-                "image": image_data_url,
-                "ingredients": ingredients_list,
-                "nutrients": nutrients,
-                "mass": round(meal_detail.get('total_mass', 0), 1)
-            })
+        suggestions = format_meal_suggestions(meal_plan_data, meals_per_day)
         
         return suggestions
         
+    except (UnknownFilterError, NotEnoughDishesError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         error_detail = f"Error generating meal plan: {str(e)}"
@@ -319,6 +384,171 @@ async def suggest_meals(request: MealSuggestionRequest):
         )
 
 
+@app.post("/api/meal-alternatives", response_model=List[MealSuggestion])
+def suggest_meal_alternatives(request: MealAlternativesRequest):
+    """
+    Top-k substitutes for one dish of a plan, without replanning the day.
+    Served from neighbour lists precomputed per dish when the catalog loads.
+    """
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1")
+    if not 0 <= request.meal_index < request.meals_per_day:
+        raise HTTPException(status_code=400, detail="meal_index must be between 0 and meals_per_day - 1")
+    dietary_filters = {
+        "include_ingredients": request.include_ingredients,
+        "exclude_ingredients": request.exclude_ingredients,
+        "tags": request.tags,
+    }
+    try:
+        alternatives = meal_alternatives(
+            request.dish_id, request.target_calories, request.target_macro_ratios,
+            request.exclude_dishes, request.k, dietary_filters,
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown dish: {request.dish_id}")
+    except UnknownFilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return format_meal_suggestions(alternatives, request.meals_per_day, request.meal_index)
+
+
+@app.get("/api/meal-filters")
+def meal_filters():
+    """Tags and ingredient names accepted by /api/suggest-meals filters"""
+    try:
+        filters = get_catalog().filters
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"tags": filters.tags, "ingredients": sorted(filters.ingredient_index)}
+
+
+@app.get("/api/metrics/plan-cache")
+async def plan_cache_metrics():
+    """Meal plan cache hit rate and time saved"""
+    if plan_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **plan_cache.stats()}
+
+
+@app.post("/api/admin/reload-catalog")
+def reload_dish_catalog():
+    """Reload the dish catalog from disk (clears the meal plan cache)"""
+    try:
+        catalog = reload_catalog()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"version": catalog.version, "dishes": len(catalog.available_dishes)}
+
+
+def _require_intake_ledger():
+    if intake_ledger is None:
+        raise HTTPException(status_code=503, detail="Intake ledger is disabled (MEAL_INTAKE_LEDGER=0)")
+
+
+@app.put("/api/intake/{user_id}/targets")
+def set_intake_targets(user_id: str, targets: IntakeTargets):
+    """Store a user's daily calorie and macro targets (the nutrition backend's /predict output)"""
+    _require_intake_ledger()
+    intake_ledger.set_targets(user_id, targets.model_dump())
+    return intake_ledger.summary(user_id)
+
+
+@app.get("/api/intake/{user_id}")
+def get_intake(user_id: str, day: Optional[str] = None):
+    """Calories and macros a user has eaten on a day (default today) and what is left of the targets"""
+    _require_intake_ledger()
+    try:
+        return intake_ledger.summary(user_id, day)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid day: {e}")
+
+
+@app.post("/api/intake/{user_id}/suggest-meals")
+def suggest_remaining_meals(user_id: str, request: RemainingMealsRequest):
+    """
+    Plan the rest of a user's day from what is left of their budget.
+    The calories and macros not yet eaten become the planner's targets, split over
+    the remaining meals the way the full day would have split them.
+    """
+    _require_intake_ledger()
+    try:
+        summary = intake_ledger.summary(user_id, request.day)
+        targets = plan_for_rest_of_day(summary, request.meals_per_day, request.meals_remaining)
+    except NoTargetsError as e:
+        raise HTTPException(status_code=404, detail=f"{e}; PUT /api/intake/{user_id}/targets first")
+    except ValueError as e:   # BudgetSpentError, bad meal counts or day
+        raise HTTPException(status_code=400, detail=str(e))
+
+    dietary_filters = {
+        "include_ingredients": request.include_ingredients,
+        "exclude_ingredients": request.exclude_ingredients,
+        "tags": request.tags,
+    }
+    try:
+        meal_plan_data = get_meal_plan(targets["total_calories"], targets["meals_per_day"],
+                                       targets["calorie_distribution_ratios"], targets["target_macro_ratios"],
+                                       dietary_filters)
+    except (UnknownFilterError, NotEnoughDishesError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    meals = format_meal_suggestions(meal_plan_data, request.meals_per_day, first_meal=targets["first_meal"])
+    return {"intake": summary, "targets": targets, "meals": meals}
+
+
+@app.get("/api/metrics/intake-ledger")
+async def intake_ledger_metrics():
+    """Intake ledger write batching"""
+    if intake_ledger is None:
+        return {"enabled": False}
+    return {"enabled": True, **intake_ledger.stats()}
+
+
+# Profile captures hold request metadata, source paths and the stacks of concurrent
+# requests: served only when profiling is on and the request carries MEAL_PROFILE_TOKEN.
+# Without a token configured, read them from MEAL_PROFILE_DIR on the host instead.
+if PROFILING_ENABLED:
+    def _check_profile_token(request: Request):
+        if not token_matches(request.headers):
+            raise HTTPException(status_code=403, detail=f"{PROFILE_HEADER} header with MEAL_PROFILE_TOKEN required")
+
+    @app.get("/api/admin/profiles")
+    def list_profiles(request: Request):
+        """Stored request profiles, newest first"""
+        _check_profile_token(request)
+        return {"profiles": list_captures()}
+
+    @app.get("/api/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+    def get_profile(profile_id: str, request: Request):
+        """Collapsed stacks of one profiled request (flamegraph.pl / speedscope input)"""
+        _check_profile_token(request)
+        try:
+            directory = capture_directory(profile_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"No profile {profile_id}")
+        return PlainTextResponse((directory / "stacks.txt").read_text())
+
+    @app.get("/api/admin/profiles/{profile_id}/tensorflow")
+    def get_profile_tensorflow_trace(profile_id: str, request: Request):
+        """tf.profiler trace of one profiled request, as a .tar.gz for tensorboard --logdir"""
+        import io
+        import tarfile
+
+        _check_profile_token(request)
+        try:
+            trace = capture_directory(profile_id) / "tensorflow"
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"No profile {profile_id}")
+        if not trace.is_dir():
+            raise HTTPException(status_code=404, detail=f"Profile {profile_id} has no TensorFlow trace")
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            archive.add(trace, arcname=profile_id)
+        return Response(buffer.getvalue(), media_type="application/gzip",
+                        headers={"Content-Disposition": f'attachment; filename="{profile_id}-tensorflow.tar.gz"'})
+
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,193 @@
+"""
+Dish Filter Index
+
+Precomputed bitsets over the dish catalog for dietary filters. Every ingredient
+and every tag gets one packed bit row (np.packbits layout, one bit per dish in
+catalog order), so a request's include/exclude/tag constraints become a few
+bitwise ANDs/ORs over n_dishes / 8 bytes instead of DataFrame joins against
+dish_ingredients.
+
+Filter semantics:
+    include_ingredients: the dish contains at least one of them
+    exclude_ingredients: the dish contains none of them
+    tags: the dish has every tag
+"""
+
+import re
+
+import numpy as np
+
+# Tags from the dish's macro profile: tag -> predicate over the catalog DataFrame
+MACRO_TAGS = {
+    "low_carb": lambda d: d['carb_pc'] < 26,
+    "high_protein": lambda d: d['protein_pc'] >= 30,
+    "low_fat": lambda d: d['fat_pc'] < 20,
+    "diabetes_friendly": lambda d: d['carb_pc'] <= 40,
+}
+
+# Tags from ingredients: the dish has the tag if *none* of its ingredient names
+# contain one of these words. Words match whole words of the name, singular or
+# plural ("egg" matches "scrambled eggs" but not "eggplant"; "honey" not "honeydew melons").
+_MEAT_FISH = ["chicken", "beef", "pork", "bacon", "ham", "lamb", "turkey", "sausage", "steak",
+              "fish", "salmon", "tuna", "cod", "shrimp", "prawn", "crab", "meat", "pepperoni", "duck",
+              "meatball", "hamburger", "cheeseburger"]
+_ANIMAL_PRODUCTS = _MEAT_FISH + ["egg", "cheese", "milk", "butter", "cream", "yogurt", "honey", "mayonnaise",
+                                 "buttermilk"]
+INGREDIENT_TAGS = {
+    "vegetarian": _MEAT_FISH,
+    "vegan": _ANIMAL_PRODUCTS,
+    "gluten_free": ["bread", "pasta", "wheat", "flour", "noodle", "tortilla", "cracker", "couscous", "bagel", "pizza",
+                    "breadcrumb", "flatbread"],
+    "hypertension_friendly": ["salt", "soy sauce", "bacon", "ham", "sausage", "pickle", "pepperoni", "cheese"],
+}
+# Plant-based names built from those words; removed from a name before matching
+PLANT_BASED_PHRASES = ["peanut butter", "almond butter", "nut butter", "cocoa butter", "coconut milk", "almond milk",
+                       "soy milk", "oat milk", "rice milk", "coconut cream"]
+
+
+def normalize(name):
+    return str(name).strip().lower()
+
+
+def _words(text):
+    return re.findall(r"[a-z]+", text)
+
+
+def _contains_phrase(words, phrase):
+    """True if `phrase` occurs in `words` as consecutive whole words (each singular or plural)."""
+    n = len(phrase)
+    for start in range(len(words) - n + 1):
+        if all(w in (p, p + 's', p + 'es') for w, p in zip(words[start:start + n], phrase)):
+            return True
+    return False
+
+
+def excluded_tags(name):
+    """Ingredient tags (INGREDIENT_TAGS) that an ingredient of this name rules out."""
+    name = normalize(name)
+    for phrase in PLANT_BASED_PHRASES:
+        name = re.sub(rf"\b{phrase}s?\b", " ", name)
+    words = _words(name)
+    return {tag for tag, keywords in INGREDIENT_TAGS.items()
+            if any(_contains_phrase(words, _words(keyword)) for keyword in keywords)}
+
+
+class UnknownFilterError(ValueError):
+    """Raised for ingredient names or tags that are not in the catalog."""
+
+
+class DishFilterIndex:
+    """
+    Packed bitsets over the dishes of one catalog.
+
+    Args:
+        n_dishes (int): Number of dishes (bits per row).
+        ingredient_index (dict): Normalized ingredient name -> row of ingredient_bits.
+        ingredient_bits (np.ndarray): (n_ingredients, ceil(n_dishes / 8)) uint8.
+        tag_bits (dict): Tag name -> (ceil(n_dishes / 8),) uint8.
+    """
+
+    def __init__(self, n_dishes, ingredient_index, ingredient_bits, tag_bits):
+        self.n_dishes = n_dishes
+        self.ingredient_index = ingredient_index
+        self.ingredient_bits = ingredient_bits
+        self.tag_bits = tag_bits
+        self.all_dishes = np.packbits(np.ones(n_dishes, dtype=bool))
+
+    @property
+    def tags(self):
+        return sorted(self.tag_bits)
+
+    def _rows(self, names):
+        rows, unknown = [], []
+        for name in names:
+            row = self.ingredient_index.get(normalize(name))
+            if row is None:
+                unknown.append(name)
+            else:
+                rows.append(row)
+        if unknown:
+            raise UnknownFilterError(f"Unknown ingredients: {', '.join(unknown)}")
+        return rows
+
+    def mask(self, include_ingredients=None, exclude_ingredients=None, tags=None):
+        """
+        Packed mask of the dishes passing every filter (None when there are no filters).
+
+        Raises:
+            UnknownFilterError: For ingredient names or tags the catalog does not know.
+        """
+        if not include_ingredients and not exclude_ingredients and not tags:
+            return None
+        mask = self.all_dishes.copy()
+        if include_ingredients:
+            mask &= np.bitwise_or.reduce(self.ingredient_bits[self._rows(include_ingredients)], axis=0)
+        if exclude_ingredients:
+            mask &= ~np.bitwise_or.reduce(self.ingredient_bits[self._rows(exclude_ingredients)], axis=0)
+        for tag in tags or []:
+            bits = self.tag_bits.get(normalize(tag))
+            if bits is None:
+                raise UnknownFilterError(f"Unknown tag: {tag}. Available: {', '.join(self.tags)}")
+            mask &= bits
+        return mask
+
+    def to_bool(self, mask):
+        """Unpack a mask into a boolean array over the catalog's dishes."""
+        return np.unpackbits(mask, count=self.n_dishes).astype(bool)
+
+    def contains(self, mask, rows):
+        """Boolean array: whether each of the given dish rows passes the mask."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return (mask[rows >> 3] & (np.uint8(0x80) >> (rows & 7).astype(np.uint8))) != 0
+
+    def count(self, mask):
+        return int(np.unpackbits(mask, count=self.n_dishes).sum())
+
+
+def _pack_rows(row_of_pair, dish_of_pair, n_rows, n_dishes):
+    bits = np.zeros((n_rows, (n_dishes + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(
+        bits,
+        (row_of_pair, dish_of_pair >> 3),
+        (np.uint8(0x80) >> (dish_of_pair & 7).astype(np.uint8)),
+    )
+    return bits
+
+
+def build_filter_index(available_dishes, dish_ingredients):
+    """
+    Build the bitsets for a catalog.
+
+    Args:
+        available_dishes (pd.DataFrame): Catalog dishes in planner order ('dish' column + macro pcs).
+        dish_ingredients (pd.DataFrame): dish_id / ingr_name rows.
+
+    Returns:
+        DishFilterIndex: Index whose bit positions follow available_dishes' row order.
+    """
+    n_dishes = len(available_dishes)
+    position = {dish: i for i, dish in enumerate(available_dishes['dish'])}
+
+    names = dish_ingredients['ingr_name'].map(normalize)
+    dish_pos = dish_ingredients['dish_id'].map(position)
+    known = dish_pos.notna()
+    names, dish_pos = names[known], dish_pos[known].astype(np.int64).to_numpy()
+
+    ingredient_names = sorted(names.unique())
+    ingredient_index = {name: i for i, name in enumerate(ingredient_names)}
+    rows = names.map(ingredient_index).to_numpy(dtype=np.int64)
+    ingredient_bits = _pack_rows(rows, dish_pos, len(ingredient_names), n_dishes)
+
+    tag_bits = {}
+    for tag, predicate in MACRO_TAGS.items():
+        tag_bits[tag] = np.packbits(predicate(available_dishes).to_numpy(dtype=bool))
+    all_dishes = np.packbits(np.ones(n_dishes, dtype=bool))
+    ruled_out = {name: excluded_tags(name) for name in ingredient_index}
+    for tag in INGREDIENT_TAGS:
+        matching = [i for name, i in ingredient_index.items() if tag in ruled_out[name]]
+        if matching:
+            tag_bits[tag] = all_dishes & ~np.bitwise_or.reduce(ingredient_bits[matching], axis=0)
+        else:
+            tag_bits[tag] = all_dishes.copy()
+
+    return DishFilterIndex(n_dishes, ingredient_index, ingredient_bits, tag_bits)
@@ -0,0 +1,179 @@
+"""
+Dish Neighbour Index
+
+Per-dish nearest neighbours in the planner's own nutrition space, precomputed
+when the catalog loads. select_dish_for_meal scores a dish by
+|calories - target| + sum of |macro % - target %|, so the space is
+(total_calories, fat_pc, carb_pc, protein_pc) under L1 distance: dishes close to
+a rejected dish there score close to it for the same meal target.
+
+Swapping a dish is then a lookup of its neighbour list plus a rerank of those few
+candidates against the meal target, instead of replanning the whole day. The
+list only holds the best substitutes when the meal target is close to the dish:
+`covers` checks that with the triangle inequality; when it fails, callers score
+the dishes of `calorie_window` instead, which always hold the best ones.
+"""
+
+import numpy as np
+
+NUTRITION_COLS = ['total_calories', 'fat_pc', 'carb_pc', 'protein_pc']
+MACROS = ['fat', 'carb', 'protein']
+
+
+def _nearest(F, rows, lo, hi, k):
+    """k nearest (L1) of F[rows] among F[lo:hi], nearest first, never the row itself."""
+    A, B = F[rows], F[lo:hi]
+    d = np.abs(A[:, 0, None] - B[None, :, 0])
+    tmp = np.empty_like(d)
+    for col in range(1, F.shape[1]):   # column by column: no (rows, candidates, 4) temporary
+        np.subtract(A[:, col, None], B[None, :, col], out=tmp)
+        d += np.abs(tmp, out=tmp)
+    inside = (rows >= lo) & (rows < hi)
+    d[np.nonzero(inside)[0], rows[inside] - lo] = np.inf
+    top = np.argpartition(d, k - 1, axis=1)[:, :k]
+    top_d = np.take_along_axis(d, top, axis=1)
+    rank = np.argsort(top_d, axis=1)
+    return np.take_along_axis(top, rank, axis=1) + lo, np.take_along_axis(top_d, rank, axis=1)
+
+
+def _neighbour_lists(features, k, window, block=256, max_cells=4_000_000):
+    """
+    Exact k nearest neighbours (L1) of every row, excluding the row itself.
+
+    Rows are sorted by calories and first compared with a window of rows around
+    their block. The k-th distance found there bounds the true one, and L1
+    distance is at least the calorie difference, so the exact neighbours all lie
+    within that many kcal: a second pass over that calorie range (when it is
+    wider than the window) makes the lists exact.
+    """
+    n = len(features)
+    order = np.argsort(features[:, 0], kind='stable')
+    F = features[order].astype(np.float32)
+    cal = F[:, 0]
+    neighbours = np.empty((n, k), dtype=np.int64)
+    distances = np.empty((n, k), dtype=np.float32)
+
+    for start in range(0, n, block):
+        end = min(n, start + block)
+        rows = np.arange(start, end)
+        lo, hi = max(0, start - window), min(n, end + window)
+        top, top_d = _nearest(F, rows, lo, hi, k)
+
+        bound = top_d[:, -1]
+        lo2 = int(np.searchsorted(cal, (cal[rows] - bound).min(), side='left'))
+        hi2 = int(np.searchsorted(cal, (cal[rows] + bound).max(), side='right'))
+        if lo2 < lo or hi2 > hi:
+            step = max(1, max_cells // (hi2 - lo2))
+            for s in range(0, len(rows), step):
+                sub = rows[s:s + step]
+                top[s:s + step], top_d[s:s + step] = _nearest(F, sub, lo2, hi2, k)
+
+        neighbours[start:end] = top
+        distances[start:end] = top_d
+
+    # back to catalog row order
+    result = np.empty_like(neighbours)
+    result_d = np.empty_like(distances)
+    result[order] = order[neighbours]
+    result_d[order] = distances
+    return result, result_d
+
+
+class DishNeighbourIndex:
+    """
+    Nearest dishes to every dish of one catalog.
+
+    Args:
+        features (np.ndarray): (n_dishes, 4) NUTRITION_COLS per catalog row.
+        neighbours (np.ndarray): (n_dishes, k) catalog rows of each dish's nearest dishes, nearest first.
+        distances (np.ndarray): (n_dishes, k) their L1 distances.
+    """
+
+    def __init__(self, features, neighbours, distances):
+        self.features = features
+        self.neighbours = neighbours
+        self.distances = distances
+        self._by_calories = np.argsort(features[:, 0], kind='stable')
+        self._sorted_calories = features[self._by_calories, 0]
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    def scores(self, rows, target_calories, target_macro_ratios):
+        """select_dish_for_meal's combined score for the given catalog rows."""
+        F = self.features[rows]
+        score = np.abs(F[:, 0] - target_calories)
+        for col, macro in enumerate(MACROS, start=1):
+            if macro in target_macro_ratios:
+                score = score + np.abs(F[:, col] - target_macro_ratios[macro] * 100)
+        return score
+
+    def covers(self, row, target_calories, target_macro_ratios, worst_score):
+        """
+        Whether no dish outside row's neighbour list can score below worst_score.
+
+        The score is the L1 distance from a dish to the target point. Every dish
+        outside the list is at least the k-th neighbour distance D from the row's
+        dish, so by the triangle inequality it scores at least D - |dish - target|.
+        When that beats worst_score (the k-th best score among the list), a rerank
+        of the list equals a rerank of the whole catalog.
+
+        Args:
+            row (int): Catalog row of the dish whose list was reranked.
+            target_calories (float): The meal's calorie target.
+            target_macro_ratios (dict): Target ratios for 'fat', 'carb', 'protein'.
+            worst_score (float): Score of the last dish kept from the list.
+
+        Returns:
+            bool: False if the whole catalog has to be scored.
+        """
+        if self.k == 0 or any(macro not in target_macro_ratios for macro in MACROS):
+            return False   # a dropped score term breaks the distance bound
+        dish = self.features[row]
+        target = np.array([target_calories] + [target_macro_ratios[m] * 100 for m in MACROS])
+        outside = np.abs(dish - self.features[self.neighbours[row, -1]]).sum()
+        offset = np.abs(dish - target).sum()
+        # small margin: the lists were built in float32
+        return worst_score < outside - offset - 1e-4 * (1.0 + outside)
+
+    def calorie_window(self, target_calories, radius):
+        """
+        Catalog rows within radius kcal of target_calories, in catalog order.
+
+        The calorie term alone is part of the score, so every dish scoring at most
+        radius for this target is among them.
+        """
+        lo = np.searchsorted(self._sorted_calories, target_calories - radius, side='left')
+        hi = np.searchsorted(self._sorted_calories, target_calories + radius, side='right')
+        return np.sort(self._by_calories[lo:hi])
+
+    def rerank(self, rows, target_calories, target_macro_ratios, k):
+        """The k best of `rows` for the meal target, best first."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return rows
+        score = self.scores(rows, target_calories, target_macro_ratios)
+        best = np.argsort(score, kind='stable')[:k]
+        return rows[best]
+
+
+def build_neighbour_index(available_dishes, k=32, window=None):
+    """
+    Precompute the neighbour lists for a catalog.
+
+    Args:
+        available_dishes (pd.DataFrame): Catalog dishes in planner order (NUTRITION_COLS).
+        k (int): Neighbours kept per dish (capped at n_dishes - 1).
+        window (int): Calorie-sorted rows compared on each side of a block; defaults to max(256, 8 * k).
+
+    Returns:
+        DishNeighbourIndex: Index whose rows follow available_dishes' row order.
+    """
+    features = available_dishes[NUTRITION_COLS].to_numpy(dtype=np.float64)
+    k = min(k, len(features) - 1)
+    if k <= 0:
+        empty = np.empty((len(features), 0), dtype=np.int64)
+        return DishNeighbourIndex(features, empty, empty.astype(np.float32))
+    neighbours, distances = _neighbour_lists(features, k, window or max(256, 8 * k))
+    return DishNeighbourIndex(features, neighbours, distances)
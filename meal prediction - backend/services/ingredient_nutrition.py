@@ -0,0 +1,171 @@
+"""
+Ingredient Nutrition Matrix
+
+A second per-100 g nutrient estimate for a meal image, computed from the
+ingredient model's full probability vector instead of another CNN pass.
+
+The ingredient classes (model/class_encoding.json) are joined with the
+per-gram nutrition in dataset/ingredients.xlsx into a dense
+classes x nutrients matrix M, once per dish catalog. For probability vectors P
+(one row per image) the estimate is the probability-weighted mean composition
+
+    estimate = 100 g * (P @ M) / (P @ known)
+
+where `known` marks the classes that have nutrition data, so a batch of images
+costs one matrix product. ensemble_estimates() blends it with the nutrient
+model's estimate (INGREDIENT_ESTIMATE_WEIGHT, default 0.5; 0 disables it).
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+
+from services.meal_plan_predictor import get_catalog
+
+logger = logging.getLogger(__name__)
+
+INGREDIENT_ESTIMATE_WEIGHT = float(os.getenv('INGREDIENT_ESTIMATE_WEIGHT', '0.5'))
+
+# Matrix column -> per-gram column of ingredients.xlsx
+NUTRIENT_COLUMNS = {
+    'calories': 'cal/g',
+    'fat': 'fat(g)',
+    'carbs': 'carb(g)',
+    'protein': 'protein(g)',
+}
+NUTRIENTS = list(NUTRIENT_COLUMNS)
+
+
+def _normalize(name):
+    return str(name).strip().lower()
+
+
+class IngredientNutritionMatrix:
+    """
+    Per-gram nutrition of every ingredient class, in model output order.
+
+    Args:
+        matrix (np.ndarray): (n_classes, len(NUTRIENTS)) float32, zero rows for unknown classes.
+        known (np.ndarray): (n_classes,) float32, 1 where the class has nutrition data.
+        missing (list): Class names without a match in ingredients.xlsx.
+    """
+
+    def __init__(self, matrix, known, missing):
+        self.matrix = matrix
+        self.known = known
+        self.missing = missing
+
+    @property
+    def n_classes(self):
+        return self.matrix.shape[0]
+
+    def estimate(self, probabilities, mass=100.0):
+        """
+        Nutrients for `mass` grams from ingredient probabilities.
+
+        Args:
+            probabilities (np.ndarray): (n_outputs,) or (n_images, n_outputs) model outputs.
+            mass (float): Portion in grams.
+
+        Returns:
+            np.ndarray: (len(NUTRIENTS),) or (n_images, len(NUTRIENTS)); NaN rows where
+                        no class with nutrition data has any probability.
+        """
+        P = np.asarray(probabilities, dtype=np.float32)
+        single = P.ndim == 1
+        P = np.atleast_2d(P)
+        if P.shape[1] < self.n_classes:
+            P = np.pad(P, ((0, 0), (0, self.n_classes - P.shape[1])))
+        P = P[:, :self.n_classes]
+
+        weight = P @ self.known
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (P @ self.matrix) / weight[:, None] * mass
+        result[weight <= 0] = np.nan
+        return result[0] if single else result
+
+
+def build_nutrition_matrix(class_map, ingredients):
+    """
+    Join the ingredient classes with ingredients.xlsx.
+
+    Args:
+        class_map (dict): Model output index -> ingredient name.
+        ingredients (pd.DataFrame): Ingredient table with an 'ingr' name column and NUTRIENT_COLUMNS.
+
+    Returns:
+        IngredientNutritionMatrix: Matrix with one row per model output index.
+    """
+    table = ingredients.assign(_name=ingredients['ingr'].map(_normalize)).drop_duplicates('_name').set_index('_name')
+    per_gram = table[list(NUTRIENT_COLUMNS.values())].apply(lambda s: s.astype(float)).fillna(0.0)
+
+    n_classes = max(class_map) + 1 if class_map else 0
+    matrix = np.zeros((n_classes, len(NUTRIENTS)), dtype=np.float32)
+    known = np.zeros(n_classes, dtype=np.float32)
+    missing = []
+    for index, name in class_map.items():
+        key = _normalize(name)
+        if key in per_gram.index:
+            matrix[index] = per_gram.loc[key].to_numpy(dtype=np.float32)
+            known[index] = 1.0
+        else:
+            missing.append(name)
+    return IngredientNutritionMatrix(matrix, known, missing)
+
+
+_matrix = None
+_matrix_key = None
+_matrix_lock = threading.Lock()
+
+
+def get_nutrition_matrix(class_map):
+    """The matrix for class_map and the current dish catalog (rebuilt when either changes)."""
+    global _matrix, _matrix_key
+    catalog = get_catalog()
+    key = (catalog.version, id(class_map))
+    if key != _matrix_key:
+        with _matrix_lock:
+            if key != _matrix_key:
+                _matrix = build_nutrition_matrix(class_map, catalog.ingredients)
+                _matrix_key = key
+                if _matrix.missing:
+                    logger.info(f"No nutrition data for {len(_matrix.missing)} ingredient classes: "
+                                f"{', '.join(_matrix.missing[:10])}")
+    return _matrix
+
+
+def estimate_from_ingredients(class_probabilities, class_map, mass=100.0):
+    """
+    Per-100 g estimate dict(s) from ingredient probabilities, or None if unavailable.
+
+    Accepts a single probability vector or a batch (one row per image); returns a
+    dict or a list of dicts accordingly, with None for images without an estimate.
+    """
+    if class_probabilities is None or INGREDIENT_ESTIMATE_WEIGHT <= 0:
+        return None
+    try:
+        matrix = get_nutrition_matrix(class_map)
+    except FileNotFoundError:
+        return None   # no dataset: the image model's estimate stands alone
+    values = matrix.estimate(class_probabilities, mass)
+
+    def as_dict(row):
+        if np.isnan(row).any():
+            return None
+        return {name: float(v) for name, v in zip(NUTRIENTS, row)}
+
+    if values.ndim == 1:
+        return as_dict(values)
+    return [as_dict(row) for row in values]
+
+
+def ensemble_estimates(image_estimate, ingredient_estimate, weight=INGREDIENT_ESTIMATE_WEIGHT):
+    """Weighted blend of the nutrient model's and the ingredient-based estimate."""
+    if ingredient_estimate is None:
+        return dict(image_estimate)
+    return {
+        name: (1 - weight) * image_estimate[name] + weight * ingredient_estimate[name]
+        for name in NUTRIENTS
+    }
@@ -86,19 +86,34 @@ def make_ingredient_prediction(img, model, class_map=None):
     Returns:
         tuple: (predicted_labels, probabilities) - top 5 predictions with probabilities
     """
+    predictions = model.predict(img, verbose=0)[0]
+    return top_ingredients(predictions, class_map)
+
+
+def top_ingredients(predictions, class_map=None, top=5):
+    """
+    Top ingredient labels from one image's model output.
+    
+    Args:
+        predictions: Model output vector (one probability per class)
+        class_map: Dictionary mapping class indices to ingredient names.
+                   If None, uses default CLASS_MAP.
+        top: Number of labels to return
+        
+    Returns:
+        tuple: (predicted_labels, probabilities) - top predictions with probabilities (0-100)
+    """
     if class_map is None:
         class_map = get_class_map()
     
-    predictions = model.predict(img, verbose=0)[0]
-    
     # Get top predictions (get more than 5 to account for filtering)
     indices = np.argsort(predictions)[::-1]
     
     # Filter to only include indices that are in class_map
     valid_indices = [i for i in indices if i in class_map]
     
-    # Take top 5 valid predictions
-    valid_indices = valid_indices[:5]
+    # Take top valid predictions
+    valid_indices = valid_indices[:top]
     
     # Get labels and probabilities for valid indices only
     predicted_labels = [class_map[i] for i in valid_indices]
@@ -121,6 +136,8 @@ def predict_ingredients_from_image(image_file, model_path: str = None, class_map
         dict: Dictionary containing:
             - predictions: List of top 5 predicted ingredient names
             - probabilities: List of corresponding probabilities (0-100)
+            - class_probabilities: Full model output vector, for the ingredient-based
+              nutrient estimate (services/ingredient_nutrition.py)
             
     Raises:
         FileNotFoundError: If the model file or class encoding file is not found
@@ -190,12 +207,14 @@ def predict_ingredients_from_image(image_file, model_path: str = None, class_map
             if temp_file_path is not None and os.path.exists(temp_file_path):
                 os.unlink(temp_file_path)
         
-        # Make prediction
-        preds, probs = make_ingredient_prediction(x_image_model, image_model, class_map)
+        # Make prediction (keep the full vector: the nutrient estimate uses every class)
+        class_probabilities = image_model.predict(x_image_model, verbose=0)[0]
+        preds, probs = top_ingredients(class_probabilities, class_map)
         
         return {
             'predictions': preds,
-            'probabilities': probs
+            'probabilities': probs,
+            'class_probabilities': class_probabilities
         }
         
     except FileNotFoundError as e:
@@ -0,0 +1,514 @@
+"""
+Intake Ledger Service
+
+Per-user daily log of analyzed meals, with the running totals needed to answer
+"what is left of today's budget" without re-reading the day's meals.
+
+Meals are kept in a local SQLite file (MEAL_INTAKE_DB), and days are UTC dates
+like the logged_at timestamps:
+
+- intake_entries: one row per logged meal (calories and macros of the eaten portion);
+- daily_intake: consumed totals per (user_id, day), updated in the same transaction
+  as the entries they add up, so reading a day is one primary-key lookup however
+  many meals it has;
+- intake_targets: each user's daily targets (the nutrition backend's /predict output).
+
+Writes are batched: `record` queues a meal and returns, and a background thread
+inserts the queued meals in one transaction per batch, flushing when
+MEAL_INTAKE_BATCH meals are waiting or the oldest has waited MEAL_INTAKE_DELAY_S.
+Meals still in the queue are added to what `summary` reads, so a meal counts for
+its day as soon as it is recorded. A batch that fails to write because the
+database is unavailable (locked, disk errors) stays queued and is retried, with
+the meals recorded meanwhile, after a growing pause (MEAL_INTAKE_RETRY_S doubling
+up to MEAL_INTAKE_RETRY_MAX_S); its meals keep counting for their days. A batch
+rejected by a constraint or a bad value is written meal by meal instead, and the
+meals that cannot be written are logged and dropped. At most MEAL_INTAKE_MAX_QUEUE
+meals wait in the queue and as many in a retried batch; `record` raises
+LedgerFullError beyond that. Queued meals are lost if the process dies before
+they are written; call `close()` on shutdown to flush what is left.
+Set MEAL_INTAKE_LEDGER=0 to disable.
+"""
+
+import logging
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MEAL_INTAKE_LEDGER = os.getenv('MEAL_INTAKE_LEDGER', '1') == '1'
+MEAL_INTAKE_DB = os.getenv('MEAL_INTAKE_DB', str(Path(__file__).parent.parent / 'intake.db'))
+MEAL_INTAKE_BATCH = int(os.getenv('MEAL_INTAKE_BATCH', '200'))
+MEAL_INTAKE_DELAY_S = float(os.getenv('MEAL_INTAKE_DELAY_S', '0.2'))
+# First wait before retrying a failed write (doubles per failure, up to MEAL_INTAKE_RETRY_MAX_S)
+MEAL_INTAKE_RETRY_S = float(os.getenv('MEAL_INTAKE_RETRY_S', '0.5'))
+MEAL_INTAKE_RETRY_MAX_S = float(os.getenv('MEAL_INTAKE_RETRY_MAX_S', '30'))
+# Meals waiting to be written at most (queue, and again in a batch being retried)
+MEAL_INTAKE_MAX_QUEUE = int(os.getenv('MEAL_INTAKE_MAX_QUEUE', '10000'))
+# Fewer calories than this per remaining meal is not worth planning
+MEAL_INTAKE_MIN_MEAL_KCAL = float(os.getenv('MEAL_INTAKE_MIN_MEAL_KCAL', '100'))
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat')
+KCAL_PER_GRAM = {'protein': 4, 'carbs': 4, 'fat': 9}
+# Ledger nutrient -> key of the nutrition backend's /predict response
+TARGET_KEYS = {
+    'calories': 'daily_kcal_need',
+    'protein': 'protein_g_per_day',
+    'carbs': 'carbs_g_per_day',
+    'fat': 'fat_g_per_day',
+}
+# Ledger macro -> key of generate_meal_plan's target_macro_ratios
+PLAN_MACRO_KEYS = {'fat': 'fat', 'carbs': 'carb', 'protein': 'protein'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intake_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    logged_at TEXT NOT NULL,
+    calories REAL NOT NULL,
+    protein REAL NOT NULL,
+    carbs REAL NOT NULL,
+    fat REAL NOT NULL,
+    mass_g REAL,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_intake_entries_user_day ON intake_entries (user_id, day);
+CREATE TABLE IF NOT EXISTS daily_intake (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    calories REAL NOT NULL,
+    protein REAL NOT NULL,
+    carbs REAL NOT NULL,
+    fat REAL NOT NULL,
+    meals INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS intake_targets (
+    user_id TEXT PRIMARY KEY,
+    daily_kcal_need REAL NOT NULL,
+    protein_g_per_day REAL NOT NULL,
+    carbs_g_per_day REAL NOT NULL,
+    fat_g_per_day REAL NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+_INSERT_ENTRY = """
+INSERT INTO intake_entries (user_id, day, logged_at, calories, protein, carbs, fat, mass_g, description)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_ADD_TO_DAY = """
+INSERT INTO daily_intake (user_id, day, calories, protein, carbs, fat, meals)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, day) DO UPDATE SET
+    calories = calories + excluded.calories,
+    protein = protein + excluded.protein,
+    carbs = carbs + excluded.carbs,
+    fat = fat + excluded.fat,
+    meals = meals + excluded.meals
+"""
+
+# Errors caused by the meals themselves: retrying the same rows cannot succeed
+_ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.DataError, sqlite3.InterfaceError,
+               ValueError, TypeError, OverflowError)
+
+
+class LedgerFullError(RuntimeError):
+    """Raised when too many meals are waiting to be written (database unavailable)."""
+
+
+class NoTargetsError(LookupError):
+    """Raised when a user has no daily targets to plan against."""
+
+
+class BudgetSpentError(ValueError):
+    """Raised when too few calories are left to plan the remaining meals."""
+
+
+def _day(day, now=None):
+    """ISO date string of a date, an ISO string (validated) or None (the UTC date of `now`, default today)."""
+    if day is None:
+        return (now or datetime.now(timezone.utc)).date().isoformat()
+    if isinstance(day, date):
+        return day.isoformat()
+    return date.fromisoformat(day).isoformat()
+
+
+def _add(totals, values, sign=1):
+    """Add (calories, protein, carbs, fat, meals) values into a totals list in place."""
+    for i, value in enumerate(values):
+        totals[i] += sign * value
+
+
+class IntakeLedger:
+    """
+    Daily intake log and running totals in SQLite, written in batches.
+
+    Args:
+        path (str): SQLite database file (created on first use).
+        max_batch (int): Meals per write transaction at most.
+        max_delay_s (float): Longest a recorded meal waits before it is written.
+        max_queue (int): Meals waiting to be written at most, in the queue and in a retried batch each.
+    """
+
+    def __init__(self, path=MEAL_INTAKE_DB, max_batch=MEAL_INTAKE_BATCH, max_delay_s=MEAL_INTAKE_DELAY_S,
+                 max_queue=MEAL_INTAKE_MAX_QUEUE):
+        self.path = str(path)
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self.max_queue = max_queue
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._schema_ready = False
+        self._local = threading.local()
+        self._closed = False
+        self._stopping = threading.Event()
+        # (user_id, day) -> [calories, protein, carbs, fat, meals] queued but not committed yet.
+        # Held while a batch commits, so a read never counts a meal twice or not at all.
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        self.flushes = 0
+        self.meals_written = 0
+        self.failed_flushes = 0
+        self.unsaved = 0   # meals of the batch waiting to be retried
+        self.meals_dropped = 0   # rejected by the database, never written
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    # --- connections ---
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')   # readers do not wait for the batch writer
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with self._start_lock:
+            if not self._schema_ready:
+                connection.executescript(SCHEMA)
+                self._schema_ready = True
+        return connection
+
+    def _connection(self):
+        """This thread's connection (sqlite3 connections are per thread)."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # --- writes ---
+
+    def record(self, user_id, nutrients, mass_g=None, day=None, description=None):
+        """
+        Queue one eaten meal for the user's day.
+
+        Args:
+            user_id (str): User the meal belongs to.
+            nutrients (dict): 'calories', 'protein', 'carbs' and 'fat' of the eaten portion.
+            mass_g (float): Portion mass in grams, if known.
+            day (str | date): Day the meal counts for (default the UTC date it is logged at).
+            description (str): Free text, e.g. the detected ingredients.
+
+        Raises:
+            ValueError: A nutrient is negative or not finite, or mass_g is not positive.
+            LedgerFullError: MEAL_INTAKE_MAX_QUEUE meals are already waiting to be written.
+        """
+        if self._closed:
+            raise RuntimeError("intake ledger is closed")
+        now = datetime.now(timezone.utc)
+        day = _day(day, now)   # same clock as logged_at, so a meal near midnight lands on its own day
+        values = [float(nutrients.get(name) or 0) for name in NUTRIENTS]
+        for name, value in zip(NUTRIENTS, values):
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f"{name} must be a finite, non-negative number, got {value}")
+        if mass_g is not None and not (math.isfinite(mass_g) and mass_g > 0):
+            raise ValueError(f"mass_g must be a finite, positive number, got {mass_g}")
+        values.append(1)
+        entry = (user_id, day, now.isoformat(timespec='seconds'),
+                 *values[:4], mass_g, description)
+        self._ensure_started()
+        with self._lock:
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                raise LedgerFullError(f"{self.max_queue} meals are waiting to be written to the intake ledger")
+            _add(self._pending.setdefault((user_id, day), [0.0, 0.0, 0.0, 0.0, 0]), values)
+
+    def set_targets(self, user_id, targets):
+        """
+        Store a user's daily targets.
+
+        Args:
+            user_id (str): User the targets belong to.
+            targets (dict): daily_kcal_need, protein_g_per_day, carbs_g_per_day and
+                fat_g_per_day, as returned by the nutrition backend's /predict.
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO intake_targets VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, *(float(targets[TARGET_KEYS[name]]) for name in NUTRIENTS),
+                 datetime.now(timezone.utc).isoformat(timespec='seconds')),
+            )
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='intake-ledger', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        retry = []   # entries of a failed flush, written again with the meals recorded since
+        failures = 0
+        stop = False
+        while True:
+            if retry:
+                batch = retry
+                limit = self.max_queue
+                deadline = time.monotonic() + min(MEAL_INTAKE_RETRY_S * 2 ** (failures - 1), MEAL_INTAKE_RETRY_MAX_S)
+            else:
+                first = self._queue.get()
+                if first is None:   # close() sentinel
+                    return
+                batch = [first]
+                limit = self.max_batch
+                deadline = time.monotonic() + self.max_delay_s
+            # while retrying, keep collecting for the whole pause, up to max_queue meals
+            while not stop:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if len(batch) >= limit:
+                    if retry:
+                        self._stopping.wait(remaining)
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+
+            retry = self._flush(batch)
+            failures = failures + 1 if retry else 0
+            self.unsaved = len(retry)
+            if stop or (retry and self._stopping.is_set()):
+                if retry:
+                    logger.error(f"Intake ledger: {len(retry)} meals could not be written before shutdown")
+                return
+
+    def _flush(self, batch):
+        """
+        Write a batch of entries, in one transaction if possible.
+
+        Returns the entries still to write: none on success, or the batch (what is
+        left of it) after an error worth retrying; those stay pending. Entries the
+        database rejects are dropped.
+        """
+        started = time.perf_counter()
+        try:
+            self._write(batch)
+            left = []
+        except _ROW_ERRORS as e:
+            logger.warning(f"Intake ledger: batch of {len(batch)} meals rejected ({e}), writing them one by one")
+            left = self._write_each(batch)
+        except Exception as e:
+            logger.warning(f"Intake ledger: writing {len(batch)} meals failed, will retry: {e}")
+            left = batch
+        if left:
+            self.failed_flushes += 1
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        return left
+
+    def _write(self, entries):
+        """Insert entries and add them to their days' totals in one transaction (rolled back on error)."""
+        by_day = {}
+        for entry in entries:
+            _add(by_day.setdefault(entry[:2], [0.0, 0.0, 0.0, 0.0, 0]), (*entry[3:7], 1))
+
+        connection = self._connection()
+        try:
+            connection.executemany(_INSERT_ENTRY, entries)
+            connection.executemany(_ADD_TO_DAY, [(*key, *totals) for key, totals in by_day.items()])
+            with self._lock:
+                connection.commit()
+                self._settle(by_day)
+        except Exception:
+            connection.rollback()
+            raise
+        self.meals_written += len(entries)
+
+    def _write_each(self, batch):
+        """Write entries one per transaction, dropping rejected ones; returns the rest after a retryable error."""
+        for i, entry in enumerate(batch):
+            try:
+                self._write([entry])
+            except _ROW_ERRORS as e:
+                logger.error(f"Intake ledger: dropping meal the database rejects ({e}): {entry}")
+                with self._lock:
+                    self._settle({entry[:2]: (*entry[3:7], 1)})
+                self.meals_dropped += 1
+            except Exception as e:
+                logger.warning(f"Intake ledger: writing meals failed, will retry {len(batch) - i}: {e}")
+                return batch[i:]
+        return []
+
+    def _settle(self, by_day):
+        """Take a flushed batch out of the pending totals (caller holds self._lock)."""
+        for key, totals in by_day.items():
+            pending = self._pending[key]
+            _add(pending, totals, sign=-1)
+            if pending[4] == 0:
+                del self._pending[key]
+
+    def close(self):
+        """Flush queued meals and stop the writer thread (giving up on a batch that still fails)."""
+        self._closed = True
+        self._stopping.set()
+        while self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.5)   # the queue may be full while the writer retries
+                break
+            except queue.Full:
+                continue
+        if self._thread is not None:
+            self._thread.join()
+
+    # --- reads ---
+
+    def targets(self, user_id):
+        """The user's daily targets (keys as in /predict), or None."""
+        row = self._connection().execute(
+            "SELECT daily_kcal_need, protein_g_per_day, carbs_g_per_day, fat_g_per_day "
+            "FROM intake_targets WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {TARGET_KEYS[name]: value for name, value in zip(NUTRIENTS, row)}
+
+    def summary(self, user_id, day=None):
+        """
+        Consumed, target and remaining calories and macros of one user's day.
+
+        Args:
+            user_id (str): User to read.
+            day (str | date): Day to read (default today, UTC).
+
+        Returns:
+            dict: user_id, day, meals (number logged), consumed, targets and remaining;
+                targets and remaining are None until the user's targets are set, and
+                remaining goes negative once a target is exceeded.
+        """
+        day = _day(day)
+        connection = self._connection()
+        with self._lock:
+            row = connection.execute(
+                "SELECT calories, protein, carbs, fat, meals FROM daily_intake WHERE user_id = ? AND day = ?",
+                (user_id, day),
+            ).fetchone()
+            totals = list(row) if row is not None else [0.0, 0.0, 0.0, 0.0, 0]
+            pending = self._pending.get((user_id, day))
+            if pending is not None:
+                _add(totals, pending)
+
+        consumed = {name: round(value, 1) for name, value in zip(NUTRIENTS, totals)}
+        targets = self.targets(user_id)
+        remaining = None
+        if targets is not None:
+            remaining = {name: round(targets[TARGET_KEYS[name]] - consumed[name], 1) for name in NUTRIENTS}
+        return {
+            'user_id': user_id,
+            'day': day,
+            'meals': int(totals[4]),
+            'consumed': consumed,
+            'targets': targets,
+            'remaining': remaining,
+        }
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'flushes': self.flushes,
+            'meals_written': self.meals_written,
+            'unsaved': self.unsaved,
+            'meals_dropped': self.meals_dropped,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }
+
+
+def plan_for_rest_of_day(summary, meals_per_day, meals_remaining=None):
+    """
+    generate_meal_plan targets that spend what is left of a day on its remaining meals.
+
+    The calories left become total_calories, the macros left (over-eaten ones count
+    as zero) become target_macro_ratios, and the remaining meals keep their share of
+    the default calorie split for meals_per_day (e.g. lunch and dinner of 3 meals
+    get 0.40 and 0.35, rescaled to sum to 1).
+
+    Args:
+        summary (dict): IntakeLedger.summary() of the day.
+        meals_per_day (int): Meals the whole day is planned around.
+        meals_remaining (int): Meals left to plan (default meals_per_day minus the
+            meals logged, at least 1).
+
+    Returns:
+        dict: total_calories, meals_per_day (the remaining meals),
+            calorie_distribution_ratios, target_macro_ratios (None: planner defaults)
+            and first_meal (index of the first remaining meal in the day).
+
+    Raises:
+        NoTargetsError: The user has no daily targets.
+        BudgetSpentError: Less than MEAL_INTAKE_MIN_MEAL_KCAL is left per remaining meal.
+        ValueError: meals_remaining is not between 1 and meals_per_day.
+    """
+    from services.meal_plan_predictor import default_calorie_ratios
+
+    remaining = summary['remaining']
+    if remaining is None:
+        raise NoTargetsError(f"No daily targets for user {summary['user_id']}")
+    if meals_remaining is None:
+        meals_remaining = max(meals_per_day - summary['meals'], 1)
+    if not 1 <= meals_remaining <= meals_per_day:
+        raise ValueError(f"meals_remaining must be between 1 and meals_per_day ({meals_per_day})")
+    if remaining['calories'] < MEAL_INTAKE_MIN_MEAL_KCAL * meals_remaining:
+        raise BudgetSpentError(
+            f"Only {max(remaining['calories'], 0):.0f} kcal left for {meals_remaining} meal(s) on {summary['day']}"
+        )
+
+    first_meal = meals_per_day - meals_remaining
+    calorie_ratios = default_calorie_ratios(meals_per_day)[first_meal:]
+    calorie_ratios = [r / sum(calorie_ratios) for r in calorie_ratios]
+
+    macro_kcal = {macro: max(remaining[macro], 0) * KCAL_PER_GRAM[macro] for macro in PLAN_MACRO_KEYS}
+    total = sum(macro_kcal.values())
+    macro_ratios = None
+    if total > 0:
+        macro_ratios = {PLAN_MACRO_KEYS[macro]: round(kcal / total, 4) for macro, kcal in macro_kcal.items()}
+
+    return {
+        'total_calories': remaining['calories'],
+        'meals_per_day': meals_remaining,
+        'calorie_distribution_ratios': calorie_ratios,
+        'target_macro_ratios': macro_ratios,
+        'first_meal': first_meal,
+    }
+
+
+intake_ledger = IntakeLedger() if MEAL_INTAKE_LEDGER else None
@@ -5,36 +5,127 @@ This module handles the generation of personalized meal plans based on
 daily calorie goals and meal frequency preferences.
 """
 
+import base64
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import logging
 
+from services.dish_filters import build_filter_index
+from services.dish_neighbours import build_neighbour_index
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
-def data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios):
+# Dish catalog location (override with MEAL_DATASET_DIR, e.g. for a generated catalog)
+DATASET_DIR = Path(os.getenv('MEAL_DATASET_DIR', Path(__file__).parent.parent / 'dataset'))
+CATALOG_FILES = ['dish_images.pkl', 'dishes.xlsx', 'dish_ingredients.xlsx', 'ingredients.xlsx']
+# How often (seconds) get_catalog() checks the dataset files for changes
+CATALOG_CHECK_INTERVAL_S = float(os.getenv('CATALOG_CHECK_INTERVAL_S', '5'))
+# Nearest dishes precomputed per dish for /api/meal-alternatives
+MEAL_NEIGHBOURS_K = int(os.getenv('MEAL_NEIGHBOURS_K', '32'))
+
+DEFAULT_MACRO_RATIOS = {'fat': 0.30, 'carb': 0.45, 'protein': 0.25}
+# Share of the day's calories per meal, by meals per day (other counts split evenly)
+DEFAULT_CALORIE_RATIOS = {
+    2: [0.40, 0.60],              # Breakfast and Dinner - more calories for dinner
+    3: [0.25, 0.40, 0.35],        # Breakfast, Lunch, Dinner
+    4: [0.20, 0.15, 0.35, 0.30],  # Breakfast, Mid-Morning, Lunch, Dinner
+}
+
+
+class NotEnoughDishesError(ValueError):
+    """Raised when the dietary filters leave fewer dishes than meals to plan."""
+
+
+class DishCatalog:
+    """
+    Dish data loaded once from the dataset directory and shared by every plan request.
+
+    Attributes:
+        version (int): Increments on every (re)load; caches keyed on the catalog use it.
+        available_dishes (pd.DataFrame): Dishes with calories > 0 plus macro percentage columns.
+        dish_ingredients (pd.DataFrame): dish_id -> ingredient rows.
+        ingredients (pd.DataFrame): Ingredient metadata.
+        ingredients_by_dish (dict): dish_id -> list of ingredient names.
+        filters (DishFilterIndex): Ingredient/tag bitsets over available_dishes' rows.
+        neighbours (DishNeighbourIndex): Nearest dishes of every dish in nutrition space.
+        position (dict): dish_id -> row of available_dishes.
+        signature (tuple): (file, size, mtime) of the source files, to detect changes.
+    """
+
+    def __init__(self, version, available_dishes, dish_ingredients, ingredients, signature):
+        self.version = version
+        self.available_dishes = available_dishes
+        self.dish_ingredients = dish_ingredients
+        self.ingredients = ingredients
+        self.ingredients_by_dish = dish_ingredients.groupby('dish_id')['ingr_name'].apply(list).to_dict()
+        self.filters = build_filter_index(available_dishes, dish_ingredients)
+        self.neighbours = build_neighbour_index(available_dishes, MEAL_NEIGHBOURS_K)
+        self.position = {dish: i for i, dish in enumerate(available_dishes['dish'])}
+        self.signature = signature
+
+
+_catalog = None
+_catalog_checked_at = 0.0
+_catalog_lock = threading.Lock()
+_catalog_listeners = []
+
+
+def _catalog_signature(save_path):
+    signature = []
+    for name in CATALOG_FILES:
+        st = (save_path / name).stat()
+        signature.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+def load_catalog(save_path=None, version=1):
+    """
+    Read the dish dataset and precompute the per-dish macro percentages.
+
+    Args:
+        save_path (Path): Dataset directory. Defaults to DATASET_DIR.
+        version (int): Version number to stamp on the catalog.
+
+    Returns:
+        DishCatalog: The loaded catalog.
+    """
+    save_path = Path(save_path or DATASET_DIR)
 
-    # Use relative path from project root
-    base_path = Path(__file__).parent.parent
-    save_path = base_path / 'dataset'
-    
     # Verify dataset directory exists
     if not save_path.exists():
         raise FileNotFoundError(f"Dataset directory not found at: {save_path}")
-    
+
+    signature = _catalog_signature(save_path)
     image_df = pd.read_pickle(save_path / 'dish_images.pkl')
     dishes = pd.read_excel(save_path / 'dishes.xlsx')
     dish_ingredients = pd.read_excel(save_path / 'dish_ingredients.xlsx')
     ingredients = pd.read_excel(save_path / 'ingredients.xlsx')
+    return build_catalog(image_df, dishes, dish_ingredients, ingredients, version, signature)
+
 
+def build_catalog(image_df, dishes, dish_ingredients, ingredients, version=1, signature=None):
+    """
+    Build a catalog from the dataset tables (as read by load_catalog, or generated in memory).
+
+    Args:
+        image_df (pd.DataFrame): dish_images.pkl: 'dish' and 'rgb_image'.
+        dishes (pd.DataFrame): dishes.xlsx: 'dish_id' and the total_* columns.
+        dish_ingredients (pd.DataFrame): dish_ingredients.xlsx.
+        ingredients (pd.DataFrame): ingredients.xlsx.
+        version (int): Version number to stamp on the catalog.
+        signature (tuple): Source file signature, None for tables that do not come from DATASET_DIR.
+
+    Returns:
+        DishCatalog: The catalog.
+    """
     image_df = pd.merge(image_df, dishes, left_on='dish', right_on='dish_id', how='left').drop('dish_id', axis=1)
 
-    # Calculate meal calorie targets based on distribution ratios
-    meal_calorie_targets = []
-    for ratio in calorie_distribution_ratios:
-        meal_calories = ratio * daily_calorie_target
-        meal_calorie_targets.append(meal_calories)
     image_df['calories_from_fat'] = image_df['total_fat'] * 9
     image_df['calories_from_carb'] = image_df['total_carb'] * 4
     image_df['calories_from_protein'] = image_df['total_protein'] * 4
@@ -47,8 +138,94 @@ def data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratio
     # Replace any inf values (if total_calories was zero and macro calories were non-zero) with 0
     image_df.replace([float('inf'), -float('inf')], 0, inplace=True)
 
-    available_dishes = image_df[image_df['total_calories'] > 0].copy()
-    return {'available_dishes': available_dishes, 'dish_ingredients': dish_ingredients, 'ingredients': ingredients, 'meal_calorie_targets': meal_calorie_targets}
+    available_dishes = image_df[image_df['total_calories'] > 0].reset_index(drop=True)
+    return DishCatalog(version, available_dishes, dish_ingredients, ingredients, signature)
+
+
+def on_catalog_reload(callback):
+    """Register callback(catalog) to run after every catalog (re)load, e.g. to clear caches."""
+    _catalog_listeners.append(callback)
+
+
+def reload_catalog():
+    """Force a reload of the dish catalog from disk and notify listeners."""
+    global _catalog, _catalog_checked_at
+    with _catalog_lock:
+        version = _catalog.version + 1 if _catalog is not None else 1
+        _catalog = load_catalog(version=version)
+        _catalog_checked_at = time.monotonic()
+        catalog = _catalog
+    logger.info(f"Dish catalog v{catalog.version} loaded: {len(catalog.available_dishes)} dishes")
+    for callback in _catalog_listeners:
+        callback(catalog)
+    return catalog
+
+
+def use_catalog(catalog):
+    """
+    Serve an already-built catalog (e.g. build_catalog() over generated tables) and notify listeners.
+
+    It is stamped with the next version number. A catalog built without a file
+    signature is not checked against DATASET_DIR: it is served until the next
+    reload_catalog().
+    """
+    global _catalog, _catalog_checked_at
+    with _catalog_lock:
+        catalog.version = _catalog.version + 1 if _catalog is not None else 1
+        _catalog = catalog
+        _catalog_checked_at = time.monotonic()
+    logger.info(f"Dish catalog v{catalog.version} installed: {len(catalog.available_dishes)} dishes")
+    for callback in _catalog_listeners:
+        callback(catalog)
+    return catalog
+
+
+def get_catalog():
+    """
+    Return the shared dish catalog, loading it on first use.
+
+    Every CATALOG_CHECK_INTERVAL_S the dataset files are stat'ed and the catalog is
+    reloaded if any of them changed (not for catalogs installed by use_catalog()
+    without a signature).
+    """
+    global _catalog_checked_at
+    catalog = _catalog
+    if catalog is None:
+        return reload_catalog()
+    now = time.monotonic()
+    if catalog.signature is not None and now - _catalog_checked_at >= CATALOG_CHECK_INTERVAL_S:
+        _catalog_checked_at = now
+        try:
+            changed = _catalog_signature(DATASET_DIR) != catalog.signature
+        except FileNotFoundError:
+            changed = False   # keep serving the loaded catalog while files are being replaced
+        if changed:
+            return reload_catalog()
+    return catalog
+
+
+def data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios, dietary_filters=None):
+    catalog = get_catalog()
+
+    # Calculate meal calorie targets based on distribution ratios
+    meal_calorie_targets = []
+    for ratio in calorie_distribution_ratios:
+        meal_calories = ratio * daily_calorie_target
+        meal_calorie_targets.append(meal_calories)
+
+    # select_dish_for_meal writes scoring columns, so every plan gets its own copy
+    mask = catalog.filters.mask(**dietary_filters) if dietary_filters else None
+    if mask is None:
+        available_dishes = catalog.available_dishes.copy()
+    else:
+        available_dishes = catalog.available_dishes[catalog.filters.to_bool(mask)].copy()
+        if len(available_dishes) < num_meals:
+            raise NotEnoughDishesError(
+                f"Only {len(available_dishes)} dishes match the dietary filters, {num_meals} meals requested"
+            )
+    return {'available_dishes': available_dishes, 'dish_ingredients': catalog.dish_ingredients,
+            'ingredients': catalog.ingredients, 'ingredients_by_dish': catalog.ingredients_by_dish,
+            'meal_calorie_targets': meal_calorie_targets}
 
 def select_dish_for_meal(target_calories, available_dishes, target_macro_profile):
     """
@@ -91,25 +268,25 @@ def select_dish_for_meal(target_calories, available_dishes, target_macro_profile
     return selected_dish_row, selected_dish_id
 
 
-def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distribution_ratios=None, target_macro_ratios=None) -> list:
+def default_calorie_ratios(num_meals):
+    """Default calorie_distribution_ratios for a number of meals."""
+    return list(DEFAULT_CALORIE_RATIOS.get(num_meals, [1.0 / num_meals] * num_meals))
+
+
+def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distribution_ratios=None, target_macro_ratios=None,
+                       dietary_filters=None) -> list:
+    """
+    Plan one dish per meal. `dietary_filters` optionally restricts the dishes, as
+    {'include_ingredients': [...], 'exclude_ingredients': [...], 'tags': [...]}
+    (see services/dish_filters.py).
+    """
     daily_calorie_target = total_calories
     num_meals = meals_per_day
     
     # Use provided ratios or calculate defaults based on number of meals
     if calorie_distribution_ratios is None:
         # Calculate calorie distribution ratios based on number of meals
-        if num_meals == 2:
-            # Breakfast and Dinner - more calories for dinner
-            calorie_distribution_ratios = [0.40, 0.60]
-        elif num_meals == 3:
-            # Breakfast, Lunch, Dinner
-            calorie_distribution_ratios = [0.25, 0.40, 0.35]
-        elif num_meals == 4:
-            # Breakfast, Mid-Morning, Lunch, Dinner
-            calorie_distribution_ratios = [0.20, 0.15, 0.35, 0.30]
-        else:
-            # Default: equal distribution
-            calorie_distribution_ratios = [1.0 / num_meals] * num_meals
+        calorie_distribution_ratios = default_calorie_ratios(num_meals)
         
         # Ensure ratios sum to exactly 1.0 to prevent exceeding target
         ratio_sum = sum(calorie_distribution_ratios)
@@ -119,21 +296,14 @@ def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distri
         # Ensure provided ratios match number of meals
         if len(calorie_distribution_ratios) != num_meals:
             # If mismatch, use default for that number of meals
-            if num_meals == 2:
-                calorie_distribution_ratios = [0.40, 0.60]
-            elif num_meals == 3:
-                calorie_distribution_ratios = [0.25, 0.40, 0.35]
-            elif num_meals == 4:
-                calorie_distribution_ratios = [0.20, 0.15, 0.35, 0.30]
-            else:
-                calorie_distribution_ratios = [1.0 / num_meals] * num_meals
+            calorie_distribution_ratios = default_calorie_ratios(num_meals)
     
     # Use provided macro ratios or defaults
     if target_macro_ratios is None:
-        target_macro_ratios = {'fat': 0.30, 'carb': 0.45, 'protein': 0.25}
-    data = data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios)
+        target_macro_ratios = DEFAULT_MACRO_RATIOS
+    data = data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios, dietary_filters)
     available_dishes = data['available_dishes']
-    dish_ingredients = data['dish_ingredients']
+    ingredients_by_dish = data['ingredients_by_dish']
     ingredients = data['ingredients']
     meal_calorie_targets = data['meal_calorie_targets']
     
@@ -180,8 +350,8 @@ def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distri
     for meal in meal_plan:
         dish_id = meal['dish']
 
-        # Filter dish_ingredients for the current dish_id
-        ingredients_for_dish = dish_ingredients[dish_ingredients['dish_id'] == dish_id]['ingr_name'].tolist()
+        # Ingredient names for the current dish_id (grouped once at catalog load)
+        ingredients_for_dish = list(ingredients_by_dish.get(dish_id, []))
 
         # Add the list of ingredients to the meal dictionary
         meal['ingredients_list'] = ingredients_for_dish
@@ -216,3 +386,155 @@ def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distri
     print(f"  Protein: Target {target_macro_ratios['protein']*100:.1f}% | Actual {actual_protein_pc:.1f}% ({total_plan_protein:.1f}g)")
 
     return full_meal_plan_details
+
+
+def meal_alternatives(dish_id, target_calories=None, target_macro_ratios=None, exclude_dishes=None, k=5,
+                      dietary_filters=None) -> list:
+    """
+    Substitutes for one dish of a plan, from the dish's precomputed neighbour list.
+
+    The result is always the k best allowed dishes of the whole catalog for the meal
+    target. The neighbour list is enough when the target is close to the dish (see
+    DishNeighbourIndex.covers); otherwise the dishes within the k-th best score's
+    calorie distance of the target are scored, and when the exclusions and filters
+    leave fewer than k neighbours, the whole catalog.
+
+    Args:
+        dish_id (str): The rejected dish.
+        target_calories (float): The meal's calorie target. Defaults to the dish's calories.
+        target_macro_ratios (dict): Target ratios for 'fat', 'carb', 'protein'. Defaults as in generate_meal_plan.
+        exclude_dishes (list): Dish IDs that must not be suggested (the rest of the plan).
+        k (int): Number of alternatives.
+        dietary_filters (dict): Same filters as generate_meal_plan.
+
+    Returns:
+        list: Up to k meal dicts (generate_meal_plan's format), best match first.
+
+    Raises:
+        KeyError: If dish_id is not in the catalog.
+    """
+    catalog = get_catalog()
+    row = catalog.position.get(dish_id)
+    if row is None:
+        raise KeyError(dish_id)
+    index = catalog.neighbours
+    if target_calories is None:
+        target_calories = float(index.features[row, 0])
+    if target_macro_ratios is None:
+        target_macro_ratios = DEFAULT_MACRO_RATIOS
+
+    excluded = {row} | {catalog.position[d] for d in exclude_dishes or [] if d in catalog.position}
+    mask = catalog.filters.mask(**dietary_filters) if dietary_filters else None
+
+    def allowed(rows):
+        rows = rows[~np.isin(rows, list(excluded))]
+        if mask is not None:
+            rows = rows[catalog.filters.contains(mask, rows)]
+        return rows
+
+    # sorted, so ties break on catalog order exactly as in a whole-catalog rerank
+    best = index.rerank(np.sort(allowed(index.neighbours[row])), target_calories, target_macro_ratios, k)
+    if len(best) < k:
+        # too few neighbours survive the exclusions/filters: score the whole catalog
+        best = index.rerank(allowed(np.arange(len(catalog.available_dishes))),
+                            target_calories, target_macro_ratios, k)
+    else:
+        worst = index.scores(best[-1:], target_calories, target_macro_ratios)[0]
+        if not index.covers(row, target_calories, target_macro_ratios, worst):
+            # a dish outside the list could score better; any such dish is within `worst` kcal of the target
+            best = index.rerank(allowed(index.calorie_window(target_calories, worst)),
+                                target_calories, target_macro_ratios, k)
+
+    alternatives = []
+    for meal in catalog.available_dishes.iloc[best].to_dict('records'):
+        meal['ingredients_list'] = list(catalog.ingredients_by_dish.get(meal['dish'], []))
+        alternatives.append(meal)
+    return alternatives
+
+
+# Meal templates for meal names and times
+MEAL_TEMPLATES = {
+    2: [
+        {"meal_name": "Breakfast", "time": "09:00 AM"},
+        {"meal_name": "Dinner", "time": "07:00 PM"}
+    ],
+    3: [
+        {"meal_name": "Breakfast", "time": "08:00 AM"},
+        {"meal_name": "Lunch", "time": "12:30 PM"},
+        {"meal_name": "Dinner", "time": "07:00 PM"}
+    ],
+    4: [
+        {"meal_name": "Breakfast", "time": "08:00 AM"},
+        {"meal_name": "Mid-Morning Snack", "time": "11:00 AM"},
+        {"meal_name": "Lunch", "time": "01:00 PM"},
+        {"meal_name": "Dinner", "time": "07:00 PM"}
+    ]
+}
+
+
+def format_meal_suggestions(meal_plan_data: list, meals_per_day: int, meal_index: int = None, first_meal: int = 0) -> list:
+    """
+    Format generate_meal_plan output for the frontend (MealSuggestion dicts).
+
+    Shared by /api/suggest-meals and the nutrition backend's profile-to-plan pipeline.
+    With meal_index, every entry is labelled as that meal of the day (alternatives
+    for one slot). With first_meal, the plan covers the day from that meal on
+    (the rest of a partly eaten day).
+    """
+    # Get meal names and times
+    meal_info = MEAL_TEMPLATES.get(meals_per_day, MEAL_TEMPLATES[2])
+
+    suggestions = []
+    for i, meal_detail in enumerate(meal_plan_data):
+        # Convert RGB image bytes to base64
+        rgb_bytes = meal_detail.get('rgb_image', b'')
+        if rgb_bytes:
+            image_base64 = base64.b64encode(rgb_bytes).decode('utf-8')
+            image_data_url = f"data:image/jpeg;base64,{image_base64}"
+        else:
+            image_data_url = ""
+
+        # Get meal name and time
+        slot = i + first_meal if meal_index is None else meal_index
+        meal_template = meal_info[slot] if slot < len(meal_info) else {"meal_name": f"Meal {slot+1}", "time": "12:00 PM"}
+
+        # Format ingredients list
+        ingredients_list = meal_detail.get('ingredients_list', [])
+
+        # Format nutrients
+        nutrients = [
+            {
+                "name": "Fat",
+                "amount": round(meal_detail.get('total_fat', 0), 2),
+                "unit": "g"
+            },
+            {
+                "name": "Carbohydrates",
+                "amount": round(meal_detail.get('total_carb', 0), 2),
+                "unit": "g"
+            },
+            {
+                "name": "Protein",
+                "amount": round(meal_detail.get('total_protein', 0), 2),
+                "unit": "g"
+            }
+        ]
+
+        # Create description from dish name and ingredients
+        dish_name = meal_detail.get('dish', 'Meal')
+        ingredients_str = ', '.join(ingredients_list[:5])  # First 5 ingredients
+        description = f"Ingredients {ingredients_str}" if ingredients_str else dish_name
+
+        suggestions.append({
+            "meal_name": meal_template["meal_name"],
+            "calories": round(meal_detail.get('total_calories', 0), 1),
+            "time": meal_template["time"],
+            "description": description,
+            "image": image_data_url,
+            "ingredients": ingredients_list,
+            "nutrients": nutrients,
+            "mass": round(meal_detail.get('total_mass', 0), 1),
+            "dish_id": meal_detail.get('dish')
+        })
+
+    return suggestions
@@ -0,0 +1,233 @@
+"""
+Meal Plan Cache
+
+generate_meal_plan is deterministic for a given catalog and
+(total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios),
+and most users land in a few hundred combinations of those. This module memoizes
+plans on quantized targets: calories are bucketed (MEAL_PLAN_CACHE_KCAL_BUCKET,
+default 25 kcal) and ratios rounded (MEAL_PLAN_CACHE_RATIO_DIGITS, default 2), and
+the plan is computed for the bucket's canonical targets so every request in a
+bucket gets the same plan. Dietary filters (services/dish_filters.py) are part of
+the key, with their ingredient names and tags normalized and sorted.
+
+The cache is a bounded LRU (MEAL_PLAN_CACHE_SIZE), cleared whenever the dish
+catalog reloads, and can be pre-warmed at startup from the keys that were hit
+most often in the previous run (MEAL_PLAN_CACHE_PREWARM_FILE) or, failing that,
+a default calorie range. Set MEAL_PLAN_CACHE=0 to disable.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from services.dish_filters import normalize
+from services.meal_plan_predictor import generate_meal_plan, get_catalog, on_catalog_reload
+
+MEAL_PLAN_CACHE = os.getenv('MEAL_PLAN_CACHE', '1') == '1'
+MEAL_PLAN_CACHE_SIZE = int(os.getenv('MEAL_PLAN_CACHE_SIZE', '2048'))
+MEAL_PLAN_CACHE_KCAL_BUCKET = float(os.getenv('MEAL_PLAN_CACHE_KCAL_BUCKET', '25'))
+MEAL_PLAN_CACHE_RATIO_DIGITS = int(os.getenv('MEAL_PLAN_CACHE_RATIO_DIGITS', '2'))
+MEAL_PLAN_CACHE_PREWARM_FILE = os.getenv('MEAL_PLAN_CACHE_PREWARM_FILE', 'plan_cache_keys.json')
+MEAL_PLAN_CACHE_PREWARM_TOP = int(os.getenv('MEAL_PLAN_CACHE_PREWARM_TOP', '200'))
+# Fallback pre-warm when there is no key file: "min:max" kcal for 2-4 meals with default ratios
+MEAL_PLAN_CACHE_PREWARM_KCAL = os.getenv('MEAL_PLAN_CACHE_PREWARM_KCAL', '1500:2600')
+
+
+class PlanCache:
+    """
+    Bounded LRU of meal plans keyed on quantized plan targets.
+
+    Args:
+        max_size (int): Maximum number of cached plans.
+        kcal_bucket (float): Calorie bucket width; totals are rounded to a multiple of it.
+        ratio_digits (int): Decimal places ratios are rounded to.
+        compute (callable): Plan function with generate_meal_plan's signature.
+    """
+
+    def __init__(self, max_size=2048, kcal_bucket=25.0, ratio_digits=2, compute=generate_meal_plan):
+        self.max_size = max_size
+        self.kcal_bucket = kcal_bucket
+        self.ratio_digits = ratio_digits
+        self.compute = compute
+
+        self._plans = OrderedDict()   # key -> (plan, compute_s)
+        self._lock = threading.Lock()
+        self.catalog_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.time_saved_s = 0.0
+        self._key_hits = {}   # lookups per cached key; evicted with the key, so bounded like the LRU
+
+    def canonicalize(self, total_calories, meals_per_day, calorie_distribution_ratios=None, target_macro_ratios=None,
+                     dietary_filters=None):
+        """Quantized (total_calories, meals_per_day, calorie ratios, macro ratios, filters) for a request."""
+        total = round(total_calories / self.kcal_bucket) * self.kcal_bucket
+        calorie_ratios = None
+        if calorie_distribution_ratios is not None:
+            calorie_ratios = tuple(round(r, self.ratio_digits) for r in calorie_distribution_ratios)
+        macro_ratios = None
+        if target_macro_ratios is not None:
+            macro_ratios = tuple(sorted((k, round(v, self.ratio_digits)) for k, v in target_macro_ratios.items()))
+        filters = None
+        if dietary_filters:
+            filters = tuple(sorted(
+                (name, tuple(sorted(normalize(v) for v in values)))
+                for name, values in dietary_filters.items() if values
+            )) or None
+        return (float(total), int(meals_per_day), calorie_ratios, macro_ratios, filters)
+
+    def get_plan(self, total_calories, meals_per_day, calorie_distribution_ratios=None, target_macro_ratios=None,
+                 dietary_filters=None):
+        """
+        Return the (cached) plan for the request's bucket.
+
+        Returns:
+            list: generate_meal_plan output for the canonical targets. Meal dicts are
+                  copied, so callers may modify them.
+        """
+        key = self.canonicalize(total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios,
+                                dietary_filters)
+        self._check_catalog()
+
+        with self._lock:
+            entry = self._plans.get(key)
+            if entry is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                self.time_saved_s += entry[1]
+                self._key_hits[key] = self._key_hits.get(key, 0) + 1
+                return [dict(meal) for meal in entry[0]]
+
+        plan, compute_s = self._compute(key)
+        with self._lock:
+            self.misses += 1
+            self._key_hits[key] = self._key_hits.get(key, 0) + 1
+            self._store(key, plan, compute_s)
+        return [dict(meal) for meal in plan]
+
+    def _compute(self, key):
+        total, meals, calorie_ratios, macro_ratios, filters = key
+        t0 = time.perf_counter()
+        plan = self.compute(
+            total, meals,
+            list(calorie_ratios) if calorie_ratios is not None else None,
+            dict(macro_ratios) if macro_ratios is not None else None,
+            {name: list(values) for name, values in filters} if filters is not None else None,
+        )
+        return plan, time.perf_counter() - t0
+
+    def _store(self, key, plan, compute_s):
+        self._plans[key] = (plan, compute_s)
+        self._plans.move_to_end(key)
+        while len(self._plans) > self.max_size:
+            evicted, _ = self._plans.popitem(last=False)
+            self._key_hits.pop(evicted, None)
+            self.evictions += 1
+
+    def _check_catalog(self):
+        version = get_catalog().version   # also picks up changed dataset files
+        if version != self.catalog_version:
+            self.invalidate(version)
+
+    def invalidate(self, catalog_version=None):
+        """Drop every cached plan (called when the dish catalog reloads)."""
+        with self._lock:
+            if self._plans:
+                self.invalidations += 1
+            self._plans.clear()
+            self._key_hits.clear()
+            self.catalog_version = catalog_version
+
+    def warm(self, keys):
+        """Compute and store plans for canonical keys that are not cached yet."""
+        self._check_catalog()
+        warmed = 0
+        for key in keys:
+            with self._lock:
+                if key in self._plans:
+                    continue
+            plan, compute_s = self._compute(key)
+            with self._lock:
+                self._store(key, plan, compute_s)
+            warmed += 1
+        return warmed
+
+    def top_keys(self, n):
+        """The n most-requested keys among the cached ones."""
+        with self._lock:
+            return sorted(self._key_hits, key=self._key_hits.get, reverse=True)[:n]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._plans),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "time_saved_ms": round(self.time_saved_s * 1000, 1),
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "catalog_version": self.catalog_version,
+                "kcal_bucket": self.kcal_bucket,
+                "ratio_digits": self.ratio_digits,
+            }
+
+
+def _key_to_json(key):
+    total, meals, calorie_ratios, macro_ratios, filters = key
+    return [total, meals, list(calorie_ratios) if calorie_ratios else None,
+            [list(kv) for kv in macro_ratios] if macro_ratios else None,
+            [[name, list(values)] for name, values in filters] if filters else None]
+
+
+def _key_from_json(item):
+    total, meals, calorie_ratios, macro_ratios, filters = (list(item) + [None])[:5]
+    return (float(total), int(meals), tuple(calorie_ratios) if calorie_ratios else None,
+            tuple(tuple(kv) for kv in macro_ratios) if macro_ratios else None,
+            tuple((name, tuple(values)) for name, values in filters) if filters else None)
+
+
+def save_hot_keys(cache, path=MEAL_PLAN_CACHE_PREWARM_FILE, top=MEAL_PLAN_CACHE_PREWARM_TOP):
+    """Write the most-requested keys so the next start can pre-warm them."""
+    keys = cache.top_keys(top)
+    if not keys:
+        return
+    with open(path, 'w') as f:
+        json.dump([_key_to_json(k) for k in keys], f)
+
+
+def prewarm_keys(cache, path=MEAL_PLAN_CACHE_PREWARM_FILE, kcal_range=MEAL_PLAN_CACHE_PREWARM_KCAL):
+    """Keys to warm: the saved hot keys if present, else every bucket of kcal_range for 2-4 meals."""
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return [_key_from_json(item) for item in json.load(f)]
+    low, high = (float(v) for v in kcal_range.split(':'))
+    keys = []
+    total = low
+    while total <= high:
+        for meals in (3, 2, 4):
+            keys.append(cache.canonicalize(total, meals))
+        total += cache.kcal_bucket
+    return keys
+
+
+plan_cache = None
+if MEAL_PLAN_CACHE:
+    plan_cache = PlanCache(MEAL_PLAN_CACHE_SIZE, MEAL_PLAN_CACHE_KCAL_BUCKET, MEAL_PLAN_CACHE_RATIO_DIGITS)
+    on_catalog_reload(lambda catalog: plan_cache.invalidate(catalog.version))
+
+
+def get_meal_plan(total_calories, meals_per_day, calorie_distribution_ratios=None, target_macro_ratios=None,
+                  dietary_filters=None):
+    """generate_meal_plan through the shared plan cache (straight through when disabled)."""
+    if plan_cache is None:
+        return generate_meal_plan(total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios,
+                                  dietary_filters)
+    return plan_cache.get_plan(total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios,
+                               dietary_filters)
@@ -0,0 +1,246 @@
+"""
+Request Profiler
+
+Opt-in profiles of single requests, for finding out where the time of one slow
+/api/analyze-meal or /api/suggest-meals call went.
+
+Nothing is installed unless MEAL_PROFILING=1, so requests pay nothing when it is
+off. When it is on, a request to one of MEAL_PROFILE_PATHS is profiled if
+
+- it carries the header X-Profile-Token: <MEAL_PROFILE_TOKEN>, or
+- it is drawn by MEAL_PROFILE_SAMPLE_RATE (e.g. 0.01 profiles 1% of requests).
+
+While the request runs, a background thread samples the Python stacks every
+MEAL_PROFILE_INTERVAL_MS and counts them per distinct stack: a statistical
+profile with a fixed, small cost per sample, unlike a tracing profiler that
+hooks every call. Threads that are only waiting (the idle event loop, idle
+worker threads) are left out. Every busy thread of the process is sampled, so
+requests running at the same time appear as well, under their own thread names.
+If TensorFlow is importable the request also runs under tf.profiler, which
+records op-level timings (one request at a time, since that profiler is
+process-wide).
+
+Each capture is a directory in MEAL_PROFILE_DIR:
+
+- stacks.txt: collapsed stacks ("thread;outer;...;inner count"), the input of
+  flamegraph.pl, inferno and speedscope;
+- meta.json: request, status, duration and sample counts;
+- tensorflow/: tf.profiler trace (open with tensorboard --logdir).
+
+Only the newest MEAL_PROFILE_KEEP captures are kept. The response of a profiled
+request carries X-Profile-Id, its capture id for /api/admin/profiles/{id}. Those
+admin routes exist only while profiling is on and answer only requests carrying
+X-Profile-Token, so with no MEAL_PROFILE_TOKEN (sampling only) captures are read
+from MEAL_PROFILE_DIR on the host.
+"""
+
+import collections
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv('MEAL_PROFILING', '0') == '1'
+MEAL_PROFILE_TOKEN = os.getenv('MEAL_PROFILE_TOKEN', '')   # empty: header trigger disabled
+MEAL_PROFILE_SAMPLE_RATE = float(os.getenv('MEAL_PROFILE_SAMPLE_RATE', '0'))
+MEAL_PROFILE_PATHS = [p for p in os.getenv('MEAL_PROFILE_PATHS', '/api/analyze-meal,/api/suggest-meals').split(',') if p]
+MEAL_PROFILE_INTERVAL_MS = float(os.getenv('MEAL_PROFILE_INTERVAL_MS', '5'))
+MEAL_PROFILE_DIR = Path(os.getenv('MEAL_PROFILE_DIR', Path(__file__).parent.parent / 'profiles'))
+MEAL_PROFILE_KEEP = int(os.getenv('MEAL_PROFILE_KEEP', '50'))
+MEAL_PROFILE_TENSORFLOW = os.getenv('MEAL_PROFILE_TENSORFLOW', '1') == '1'
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# (file, function) of the innermost frame of a thread that is blocked waiting for work
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+    ('socket.py', 'accept'),
+}
+
+_CAPTURE_ID = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9]+$')
+_sequence = 0
+_sequence_lock = threading.Lock()
+_tensorflow_lock = threading.Lock()   # tf.profiler allows one session per process
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    """Outermost-first labels of a stack, or None if the thread is idle."""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class StackSampler:
+    """
+    Samples the stacks of all threads but its own at a fixed interval.
+
+    Args:
+        interval_s (float): Seconds between samples.
+    """
+
+    def __init__(self, interval_s):
+        self.interval_s = interval_s
+        self.counts = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = _collapse(frame)
+                if labels is not None:
+                    self.counts[';'.join([names.get(ident, str(ident))] + labels)] += 1
+            self.samples += 1
+
+
+def token_matches(headers):
+    """True if the headers carry MEAL_PROFILE_TOKEN (never, when no token is configured)."""
+    if not MEAL_PROFILE_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get(PROFILE_HEADER, '').encode(), MEAL_PROFILE_TOKEN.encode())
+
+
+def should_profile(path, headers):
+    """Why a request to path with these headers is profiled ('header' or 'sample'), or None."""
+    if path not in MEAL_PROFILE_PATHS:
+        return None
+    if token_matches(headers):
+        return 'header'
+    if MEAL_PROFILE_SAMPLE_RATE > 0 and random.random() < MEAL_PROFILE_SAMPLE_RATE:
+        return 'sample'
+    return None
+
+
+def _new_capture_id():
+    global _sequence
+    with _sequence_lock:
+        _sequence += 1
+        sequence = _sequence
+    now = time.time()
+    # sortable by time: ring buffer order
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}{int(now % 1 * 1e6):06d}-{sequence}"
+
+
+class RequestProfile:
+    """
+    One profiled request: a stack sampler plus, when available, a tf.profiler session.
+
+    Args:
+        method (str): HTTP method.
+        path (str): Request path.
+        trigger (str): 'header' or 'sample'.
+    """
+
+    def __init__(self, method, path, trigger):
+        self.id = _new_capture_id()
+        self.directory = MEAL_PROFILE_DIR / self.id
+        self.meta = {'id': self.id, 'method': method, 'path': path, 'trigger': trigger,
+                     'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        self.sampler = StackSampler(MEAL_PROFILE_INTERVAL_MS / 1000)
+        self._tensorflow = None
+        self._started = None
+
+    def start(self):
+        if MEAL_PROFILE_TENSORFLOW and _tensorflow_lock.acquire(blocking=False):
+            try:
+                import tensorflow as tf
+                tf.profiler.experimental.start(str(self.directory / 'tensorflow'))
+                self._tensorflow = tf
+            except Exception as e:   # no TensorFlow, or a session started elsewhere
+                _tensorflow_lock.release()
+                logger.info(f"Profile {self.id}: no TensorFlow trace ({e})")
+        self._started = time.perf_counter()
+        self.sampler.start()
+
+    def finish(self, status_code):
+        """Stop sampling and write the capture (blocking: call it off the event loop)."""
+        self.meta['duration_ms'] = round((time.perf_counter() - self._started) * 1000, 3)
+        self.sampler.stop()
+        if self._tensorflow is not None:
+            try:
+                self._tensorflow.profiler.experimental.stop()
+            finally:
+                _tensorflow_lock.release()
+        self.meta.update(status_code=status_code, samples=self.sampler.samples,
+                         interval_ms=MEAL_PROFILE_INTERVAL_MS, distinct_stacks=len(self.sampler.counts),
+                         tensorflow_trace=self._tensorflow is not None)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / 'stacks.txt', 'w') as f:
+            for stack, count in self.sampler.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(self.directory / 'meta.json', 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        prune_captures()
+        logger.info(f"Profile {self.id}: {self.meta['path']} took {self.meta['duration_ms']:.1f} ms, "
+                    f"{self.sampler.samples} samples")
+        return self.meta
+
+
+def prune_captures(keep=MEAL_PROFILE_KEEP):
+    """Delete all but the newest `keep` captures."""
+    captures = list_capture_ids()
+    for capture_id in captures[:max(0, len(captures) - keep)]:
+        shutil.rmtree(MEAL_PROFILE_DIR / capture_id, ignore_errors=True)
+
+
+def list_capture_ids():
+    """Capture ids, oldest first."""
+    if not MEAL_PROFILE_DIR.exists():
+        return []
+    return sorted(p.name for p in MEAL_PROFILE_DIR.iterdir() if p.is_dir() and _CAPTURE_ID.match(p.name))
+
+
+def capture_directory(capture_id):
+    """Directory of a capture; KeyError if there is no such capture."""
+    if not _CAPTURE_ID.match(capture_id) or not (MEAL_PROFILE_DIR / capture_id / 'meta.json').exists():
+        raise KeyError(capture_id)
+    return MEAL_PROFILE_DIR / capture_id
+
+
+def list_captures():
+    """meta.json of every stored capture, newest first."""
+    captures = []
+    for capture_id in reversed(list_capture_ids()):
+        try:
+            with open(MEAL_PROFILE_DIR / capture_id / 'meta.json') as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue   # being written or pruned
+    return captures
@@ -0,0 +1,313 @@
+"""
+Ingredient classifier training
+
+Replaces notebooks/train_ingredients_model.ipynb's ImageDataGenerator loop,
+which re-decodes every source JPEG/PNG each epoch, with two steps:
+
+1. convert: decode and resize every image of the manifest to 320x320 once and
+   write them as sharded TFRecords (raw uint8 pixels, so reading needs no image
+   decoding) with multi-hot labels in model/class_encoding.json order. Shard
+   assignment is seeded and the record directory gets a manifest.json
+   (classes, counts, source fingerprint), so the same inputs always produce the
+   same shards and an up-to-date conversion is skipped.
+
+2. train: read the shards with parallel interleave, parse and cache the decoded
+   examples (in memory or --cache-file) before the random augmentation, shuffle,
+   batch and prefetch. Model, optimizer, loss and metrics are the notebook's.
+   keras BackupAndRestore makes an interrupted run resume from its last epoch,
+   and the best val_loss model is checkpointed.
+
+    python train_ingredients.py convert preprocessed_data.json --image-root data/ --records records/
+    python train_ingredients.py train --records records/ --epochs 30 --output ingredient_model_EfficientNetV2B0.keras
+
+CI-sized smoke run (no ImageNet download, a few steps):
+
+    python train_ingredients.py convert preprocessed_data.json --image-root data/ --records /tmp/rec --limit 64
+    python train_ingredients.py train --records /tmp/rec --weights none --epochs 1 --batch-size 8 --steps-per-epoch 2
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+from evaluate_models import IMAGE_SIZE, read_table, resolve_image_path
+from services.ingredient_predictor import load_class_map
+
+RECORDS_MANIFEST = 'manifest.json'
+RECORD_FORMAT = 1   # bump when the example layout changes
+
+
+def class_index(class_map):
+    """Normalized ingredient name -> output index."""
+    return {name.strip().lower(): i for i, name in class_map.items()}
+
+
+def multi_hot(labels, index, n_classes):
+    vector = np.zeros(n_classes, dtype=np.uint8)
+    if isinstance(labels, str):
+        labels = ast.literal_eval(labels)
+    for name in labels:
+        i = index.get(str(name).strip().lower())
+        if i is not None:
+            vector[i] = 1
+    return vector
+
+
+def _fingerprint(examples, class_map, shards, seed):
+    h = hashlib.sha256()
+    h.update(json.dumps([RECORD_FORMAT, IMAGE_SIZE, shards, seed, sorted(class_map.items())]).encode())
+    for path, label in zip(examples['image_path'], examples['label']):
+        st = os.stat(path)
+        h.update(f"{path}|{st.st_size}|{st.st_mtime_ns}|{label}\n".encode())
+    return h.hexdigest()
+
+
+def _serialize(image, label):
+    feature = {
+        'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+        'label': tf.train.Feature(bytes_list=tf.train.BytesList(value=[label.tobytes()])),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+
+def _decoded_images(paths):
+    """uint8 320x320x3 images in input order, decoded and resized in parallel."""
+    def load(path):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        img = tf.image.resize(img, IMAGE_SIZE, method='nearest')
+        return tf.cast(img, tf.uint8)
+
+    options = tf.data.Options()
+    options.deterministic = True
+    dataset = (tf.data.Dataset.from_tensor_slices(list(paths))
+               .map(load, num_parallel_calls=tf.data.AUTOTUNE)
+               .prefetch(tf.data.AUTOTUNE)
+               .with_options(options))
+    return dataset.as_numpy_iterator()
+
+
+def convert(manifest, records_dir, image_root=None, class_map=None, shards=16, seed=42, limit=None, overwrite=False):
+    """Write train/test TFRecord shards for the manifest; returns the records manifest dict."""
+    class_map = class_map or load_class_map()
+    index = class_index(class_map)
+    n_classes = max(class_map) + 1
+
+    examples = read_table(manifest)
+    examples['image_path'] = [resolve_image_path(link, image_root) for link in examples['image_link']]
+    exists = examples['image_path'].map(os.path.exists)
+    if (~exists).any():
+        print(f"Skipping {(~exists).sum()} rows whose image file is missing")
+    examples = examples[exists].sample(frac=1.0, random_state=seed).reset_index(drop=True)
+    if limit:
+        examples = examples.head(limit)
+
+    records_dir = Path(records_dir)
+    fingerprint = _fingerprint(examples, class_map, shards, seed)
+    manifest_path = records_dir / RECORDS_MANIFEST
+    if manifest_path.exists() and not overwrite:
+        existing = json.loads(manifest_path.read_text())
+        if existing.get('fingerprint') == fingerprint:
+            print(f"Records in {records_dir} are up to date")
+            return existing
+    records_dir.mkdir(parents=True, exist_ok=True)
+    for stale in records_dir.glob('*.tfrecord'):   # shard counts may differ from the last conversion
+        stale.unlink()
+
+    started = time.perf_counter()
+    splits = {}
+    for split, rows in examples.groupby('split', sort=True):
+        n_shards = max(1, min(shards, len(rows)))
+        labels = np.stack([multi_hot(label, index, n_classes) for label in rows['label']])
+        files = [records_dir / f"{split}-{i:05d}-of-{n_shards:05d}.tfrecord" for i in range(n_shards)]
+        writers = [tf.io.TFRecordWriter(str(f)) for f in files]
+        try:
+            for i, image in enumerate(_decoded_images(rows['image_path'])):
+                writers[i % n_shards].write(_serialize(image, labels[i]))
+        finally:
+            for writer in writers:
+                writer.close()
+        splits[str(split)] = {
+            'examples': len(rows),
+            'files': [f.name for f in files],
+            'unlabelled': int((labels.sum(axis=1) == 0).sum()),
+        }
+        print(f"{split}: {len(rows)} examples in {n_shards} shards")
+
+    result = {
+        'format': RECORD_FORMAT,
+        'image_size': list(IMAGE_SIZE),
+        'classes': [class_map.get(i, '') for i in range(n_classes)],
+        'seed': seed,
+        'splits': splits,
+        'fingerprint': fingerprint,
+    }
+    manifest_path.write_text(json.dumps(result, indent=2))
+    print(f"✅ Converted in {time.perf_counter() - started:.1f}s to: {records_dir}")
+    return result
+
+
+def parse_example(serialized, n_classes):
+    parsed = tf.io.parse_single_example(serialized, {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.string),
+    })
+    image = tf.reshape(tf.io.decode_raw(parsed['image'], tf.uint8), (*IMAGE_SIZE, 3))
+    label = tf.reshape(tf.io.decode_raw(parsed['label'], tf.uint8), (n_classes,))
+    return image, tf.cast(label, tf.float32)
+
+
+def augmenter(seed):
+    """The notebook's flips / 45 degree rotations, on batches of float images."""
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip('horizontal_and_vertical', seed=seed),
+        tf.keras.layers.RandomRotation(45 / 360, fill_mode='nearest', seed=seed),
+    ])
+
+
+def brighten(images, seed):
+    # ImageDataGenerator(brightness_range=(1, 1.5))
+    factor = tf.random.uniform((tf.shape(images)[0], 1, 1, 1), 1.0, 1.5, seed=seed)
+    return tf.clip_by_value(images * factor, 0.0, 255.0)
+
+
+def record_dataset(records_dir, split, n_classes, batch_size, training, cache_file=None, seed=42):
+    """interleave(TFRecord shards) -> parse -> cache -> [shuffle, augment] -> batch -> prefetch."""
+    pattern = str(Path(records_dir) / f"{split}-*.tfrecord")
+    files = tf.data.Dataset.list_files(pattern, shuffle=training, seed=seed)
+    dataset = files.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=tf.data.AUTOTUNE,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training,
+    )
+    dataset = dataset.map(lambda s: parse_example(s, n_classes), num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.cache(cache_file or '')
+    if training:
+        dataset = dataset.shuffle(4 * batch_size, seed=seed, reshuffle_each_iteration=True).repeat()
+    dataset = dataset.batch(batch_size, drop_remainder=training)
+    dataset = dataset.map(lambda x, y: (tf.cast(x, tf.float32), y), num_parallel_calls=tf.data.AUTOTUNE)
+    if training:
+        augment = augmenter(seed)
+        dataset = dataset.map(lambda x, y: (brighten(augment(x, training=True), seed), y),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def create_model(n_classes, weights='imagenet'):
+    """EfficientNetV2B0 + the notebook's dense head, sigmoid multi-label output."""
+    base_model = tf.keras.applications.EfficientNetV2B0(
+        include_top=False,
+        weights=weights,
+        input_shape=(*IMAGE_SIZE, 3),
+    )
+    x = base_model.output
+    x = tf.keras.layers.AveragePooling2D(padding='valid', strides=2, pool_size=(3, 3))(x)
+    x = tf.keras.layers.Flatten()(x)
+    for _ in range(2):
+        x = tf.keras.layers.Dense(
+            1024,
+            activation='relu',
+            kernel_regularizer=tf.keras.regularizers.L1L2(l1=1e-5, l2=1e-4),
+        )(x)
+        x = tf.keras.layers.Dropout(0.25)(x)
+    predictions = tf.keras.layers.Dense(n_classes, activation='sigmoid')(x)
+    return tf.keras.models.Model(inputs=base_model.input, outputs=predictions)
+
+
+def train(records_dir, output, epochs=30, batch_size=256, learning_rate=0.00008, weights='imagenet',
+          checkpoint_dir='checkpoints', cache_file=None, steps_per_epoch=None, seed=42):
+    records = json.loads((Path(records_dir) / RECORDS_MANIFEST).read_text())
+    n_classes = len(records['classes'])
+    train_examples = records['splits']['train']['examples']
+    tf.keras.utils.set_random_seed(seed)
+
+    train_ds = record_dataset(records_dir, 'train', n_classes, batch_size, True, cache_file, seed)
+    val_ds = None
+    if 'test' in records['splits']:
+        val_ds = record_dataset(records_dir, 'test', n_classes, batch_size, False,
+                                f"{cache_file}.test" if cache_file else None, seed)
+    steps_per_epoch = steps_per_epoch or max(1, train_examples // batch_size)
+
+    model = create_model(n_classes, None if weights == 'none' else weights)
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss=tf.keras.losses.BinaryCrossentropy(),
+        metrics=[
+            'accuracy',
+            tf.keras.metrics.Precision(name='precision'),
+            tf.keras.metrics.Recall(name='recall'),
+            tf.keras.metrics.AUC(name='auc'),
+            tf.keras.metrics.AUC(name='prc', curve='PR'),  # precision-recall curve
+        ],
+    )
+
+    checkpoint_dir = Path(checkpoint_dir)
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    monitor = 'val_loss' if val_ds is not None else 'loss'
+    callbacks = [
+        # resumes an interrupted run from its last completed epoch
+        tf.keras.callbacks.BackupAndRestore(str(checkpoint_dir / 'backup')),
+        tf.keras.callbacks.ModelCheckpoint(str(checkpoint_dir / 'best.keras'), monitor=monitor, save_best_only=True),
+        tf.keras.callbacks.CSVLogger(str(checkpoint_dir / 'history.csv'), append=True),
+    ]
+
+    print(f"Training on {train_examples} examples, {steps_per_epoch} steps/epoch, {n_classes} classes")
+    history = model.fit(
+        train_ds,
+        epochs=epochs,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=val_ds,
+        callbacks=callbacks,
+    )
+    model.save(output)
+    with open(checkpoint_dir / 'history.json', 'w') as f:
+        json.dump({k: [float(v) for v in values] for k, values in history.history.items()}, f)
+    print(f"✅ Model saved to: {output}")
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingredient classifier: TFRecord conversion and training")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    c = sub.add_parser("convert", help="decode + resize images once into sharded TFRecords")
+    c.add_argument("manifest", help="preprocessed_data.json (id, label, image_link, split)")
+    c.add_argument("--image-root", help="directory the manifest's image_link paths are relative to")
+    c.add_argument("--records", default="records")
+    c.add_argument("--class-map", default=None, help="class_encoding.json (default: model/)")
+    c.add_argument("--shards", type=int, default=16, help="shards per split")
+    c.add_argument("--seed", type=int, default=42)
+    c.add_argument("--limit", type=int, default=None, help="only the first N (shuffled) examples")
+    c.add_argument("--overwrite", action="store_true")
+
+    t = sub.add_parser("train", help="train from converted records (resumes from --checkpoint-dir)")
+    t.add_argument("--records", default="records")
+    t.add_argument("--output", default="ingredient_model_EfficientNetV2B0.keras")
+    t.add_argument("--epochs", type=int, default=30)
+    t.add_argument("--batch-size", type=int, default=256)
+    t.add_argument("--learning-rate", type=float, default=0.00008)
+    t.add_argument("--weights", default="imagenet", help="'imagenet' or 'none' (smoke runs)")
+    t.add_argument("--checkpoint-dir", default="checkpoints")
+    t.add_argument("--cache-file", default=None, help="cache parsed examples on disk instead of in memory")
+    t.add_argument("--steps-per-epoch", type=int, default=None)
+    t.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        class_map = load_class_map(args.class_map)
+        convert(args.manifest, args.records, args.image_root, class_map, args.shards, args.seed, args.limit,
+                args.overwrite)
+    else:
+        train(args.records, args.output, args.epochs, args.batch_size, args.learning_rate, args.weights,
+              args.checkpoint_dir, args.cache_file, args.steps_per_epoch, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,70 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import List, Optional
+
+import anyio
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import joblib
 import pandas as pd
 
-from db import SessionLocal
+from db import AsyncSessionLocal, SessionLocal, engine, pool_status
 from models import Prediction
+from id_allocator import IdAllocator
+from write_behind import QueueFullError, WriteBehindQueue
+from history import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, history_page_query, split_page
+from rollups import summarize_trends, trends_query, upsert_rollups
+from export import FORMATS, encode_export, export_query, stream_rows
+from partitions import PARTITION_CHECK_INTERVAL_S, ensure_partitions
+from model_loader import (ServingModel, apply_thread_limits, artifact_path, load_model, set_estimator_n_jobs,
+                          thread_pools)
+from prediction_cache import cache_from_env
+from surrogate import load_surrogate
+from meal_pipeline import run_pipeline
+
+
+
+def _ensure_partitions():
+    try:
+        with engine.begin() as conn:
+            created = ensure_partitions(conn)
+        if created:
+            print(f"✅ Created partitions: {', '.join(created)}")
+    except Exception as e:   # e.g. another worker created the same partition concurrently
+        print(f"⚠️ Partition check failed: {e}")
+
+
+async def _partition_upkeep():
+    # ✅ Keep PARTITION_MONTHS_AHEAD months of predictions partitions ahead of the clock
+    while True:
+        await run_in_threadpool(_ensure_partitions)
+        await asyncio.sleep(PARTITION_CHECK_INTERVAL_S)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if THREADPOOL_SIZE:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    upkeep = asyncio.create_task(_partition_upkeep()) if engine.dialect.name == "postgresql" else None
+    # ✅ Rows whose flush kept failing last time (see write_behind.py)
+    replayed = await run_in_threadpool(write_queue.replay_dead_letter)
+    if replayed:
+        print(f"✅ Re-queued {replayed} unsaved predictions from {write_queue.dead_letter_path}")
+    yield
+    if upkeep is not None:
+        upkeep.cancel()
+    # ✅ Flush buffered /predict-and-save rows before the worker exits
+    write_queue.close()
+    if AsyncSessionLocal is not None:
+        from db import async_engine
+        await async_engine.dispose()
 
-from sqlalchemy import desc, func   # ✅ added func
 
-app = FastAPI(title="Nutrition Model API")
+app = FastAPI(title="Nutrition Model API", lifespan=lifespan)
 
 # ✅ CORS FIX (Allow Expo Web Frontend)
 app.add_middleware(
@@ -22,10 +77,107 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Load model once when server starts
-model = joblib.load("artifacts/nutrition_model.pkl")
+# ✅ Which trained artifact to serve: multioutput_rf (default) | native_rf | hgb (see train.py --model-type)
+MODEL_TYPE = os.getenv("NUTRITION_MODEL_TYPE", "multioutput_rf")
+MODEL_PATH = os.getenv("NUTRITION_MODEL_PATH")  # optional explicit path, overrides the type's default file
+
+# ✅ Per-request parallelism. The pickled forests carry n_jobs=-1, which fans every
+# /predict out over all cores from inside the request threadpool; under concurrency
+# that oversubscribes the CPU. NUTRITION_PREDICT_N_JOBS (default 1) overrides it, and
+# NUTRITION_BLAS_THREADS / NUTRITION_OPENMP_THREADS cap numpy's BLAS and OpenMP (HGB)
+# pools, set in each worker thread on its first prediction. NUTRITION_THREADPOOL_SIZE sets how many sync requests run at once (anyio default: 40).
+PREDICT_N_JOBS = int(os.getenv("NUTRITION_PREDICT_N_JOBS", "1"))
+THREADPOOL_SIZE = int(os.getenv("NUTRITION_THREADPOOL_SIZE", "0"))   # 0 = keep the default
+thread_limits = apply_thread_limits(
+    blas=int(os.environ["NUTRITION_BLAS_THREADS"]) if os.getenv("NUTRITION_BLAS_THREADS") else None,
+    openmp=int(os.environ["NUTRITION_OPENMP_THREADS"]) if os.getenv("NUTRITION_OPENMP_THREADS") else None,
+)
+
+
+# Load model once when server starts.
+# compiled_model is a NumPy version of the same pipeline for low-latency single-row predictions
+# (set NUTRITION_COMPILED_MODEL=0 to serve straight from the sklearn pipeline).
+# Its arrays are memory-mapped read-only so all workers on a host share one copy
+# (set NUTRITION_MODEL_MMAP=0 to keep a private in-process copy instead).
+# ✅ NUTRITION_SURROGATE_PATH=artifacts/nutrition_surrogate.npz serves the small distilled model
+# from distill.py instead (the forest is then not loaded at all).
+SURROGATE_PATH = os.getenv("NUTRITION_SURROGATE_PATH")
+
+
+def _load_serving_model():
+    if SURROGATE_PATH:
+        surrogate = load_surrogate(SURROGATE_PATH)
+        print(f"✅ Surrogate {surrogate.kind} loaded from {SURROGATE_PATH}")
+        return None, surrogate
+    pipeline, compiled = load_model(
+        MODEL_TYPE,
+        path=MODEL_PATH,
+        compiled=os.getenv("NUTRITION_COMPILED_MODEL", "1") == "1",
+        mmap=os.getenv("NUTRITION_MODEL_MMAP", "1") == "1",
+    )
+    if pipeline is not None:
+        set_estimator_n_jobs(pipeline, PREDICT_N_JOBS)
+    return pipeline, compiled
+
+
+# ✅ Retrained artifacts are picked up without a restart: the file is checked every
+# NUTRITION_MODEL_CHECK_S seconds (0 = never) and reloaded when it changes.
+serving_model = ServingModel(
+    _load_serving_model,
+    SURROGATE_PATH or MODEL_PATH or artifact_path(MODEL_TYPE),
+    check_s=float(os.getenv("NUTRITION_MODEL_CHECK_S", "5")),
+)
+
+
+# ✅ Optional cache in front of the model (NUTRITION_CACHE=1). Noisy wearable fields are
+# quantized into buckets (NUTRITION_CACHE_BUCKETS="steps_per_day=250,avg_heart_rate=2,stress_score=5",
+# NUTRITION_CACHE_STRICT=1 for exact-match only); keyed on the serving model's version, so a reload invalidates it.
+prediction_cache = cache_from_env()
+
+
+def _predict_with(model, compiled_model, data: dict):
+    if thread_limits is not None:
+        thread_limits()   # OpenMP caps are per thread: set them in this worker
+    if compiled_model is not None:
+        return compiled_model.predict_one(data)
+    return model.predict(pd.DataFrame([data]))[0]
+
+
+def _predict_uncached(data: dict):
+    _, model, compiled_model = serving_model.current()
+    return _predict_with(model, compiled_model, data)
+
+
+def predict_nutrition(data: dict):
+    # One snapshot per request: the cache key's version and the model that computes it match
+    version, model, compiled_model = serving_model.current()
+    if prediction_cache is not None:
+        return prediction_cache.get_or_compute(
+            data, lambda canonical: _predict_with(model, compiled_model, canonical), version)
+    return _predict_with(model, compiled_model, data)
+
+
+# ✅ /predict-and-save persistence: ids come from a DB sequence in blocks (no SELECT max(id)),
+# rows are inserted in batches by a background thread (NUTRITION_SAVE_BATCH rows or
+# NUTRITION_SAVE_DELAY_S seconds, whichever comes first). NUTRITION_SAVE_DURABLE=1 (or
+# ?durable=true per request) waits for the row to be committed before responding.
+# Failed flushes are retried; rows that still fail go to NUTRITION_SAVE_DEAD_LETTER and are
+# replayed at the next start. At most NUTRITION_SAVE_MAX_QUEUE rows wait; past that, 503.
+id_allocator = IdAllocator(engine)
+write_queue = WriteBehindQueue(
+    SessionLocal,
+    Prediction,
+    max_batch=int(os.getenv("NUTRITION_SAVE_BATCH", "500")),
+    max_delay_s=float(os.getenv("NUTRITION_SAVE_DELAY_S", "0.2")),
+    after_insert=upsert_rollups,   # ✅ keep per-user daily rollups current in the same transaction
+    max_queue=int(os.getenv("NUTRITION_SAVE_MAX_QUEUE", "10000")),
+    retries=int(os.getenv("NUTRITION_SAVE_RETRIES", "3")),
+    dead_letter_path=os.getenv("NUTRITION_SAVE_DEAD_LETTER", "write_behind_failed.jsonl") or None,
+)
+SAVE_DURABLE = os.getenv("NUTRITION_SAVE_DURABLE", "0") == "1"
 
 
 # ✅ Home route (so / doesn't show 404)
@@ -34,6 +186,42 @@ def home():
     return {"status": "OK", "message": "Nutrition Model API running. Visit /docs"}
 
 
+# ✅ Prediction cache hit-rate metrics
+@app.get("/metrics/prediction-cache")
+def prediction_cache_metrics():
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {**prediction_cache.stats(), "model_reloads": serving_model.reloads}
+
+
+# ✅ Write-behind queue depth + flush latency
+@app.get("/metrics/write-behind")
+def write_behind_metrics():
+    return write_queue.stats()
+
+
+# ✅ Effective per-request parallelism and native thread pools, as a /predict worker sees them
+def _worker_thread_pools():
+    if thread_limits is not None:
+        thread_limits()
+    return thread_pools()
+
+
+@app.get("/metrics/threads")
+async def thread_metrics():
+    return {
+        "predict_n_jobs": PREDICT_N_JOBS if serving_model.current()[1] is not None else None,
+        "threadpool_size": anyio.to_thread.current_default_thread_limiter().total_tokens,
+        "native_pools": await run_in_threadpool(_worker_thread_pools),
+    }
+
+
+# ✅ DB pool occupancy + checkout wait time
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    return pool_status()
+
+
 class UserInput(BaseModel):
     age: int
     gender: str
@@ -52,8 +240,7 @@ class UserInput(BaseModel):
 
 @app.post("/predict")
 def predict(data: UserInput):
-    X = pd.DataFrame([data.model_dump()])
-    pred = model.predict(X)[0]
+    pred = predict_nutrition(data.model_dump())
 
     return {
         "daily_kcal_need": int(round(pred[0])),
@@ -63,10 +250,34 @@ def predict(data: UserInput):
     }
 
 
+class MealPlanRequest(BaseModel):
+    profile: UserInput
+    meals_per_day: int = 3
+    calorie_distribution_ratios: Optional[List[float]] = None
+
+
+@app.post("/predict-meal-plan")
+def predict_meal_plan(request: MealPlanRequest):
+    # ✅ /predict + macro ratio targets + the meal planner in one call (see meal_pipeline.py)
+    try:
+        return run_pipeline(
+            request.profile.model_dump(),
+            predict_nutrition,
+            meals_per_day=request.meals_per_day,
+            calorie_distribution_ratios=request.calorie_distribution_ratios,
+        )
+    except (RuntimeError, FileNotFoundError) as e:
+        raise HTTPException(status_code=503, detail=f"Meal planner not available: {e}")
+
+
+def _predict_and_allocate(data: dict):
+    # CPU work + the occasional id-block reservation, run off the event loop
+    return predict_nutrition(data), id_allocator.next_id()
+
+
 @app.post("/predict-and-save")
-def predict_and_save(data: UserInput):
-    X = pd.DataFrame([data.model_dump()])
-    pred = model.predict(X)[0]
+async def predict_and_save(data: UserInput, response: Response, durable: bool = False):
+    pred, saved_id = await run_in_threadpool(_predict_and_allocate, data.model_dump())
 
     result = {
         "daily_kcal_need": int(round(pred[0])),
@@ -75,51 +286,87 @@ def predict_and_save(data: UserInput):
         "fat_g_per_day": float(round(pred[3], 1)),
     }
 
-    db = SessionLocal()
+    # ✅ AUTO user_id generation (user_000001, user_000002...) from a race-free id
+    auto_user_id = f"user_{saved_id:06d}"
+
+    row = {
+        "id": saved_id,
+        "user_id": auto_user_id,
+        **data.model_dump(),
+        **result,
+        "created_at": datetime.utcnow(),   # request time, not flush time
+    }
+    # durable: await the batch commit without holding a threadpool slot
     try:
-        # ✅ AUTO user_id generation (user_000001, user_000002...)
-        last_id = db.query(func.max(Prediction.id)).scalar()
-        next_num = (last_id or 0) + 1
-        auto_user_id = f"user_{next_num:06d}"
-
-        row = Prediction(
-            user_id=auto_user_id,   # ✅ now automatic
-            **data.model_dump(),
-            **result
-        )
+        await write_queue.submit_async(row, durable=durable or SAVE_DURABLE)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Saving is backed up, try again shortly: {e}")
+    except asyncio.TimeoutError:
+        # ✅ still queued: it may commit after the response, so don't report a failure
+        response.status_code = 202
+        return {"saved_id": saved_id, "user_id": auto_user_id, "save": "pending", **result}
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Prediction {saved_id} could not be saved: {e}")
+
+    return {"saved_id": saved_id, "user_id": auto_user_id, **result}  # ✅ return user_id too
 
-        db.add(row)
-        db.commit()
-        db.refresh(row)
 
-        return {"saved_id": row.id, "user_id": row.user_id, **result}  # ✅ return user_id too
+def _fetch_all(stmt):
+    db = SessionLocal()
+    try:
+        return db.execute(stmt).all()
     finally:
         db.close()
 
 
+async def _run_query(stmt):
+    # ✅ DB_ASYNC=1: await the async engine; otherwise run the sync query in the threadpool
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(stmt)).all()
+    return await run_in_threadpool(_fetch_all, stmt)
+
+
 @app.get("/history/{user_id}")
-def get_history(user_id: str):
-    db = SessionLocal()
+async def get_history(
+    user_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+):
+    # ✅ Keyset pagination: pass the X-Next-Cursor header of one page as ?cursor= for the next
     try:
-        rows = (
-            db.query(Prediction)
-            .filter(Prediction.user_id == user_id)
-            .order_by(desc(Prediction.created_at))
-            .limit(20)
-            .all()
-        )
+        stmt = history_page_query(user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        return [
-            {
-                "id": r.id,
-                "user_id": r.user_id,
-                "created_at": r.created_at,
-                "daily_kcal_need": r.daily_kcal_need,
-                "protein_g_per_day": r.protein_g_per_day,
-                "carbs_g_per_day": r.carbs_g_per_day,
-                "fat_g_per_day": r.fat_g_per_day,
-            }
-            for r in rows
-        ]
-    finally:
-        db.close()
+    rows = await _run_query(stmt)
+    items, next_cursor = split_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
+@app.get("/history/{user_id}/trends")
+async def get_trends(user_id: str, as_of: date = None):
+    # ✅ Rolling 7/30/90-day averages + min/max, read from the daily rollups (not raw predictions)
+    as_of = as_of or datetime.utcnow().date()
+    rows = await _run_query(trends_query(user_id, as_of))
+    return {"user_id": user_id, **summarize_trends([r[0] for r in rows], as_of)}
+
+
+@app.get("/export/predictions")
+def export_predictions(
+    user_id: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+):
+    # ✅ Streams from a server-side cursor (sync engine, iterated off the event loop): constant memory
+    stmt = export_query(user_id, start, end)
+    body = encode_export(stream_rows(engine, stmt), format, gzip=gzip)
+    filename = f"predictions.{format}" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    media_type = "application/gzip" if gzip else FORMATS[format]
+    return StreamingResponse(body, media_type=media_type, headers=headers)
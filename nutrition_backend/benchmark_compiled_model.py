@@ -0,0 +1,75 @@
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from compiled_model import compile_pipeline
+
+MODEL_PATH = "artifacts/nutrition_model.pkl"
+DATA_PATH = "sri_lanka_dataset_1000_inputs_outputs_only.csv"
+
+feature_cols = [
+    "age", "gender", "height_cm", "weight_kg", "goal",
+    "has_diabetes", "has_hypertension",
+    "steps_per_day", "active_minutes", "calories_burned_active",
+    "resting_heart_rate", "avg_heart_rate", "stress_score"
+]
+
+# ✅ 1) Load pipeline + compile it
+t0 = time.perf_counter()
+pipeline = joblib.load(MODEL_PATH)
+load_s = time.perf_counter() - t0
+
+t0 = time.perf_counter()
+compiled = compile_pipeline(pipeline)
+compile_s = time.perf_counter() - t0
+
+print(f"\nLoad: {load_s:.2f}s | Compile: {compile_s:.2f}s | "
+      f"Trees: {compiled.n_trees} | Nodes: {compiled.n_nodes}")
+
+# ✅ 2) Same missing-value handling as train.py
+df = pd.read_csv(DATA_PATH)
+df["stress_score"] = df["stress_score"].fillna(df["stress_score"].median())
+df["active_minutes"] = df["active_minutes"].fillna(df["active_minutes"].median())
+df["has_diabetes"] = df["has_diabetes"].fillna(0).astype(int)
+df["has_hypertension"] = df["has_hypertension"].fillna(0).astype(int)
+X = df[feature_cols]
+
+# ✅ 3) Parity: compiled vs joblib pipeline over the whole dataset
+expected = pipeline.predict(X)
+actual = compiled.predict(X)
+max_abs_diff = np.abs(expected - actual).max()
+print(f"\n=== Parity ({len(X)} rows) ===")
+print(f"max |pipeline - compiled| = {max_abs_diff:.6f}")
+assert np.allclose(expected, actual, rtol=1e-6, atol=1e-3), "compiled model does not match pipeline"
+
+records = X.to_dict(orient="records")
+for record in records[:50]:
+    one = compiled.predict_one(record)
+    assert np.allclose(one, pipeline.predict(pd.DataFrame([record]))[0], rtol=1e-6, atol=1e-3)
+print("✅ Parity OK")
+
+
+# ✅ 4) Latency: single-row requests (what /predict does) and one batch
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000
+    return np.median(times), np.percentile(times, 99)
+
+
+record = records[0]
+print("\n=== Latency (ms) ===")
+p50, p99 = timeit(lambda: pipeline.predict(pd.DataFrame([record])), 50)
+print(f"pipeline single-row: p50={p50:.2f} | p99={p99:.2f}")
+p50, p99 = timeit(lambda: compiled.predict_one(record), 500)
+print(f"compiled single-row: p50={p50:.3f} | p99={p99:.3f}")
+
+p50, _ = timeit(lambda: pipeline.predict(X), 5)
+print(f"pipeline batch of {len(X)}: {p50:.1f}")
+p50, _ = timeit(lambda: compiled.predict(X), 5)
+print(f"compiled batch of {len(X)}: {p50:.1f}")
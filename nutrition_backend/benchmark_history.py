@@ -0,0 +1,114 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, insert, select
+
+from db import Base, engine
+from history import HISTORY_COLUMNS, encode_cursor, history_page_query
+from migrations import apply_migrations
+from partitions import ensure_partitions
+from models import Prediction
+
+HEAVY_USER = "user_bench_heavy"
+SEED_START = datetime(2024, 1, 1)
+
+# Run against a scratch database, e.g.
+#   DATABASE_URL=sqlite:///./bench_history.db python benchmark_history.py --rows 10000000
+
+
+def seed(n_rows, n_users, heavy_rows, chunk=50_000):
+    """Insert n_rows synthetic predictions; HEAVY_USER gets heavy_rows of them."""
+    with engine.connect() as conn:
+        start_id = (conn.scalar(select(func.max(Prediction.id))) or 0) + 1
+
+    rng = random.Random(42)
+    t0 = SEED_START
+    base = {
+        "age": 30, "gender": "Female", "height_cm": 160.0, "weight_kg": 60.0, "goal": "Maintain",
+        "has_diabetes": 0, "has_hypertension": 0, "steps_per_day": 8000, "active_minutes": 40,
+        "calories_burned_active": 300.0, "resting_heart_rate": 65.0, "avg_heart_rate": 90.0,
+        "stress_score": 40.0, "daily_kcal_need": 1900, "protein_g_per_day": 95.0,
+        "carbs_g_per_day": 240.0, "fat_g_per_day": 63.0,
+    }
+    heavy_every = max(1, n_rows // heavy_rows) if heavy_rows else 0
+
+    started = time.perf_counter()
+    for offset in range(0, n_rows, chunk):
+        rows = []
+        for i in range(offset, min(offset + chunk, n_rows)):
+            if heavy_every and i % heavy_every == 0:
+                user_id = HEAVY_USER
+            else:
+                user_id = f"user_{rng.randrange(n_users):06d}"
+            rows.append({
+                **base,
+                "id": start_id + i,
+                "user_id": user_id,
+                "created_at": t0 + timedelta(seconds=i * 3),
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(Prediction), rows)
+        done = min(offset + chunk, n_rows)
+        rate = done / (time.perf_counter() - started)
+        print(f"\rSeeded {done:,}/{n_rows:,} rows ({rate:,.0f} rows/s)", end="", flush=True)
+    print()
+
+
+def timed(conn, stmt, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        conn.execute(stmt).all()
+        times.append(time.perf_counter() - t0)
+    return np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keyset vs OFFSET paging of /history")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--heavy-rows", type=int, default=200_000, help="rows owned by the user we page through")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded database")
+    args = parser.parse_args()
+
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+    if not args.skip_seed:
+        with engine.begin() as conn:
+            ensure_partitions(conn, since=SEED_START)   # Postgres: partitions for the seeded months
+        seed(args.rows, args.users, args.heavy_rows)
+
+    with engine.connect() as conn:
+        total = conn.scalar(select(func.count()).select_from(Prediction))
+        heavy = conn.scalar(select(func.count()).where(Prediction.user_id == HEAVY_USER))
+        print(f"Table rows: {total:,} | {HEAVY_USER}: {heavy:,} rows")
+
+        ordered = (
+            select(*HISTORY_COLUMNS)
+            .where(Prediction.user_id == HEAVY_USER)
+            .order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        )
+
+        print(f"\n=== Page fetch latency (ms, median of {args.repeat}, page size {args.page_size}) ===")
+        print(f"{'depth (rows)':>14} | {'keyset':>8} | {'offset':>8}")
+        depth = 0
+        while depth < heavy:
+            cursor = None
+            if depth:
+                # the row just before the page starts
+                anchor = conn.execute(ordered.offset(depth - 1).limit(1)).one()
+                cursor = encode_cursor(anchor.created_at, anchor.id)
+            keyset_ms = timed(conn, history_page_query(HEAVY_USER, args.page_size, cursor), args.repeat)
+            offset_ms = timed(conn, ordered.offset(depth).limit(args.page_size + 1), args.repeat)
+            print(f"{depth:>14,} | {keyset_ms:>8.3f} | {offset_ms:>8.3f}")
+            depth = depth * 10 if depth else 100
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from model_loader import MODEL_TYPES, load_model, set_estimator_n_jobs
+from train import load_dataset
+
+# Simulates /predict under concurrent clients: each client is a thread (like FastAPI's
+# sync-endpoint threadpool) sending single-row predictions back to back.
+#   python benchmark_threads.py --clients 1 8 64 --n-jobs -1 1 --blas 0 1
+
+
+def run_load(predict, records, clients, total, openmp=None):
+    """
+    Throughput and latency percentiles for `total` calls spread over `clients` threads.
+    OpenMP caps are per thread, so `openmp` is set inside each client thread.
+    """
+    latencies = []
+    lock = threading.Lock()
+    per_client = max(1, total // clients)
+
+    def client(offset):
+        if openmp:
+            threadpool_limits(limits={"openmp": openmp})
+        local = []
+        for i in range(per_client):
+            t0 = time.perf_counter()
+            predict(records[(offset + i) % len(records)])
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(ms),
+        "rps": len(ms) / elapsed,
+        "p50_ms": np.percentile(ms, 50),
+        "p99_ms": np.percentile(ms, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput / p99 of /predict-style calls per thread setting")
+    parser.add_argument("--model-type", choices=list(MODEL_TYPES), default="multioutput_rf")
+    parser.add_argument("--compiled", action="store_true", help="benchmark the compiled model instead of the pipeline")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[-1, 1], help="estimator n_jobs settings to try")
+    parser.add_argument("--blas", type=int, nargs="+", default=[0, 1], help="BLAS/OpenMP thread caps (0 = no cap)")
+    parser.add_argument("--requests", type=int, default=256, help="calls per measurement")
+    args = parser.parse_args()
+
+    pipeline, compiled_model = load_model(args.model_type, compiled=args.compiled, mmap=False)
+    X, _ = load_dataset()
+    records = X.to_dict("records")
+    print(f"CPU cores: {os.cpu_count()}")
+
+    if args.compiled:
+        predict = compiled_model.predict_one
+        n_jobs_options = [None]   # the compiled model has no n_jobs
+    else:
+        predict = lambda r: pipeline.predict(pd.DataFrame([r]))[0]
+        n_jobs_options = args.n_jobs
+
+    rows = []
+    for n_jobs, cap in itertools.product(n_jobs_options, args.blas):
+        if n_jobs is not None:
+            set_estimator_n_jobs(pipeline, n_jobs)
+        # BLAS caps are process-wide (set here, restored after); OpenMP caps per client thread
+        with threadpool_limits(limits={"blas": cap} if cap else None):
+            predict(records[0])   # warm up
+            for clients in args.clients:
+                stats = run_load(predict, records, clients, args.requests, openmp=cap or None)
+                rows.append({"n_jobs": n_jobs, "blas_openmp": cap or "all", "clients": clients, **stats})
+                print(f"n_jobs={n_jobs} blas/openmp={cap or 'all'} clients={clients}: "
+                      f"{stats['rps']:.1f} req/s, p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")
+
+    print("\n=== Summary ===")
+    print(pd.DataFrame(rows).round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Compiled inference path for the nutrition pipeline.
+
+The fitted sklearn pipeline (ColumnTransformer -> forest) is turned into a
+handful of flat NumPy arrays so a prediction is just a few vectorised gathers:
+
+- StandardScaler is folded into the split thresholds (no scaling at runtime)
+- OneHotEncoder is replaced by a small category -> column table
+- every tree of every forest lives in one contiguous node array and all trees
+  are walked together, one level per step
+
+`save_compiled` writes those arrays as plain .npy files; `load_compiled` memory-maps
+them read-only, so every worker process on a host shares the same page-cache copy.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+
+# Array attributes of CompiledNutritionModel, each stored as <name>.npy by save_compiled
+ARRAY_FIELDS = ("children", "feature", "threshold", "value", "roots", "weights")
+
+
+class CompiledNutritionModel:
+    """Array-only version of the fitted pipeline. Use `compile_pipeline` to build one."""
+
+    def __init__(self, numeric_cols, categorical_tables, n_features,
+                 children, feature, threshold, value, roots, weights, max_depth):
+        self.numeric_cols = numeric_cols                # columns read as floats, in feature order
+        self.categorical_tables = categorical_tables    # [(column, {category: feature index})]
+        self.n_features = n_features
+
+        self.children = children    # (n_nodes, 2) global index of [left, right] child, leaves point to themselves
+        self.feature = feature      # (n_nodes,) feature index tested at the node
+        self.threshold = threshold  # (n_nodes,) split threshold in *raw* (unscaled) units
+        self.value = value          # (n_nodes, k) leaf values
+        self.roots = roots          # (n_trees,) global index of each tree's root
+        self.weights = weights      # (n_trees * k, n_outputs) averaging matrix
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def n_outputs(self):
+        return self.weights.shape[1]
+
+    def encode(self, columns, n_rows):
+        """Build the (n_rows, n_features) input matrix from a column mapping (dict or DataFrame)."""
+        X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        for j, col in enumerate(self.numeric_cols):
+            X[:, j] = np.asarray(columns[col], dtype=np.float64)
+        for col, table in self.categorical_tables:
+            for i, category in enumerate(columns[col]):
+                k = table.get(category)
+                if k is not None:   # unknown categories stay all-zero (handle_unknown="ignore")
+                    X[i, k] = 1.0
+        return X
+
+    def predict_encoded(self, X):
+        """Predict from an already encoded input matrix."""
+        n_rows = X.shape[0]
+        X_flat = np.ascontiguousarray(X).ravel()
+        row_base = (np.arange(n_rows) * X.shape[1])[:, None]
+        children = self.children.ravel()
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+
+        # Walk every tree one level at a time. Leaves loop back onto themselves,
+        # so a fixed number of steps is safe; stop early once nothing moves.
+        for _ in range(self.max_depth):
+            go_right = X_flat.take(row_base + self.feature.take(nodes)) > self.threshold.take(nodes)
+            next_nodes = children.take(2 * nodes + go_right)
+            if np.array_equal(next_nodes, nodes):
+                break
+            nodes = next_nodes
+
+        leaf_values = self.value[nodes].reshape(n_rows, -1)
+        return leaf_values @ self.weights
+
+    def predict(self, X):
+        """Predict from a DataFrame or a list of input dicts, like `Pipeline.predict`."""
+        if isinstance(X, list):
+            columns = {col: [r[col] for r in X] for col in self._input_cols()}
+            return self.predict_encoded(self.encode(columns, len(X)))
+        return self.predict_encoded(self.encode(X, len(X)))
+
+    def predict_one(self, record):
+        """Predict a single input dict, e.g. `UserInput.model_dump()`."""
+        columns = {col: [record[col]] for col in self._input_cols()}
+        return self.predict_encoded(self.encode(columns, 1))[0]
+
+    def _input_cols(self):
+        return list(self.numeric_cols) + [col for col, _ in self.categorical_tables]
+
+
+def _unpack_preprocess(preprocess):
+    """Return (numeric_cols, means, scales, categorical_tables) for the fitted ColumnTransformer."""
+    if not isinstance(preprocess, ColumnTransformer):
+        raise ValueError(f"Unsupported preprocessing step: {type(preprocess).__name__}")
+
+    numeric_cols, means, scales = [], [], []
+    categorical = []
+    for name, transformer, cols in preprocess.transformers_:
+        if transformer == "drop":
+            continue
+        if transformer == "passthrough":
+            numeric_cols += list(cols)
+            means += [0.0] * len(cols)
+            scales += [1.0] * len(cols)
+        elif isinstance(transformer, StandardScaler):
+            n = len(cols)
+            numeric_cols += list(cols)
+            means += list(transformer.mean_) if transformer.mean_ is not None and transformer.with_mean else [0.0] * n
+            scales += list(transformer.scale_) if transformer.scale_ is not None else [1.0] * n
+        elif isinstance(transformer, OneHotEncoder):
+            if transformer.drop is not None:
+                raise ValueError("OneHotEncoder with drop= is not supported by the compiled model")
+            for col, categories in zip(cols, transformer.categories_):
+                categorical.append((col, list(categories)))
+        else:
+            raise ValueError(f"Unsupported transformer '{name}': {type(transformer).__name__}")
+
+    # Compiled features are laid out as [numeric..., one-hot...]; split features are remapped to
+    # this layout in `_output_layout`, whatever order the ColumnTransformer used.
+    return numeric_cols, np.array(means, dtype=np.float64), np.array(scales, dtype=np.float64), categorical
+
+
+def _output_layout(preprocess, numeric_cols, categorical):
+    """Map each ColumnTransformer output column to (compiled feature index, is_numeric)."""
+    numeric_pos = {col: j for j, col in enumerate(numeric_cols)}
+    layout = []
+    offset = len(numeric_cols)
+    cat_offsets = {}
+    for col, categories in categorical:
+        cat_offsets[col] = offset
+        offset += len(categories)
+
+    for name, transformer, cols in preprocess.transformers_:
+        if transformer == "drop":
+            continue
+        if isinstance(transformer, OneHotEncoder):
+            for col, categories in zip(cols, transformer.categories_):
+                layout += [(cat_offsets[col] + k, False) for k in range(len(categories))]
+        else:
+            layout += [(numeric_pos[col], True) for col in cols]
+    return layout, offset
+
+
+def _collect_trees(regressor):
+    """Return [(tree, output index or None)] for every tree in the regressor."""
+    forest_types = (RandomForestRegressor, ExtraTreesRegressor)
+    if isinstance(regressor, MultiOutputRegressor):
+        trees = []
+        for output, forest in enumerate(regressor.estimators_):
+            if not isinstance(forest, forest_types):
+                raise ValueError(f"Unsupported estimator inside MultiOutputRegressor: {type(forest).__name__}")
+            trees += [(est.tree_, output) for est in forest.estimators_]
+        return trees, len(regressor.estimators_)
+    if isinstance(regressor, forest_types):
+        return [(est.tree_, None) for est in regressor.estimators_], regressor.n_outputs_
+    raise ValueError(f"Unsupported regressor: {type(regressor).__name__}")
+
+
+def _fold_thresholds(threshold, mean, scale):
+    """
+    Turn `float32((x - mean) / scale) <= threshold` into `x <= raw` with the exact same outcome.
+
+    sklearn trees compare float32 inputs, and thresholds can land exactly on a training value,
+    so `threshold * scale + mean` is off by a rounding step. The condition is monotonic in x,
+    so bisect for the largest raw x that still satisfies it.
+    """
+    def holds(x):
+        return ((x - mean) / scale).astype(np.float32) <= threshold
+
+    guess = threshold * scale + mean
+    delta = (np.abs(threshold) + 1.0) * scale * 2.0 ** -20
+    lo, hi = guess - delta, guess + delta
+    if not holds(lo).all() or holds(hi).any():
+        raise ValueError("Could not fold scaler into split thresholds")
+    for _ in range(64):
+        mid = lo + (hi - lo) / 2
+        ok = holds(mid)
+        lo = np.where(ok, mid, lo)
+        hi = np.where(ok, hi, mid)
+    return lo
+
+
+def compile_pipeline(pipeline):
+    """Compile a fitted `Pipeline(preprocess, regressor)` into a `CompiledNutritionModel`."""
+    if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+        raise ValueError("Expected a fitted Pipeline with a preprocess and a regressor step")
+    preprocess = pipeline.steps[0][1]
+    regressor = pipeline.steps[-1][1]
+
+    numeric_cols, means, scales, categorical = _unpack_preprocess(preprocess)
+    layout, n_features = _output_layout(preprocess, numeric_cols, categorical)
+    trees, n_outputs = _collect_trees(regressor)
+
+    # Per-tree value width: 1 for MultiOutputRegressor forests, n_outputs for native multi-output forests
+    k = trees[0][0].value.shape[1]
+    n_trees = len(trees)
+    trees_per_output = np.zeros(n_outputs)
+    for _, output in trees:
+        if output is None:
+            trees_per_output += 1
+        else:
+            trees_per_output[output] += 1
+
+    n_nodes = sum(t.node_count for t, _ in trees)
+    children = np.empty((n_nodes, 2), dtype=np.int32)
+    feature = np.zeros(n_nodes, dtype=np.int32)
+    threshold = np.zeros(n_nodes, dtype=np.float64)
+    value = np.empty((n_nodes, k), dtype=np.float64)
+    roots = np.empty(n_trees, dtype=np.int32)
+    weights = np.zeros((n_trees * k, n_outputs), dtype=np.float64)
+
+    layout_index = np.array([idx for idx, _ in layout], dtype=np.int32)
+    layout_numeric = np.array([is_num for _, is_num in layout], dtype=bool)
+    numeric_mean = np.zeros(len(layout))
+    numeric_scale = np.ones(len(layout))
+    numeric_mean[layout_numeric] = means[layout_index[layout_numeric]]
+    numeric_scale[layout_numeric] = scales[layout_index[layout_numeric]]
+
+    offset = 0
+    max_depth = 0
+    for t, (tree, output) in enumerate(trees):
+        n = tree.node_count
+        own = np.arange(offset, offset + n, dtype=np.int32)
+        is_leaf = tree.children_left == -1
+        split_feature = np.where(is_leaf, 0, tree.feature)
+
+        children[offset:offset + n, 0] = np.where(is_leaf, own, tree.children_left + offset)
+        children[offset:offset + n, 1] = np.where(is_leaf, own, tree.children_right + offset)
+        feature[offset:offset + n] = layout_index[split_feature]
+        # Fold the scaler into numeric thresholds; one-hot splits keep their 0.5 threshold
+        node_threshold = np.where(is_leaf, 0.0, tree.threshold)
+        folded = ~is_leaf & layout_numeric[split_feature]
+        node_threshold[folded] = _fold_thresholds(
+            tree.threshold[folded], numeric_mean[split_feature[folded]], numeric_scale[split_feature[folded]]
+        )
+        threshold[offset:offset + n] = node_threshold
+        value[offset:offset + n] = tree.value[:, :, 0]
+        roots[t] = offset
+
+        if output is None:
+            weights[t * k + np.arange(k), np.arange(n_outputs)] = 1.0 / trees_per_output
+        else:
+            weights[t * k, output] = 1.0 / trees_per_output[output]
+
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n
+
+    categorical_tables = []
+    cat_offset = len(numeric_cols)
+    for col, categories in categorical:
+        categorical_tables.append((col, {c: cat_offset + i for i, c in enumerate(categories)}))
+        cat_offset += len(categories)
+
+    return CompiledNutritionModel(
+        numeric_cols=numeric_cols,
+        categorical_tables=categorical_tables,
+        n_features=n_features,
+        children=children,
+        feature=feature,
+        threshold=threshold,
+        value=value,
+        roots=roots,
+        weights=weights,
+        max_depth=max_depth,
+    )
+
+
+def load_compiled_model(path="artifacts/nutrition_model.pkl"):
+    """Load the joblib pipeline from `path` and compile it."""
+    return compile_pipeline(joblib.load(path))
+
+
+def _version_dirs(parent, name):
+    prefix = f"{name}.v"
+    return [d for d in os.listdir(parent) if d.startswith(prefix) and d[len(prefix):].replace("-", "").isdigit()]
+
+
+def save_compiled(model, directory, source=None):
+    """
+    Write the compiled arrays to `directory` as uncompressed .npy files (mmap-able).
+
+    `source` is recorded in the manifest so loaders can tell when the directory is
+    stale relative to the pickle it was compiled from. Every export is written under
+    a private temporary name, renamed to its own version (`<directory>.v<ns>-<pid>`),
+    and `directory` is a symlink that is atomically re-pointed at it, so a concurrent
+    loader sees either the old or the new copy, never a missing or half-written one.
+    Publishing and pruning run under a file lock so exporting workers don't remove
+    each other's versions; the previous version is kept for loaders that already
+    resolved the old link.
+    """
+    parent, name = os.path.split(os.path.abspath(directory))
+    tmp = os.path.join(parent, f"{name}.tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for field in ARRAY_FIELDS:
+        np.save(os.path.join(tmp, f"{field}.npy"), np.ascontiguousarray(getattr(model, field)))
+
+    manifest = {
+        "numeric_cols": list(model.numeric_cols),
+        "categorical_tables": [[col, list(table.items())] for col, table in model.categorical_tables],
+        "n_features": int(model.n_features),
+        "max_depth": int(model.max_depth),
+        "source": source,
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    with open(os.path.join(parent, f"{name}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        version = f"{name}.v{time.time_ns()}-{os.getpid()}"
+        os.replace(tmp, os.path.join(parent, version))
+
+        link = os.path.join(parent, f"{name}.link{os.getpid()}")
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(version, link)   # relative, so the artifacts dir can be moved as a whole
+        if os.path.isdir(directory) and not os.path.islink(directory):
+            shutil.rmtree(directory)   # plain directory from before versioned exports (one-off)
+        previous = os.path.basename(os.path.realpath(directory)) if os.path.islink(directory) else None
+        os.replace(link, directory)
+
+        for old in _version_dirs(parent, name):
+            if old not in (version, previous):
+                shutil.rmtree(os.path.join(parent, old), ignore_errors=True)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, "manifest.json")) as f:
+        return json.load(f)
+
+
+def load_compiled(directory, mmap_mode="r"):
+    """
+    Load a model written by `save_compiled`. Arrays are memory-mapped unless mmap_mode=None.
+
+    The link is resolved once so the manifest and every array come from the same
+    version; if that version is pruned mid-load, the link is resolved again.
+    """
+    for attempt in range(3):
+        resolved = os.path.realpath(directory)
+        try:
+            manifest = read_manifest(resolved)
+            arrays = {
+                name: np.load(os.path.join(resolved, f"{name}.npy"), mmap_mode=mmap_mode)
+                for name in ARRAY_FIELDS
+            }
+            break
+        except FileNotFoundError:
+            if attempt == 2 or os.path.realpath(directory) == resolved:
+                raise
+    return CompiledNutritionModel(
+        numeric_cols=manifest["numeric_cols"],
+        categorical_tables=[(col, dict(pairs)) for col, pairs in manifest["categorical_tables"]],
+        n_features=manifest["n_features"],
+        max_depth=manifest["max_depth"],
+        **arrays,
+    )
@@ -1,15 +1,150 @@
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, exc
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+
+# CHANGE these (or set DATABASE_URL, e.g. sqlite:///./nutrition.db for local/test runs):
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "8771")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "nutrition_db")
+
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
+)
+
+# ✅ Pool tuning (ignored for in-memory SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))   # 0 = no limit
+
+# ✅ Async engine for /history and the save endpoints (needs asyncpg / aiosqlite installed)
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+
+class PoolWaitStats:
+    """How long callers waited to check a connection out of the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def record(self, wait_s, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.total_wait_s += wait_s
+            self.max_wait_s = max(self.max_wait_s, wait_s)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait_s / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_s * 1000, 3),
+            }
+
+
+class _TimedCheckoutMixin:
+    wait_stats = None
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - t0, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - t0)
+        return conn
+
 
-# CHANGE these:
-DB_USER = "postgres"
-DB_PASSWORD = "8771"
-DB_HOST = "localhost"
-DB_PORT = "5432"
-DB_NAME = "nutrition_db"
+sync_pool_stats = PoolWaitStats()
+async_pool_stats = PoolWaitStats()
 
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL, echo=False)
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    wait_stats = sync_pool_stats
+
+
+class TimedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    wait_stats = async_pool_stats
+
+
+def to_async_url(url: str) -> str:
+    """postgresql+psycopg2:// -> postgresql+asyncpg://, sqlite:// -> sqlite+aiosqlite://"""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    driver = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}.get(dialect)
+    if driver is None:
+        raise ValueError(f"No async driver configured for '{dialect}'")
+    return f"{dialect}+{driver}{sep}{rest}"
+
+
+def engine_kwargs(url: str, is_async: bool = False) -> dict:
+    dialect = url.split("://")[0]
+    if dialect.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}
+        if ":memory:" in url or url.rstrip("/").endswith(":"):
+            # one shared connection, otherwise every checkout sees an empty database
+            return {"poolclass": StaticPool, "connect_args": connect_args}
+    elif "asyncpg" in dialect:
+        connect_args = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    elif dialect.startswith("postgresql"):
+        connect_args = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    else:
+        connect_args = {}
+
+    return {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+engine = create_engine(DATABASE_URL, echo=False, **engine_kwargs(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **engine_kwargs(ASYNC_DATABASE_URL, is_async=True))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def pool_status() -> dict:
+    """Pool occupancy and checkout wait times for the sync (and async, if enabled) engine."""
+    def describe(pool, stats):
+        status = {"class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            status.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        if isinstance(pool, _TimedCheckoutMixin):
+            status.update(stats.snapshot())
+        return status
+
+    status = {"sync": describe(engine.pool, sync_pool_stats)}
+    if async_engine is not None:
+        status["async"] = describe(async_engine.pool, async_pool_stats)
+    return status
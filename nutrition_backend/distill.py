@@ -0,0 +1,228 @@
+"""
+Distil the nutrition forest into a small surrogate (surrogate.py).
+
+train.py's train split is divided again into a fit part and a validation part. The
+teacher pipeline labels an augmented synthetic grid drawn around the fit part: real
+rows resampled with jitter, some numeric values drawn uniformly over their observed
+range, categories and flags occasionally swapped. Linear (poly2 + ridge) and small
+MLP students are fitted to those labels and scored on the validation part. The table
+(accuracy, fidelity to the teacher, single-row latency, size) marks the
+accuracy-vs-latency Pareto front and goes to artifacts/distill_pareto.csv.
+
+The most accurate student on validation inside --latency-budget-ms is saved, and only
+that student and the teacher are scored on train.py's held-out split, so the reported
+holdout R2 is not inflated by the selection. It can be served by app.py:
+
+    python distill.py --synthetic 20000
+    NUTRITION_SURROGATE_PATH=artifacts/nutrition_surrogate.npz uvicorn app:app
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.linear_model import Ridge
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.neural_network import MLPRegressor
+
+from model_loader import ARTIFACT_DIR, MODEL_TYPES, artifact_path, load_model
+from surrogate import SurrogateModel, base_features, save_surrogate
+from train import (categorical_features, feature_cols, load_dataset, numeric_features,
+                   split_dataset, target_cols)
+
+SURROGATE_PATH = os.path.join(ARTIFACT_DIR, "nutrition_surrogate.npz")
+
+# integer-valued inputs are rounded after jitter
+INTEGER_COLS = ["age", "has_diabetes", "has_hypertension", "steps_per_day", "active_minutes"]
+BINARY_COLS = ["has_diabetes", "has_hypertension"]
+
+# name -> (poly2 features?, hidden layer sizes, ridge alpha)
+STUDENTS = {
+    "linear": (False, (), 1.0),
+    "linear_poly2": (True, (), 1.0),
+    "mlp_16": (False, (16,), None),
+    "mlp_32": (False, (32,), None),
+    "mlp_64x32": (False, (64, 32), None),
+}
+
+
+def augment(X, n, seed=42, jitter=0.25, uniform_frac=0.2, swap_frac=0.2):
+    """n synthetic input rows around the empirical distribution of X."""
+    rng = np.random.default_rng(seed)
+    out = X.iloc[rng.integers(0, len(X), n)].reset_index(drop=True).copy()
+
+    for col in numeric_features:
+        values = X[col].to_numpy(dtype=np.float64)
+        lo, hi = values.min(), values.max()
+        if col in BINARY_COLS:
+            swap = rng.random(n) < swap_frac
+            out.loc[swap, col] = rng.choice(values, swap.sum())
+            continue
+        new = out[col].to_numpy(dtype=np.float64) + rng.normal(0, jitter * values.std(), n)
+        uniform = rng.random(n) < uniform_frac
+        new[uniform] = rng.uniform(lo, hi, uniform.sum())
+        new = np.clip(new, lo, hi)
+        out[col] = np.round(new) if col in INTEGER_COLS else new
+
+    for col in categorical_features:
+        swap = rng.random(n) < swap_frac
+        out.loc[swap, col] = rng.choice(X[col].unique(), swap.sum())
+    return out[feature_cols]
+
+
+def _pairs(n):
+    i, j = np.triu_indices(n)
+    return np.stack([i, j], axis=1).astype(np.int32)
+
+
+def fit_student(name, F, Y, categories, seed=42):
+    """Fit one student on base features F (unscaled) and teacher outputs Y."""
+    poly, hidden, alpha = STUDENTS[name]
+    mean, scale = F.mean(axis=0), F.std(axis=0)
+    scale[scale == 0] = 1.0
+    y_mean, y_scale = Y.mean(axis=0), Y.std(axis=0)
+
+    z = (F - mean) / scale
+    pairs = _pairs(F.shape[1]) if poly else None
+    if pairs is not None:
+        z = np.hstack([z, z[:, pairs[:, 0]] * z[:, pairs[:, 1]]])
+    target = (Y - y_mean) / y_scale
+
+    if not hidden:
+        reg = Ridge(alpha=alpha).fit(z, target)
+        layers = [(reg.coef_.T.copy(), reg.intercept_.copy())]
+    else:
+        reg = MLPRegressor(hidden_layer_sizes=hidden, alpha=1e-4, max_iter=300, early_stopping=True,
+                           random_state=seed).fit(z, target)
+        layers = [(W, b) for W, b in zip(reg.coefs_, reg.intercepts_)]
+
+    return SurrogateModel(
+        kind=name,
+        numeric_cols=list(numeric_features),
+        categories=categories,
+        mean=mean, scale=scale, pairs=pairs, layers=layers,
+        y_mean=y_mean, y_scale=y_scale,
+    )
+
+
+def _single_row_ms(predict_one, records, repeat=200):
+    predict_one(records[0])   # warm up
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        predict_one(records[i % len(records)])
+        times.append(time.perf_counter() - t0)
+    return np.percentile(times, 50) * 1000
+
+
+def _scores(name, pred, y_val, teacher_pred):
+    row = {
+        "model": name,
+        "val_r2": r2_score(y_val.values, pred, multioutput="uniform_average"),
+        "teacher_fidelity_r2": r2_score(teacher_pred, pred, multioutput="uniform_average"),
+    }
+    for i, col in enumerate(target_cols):
+        row[f"mae_{col}"] = mean_absolute_error(y_val[col].values, pred[:, i])
+    return row
+
+
+def pareto_front(table, cost="single_ms", gain="val_r2"):
+    """True for rows no other row beats on both cost (lower) and gain (higher)."""
+    flags = []
+    for _, r in table.iterrows():
+        dominated = (
+            (table[cost] <= r[cost]) & (table[gain] >= r[gain])
+            & ((table[cost] < r[cost]) | (table[gain] > r[gain]))
+        ).any()
+        flags.append(not dominated)
+    return flags
+
+
+def distill(teacher_type="multioutput_rf", n_synthetic=20_000, latency_budget_ms=1.0, output=SURROGATE_PATH, seed=42):
+    X, y = load_dataset()
+    X_train, X_test, y_train, y_test = split_dataset(X, y)
+    # ✅ Students are picked on a validation split; the held-out split is only used to report the pick
+    X_fit, X_val, _, y_val = train_test_split(X_train, y_train, test_size=0.2, random_state=seed)
+
+    teacher, teacher_compiled = load_model(teacher_type, compiled=True, mmap=False)
+
+    # ✅ Teacher labels on real fit rows + synthetic grid (never the validation or held-out split)
+    t0 = time.perf_counter()
+    grid = pd.concat([X_fit, augment(X_fit, n_synthetic, seed)], ignore_index=True)
+    Y = teacher.predict(grid)
+    print(f"Teacher labelled {len(grid):,} rows in {time.perf_counter() - t0:.1f}s")
+
+    categories = [(col, sorted(X_train[col].unique())) for col in categorical_features]
+    F = base_features(grid, len(grid), list(numeric_features), categories)
+    teacher_val = teacher.predict(X_val)
+    records = X_val.to_dict("records")
+
+    rows = []
+    teacher_name = f"teacher ({teacher_type})"
+    teacher_row = _scores(teacher_name, teacher_val, y_val, teacher_val)
+    predict_one = teacher_compiled.predict_one if teacher_compiled is not None else (
+        lambda r: teacher.predict(pd.DataFrame([r]))[0])
+    teacher_row.update(single_ms=_single_row_ms(predict_one, records),
+                       size_kb=os.path.getsize(artifact_path(teacher_type)) / 1024, params=None)
+    rows.append(teacher_row)
+
+    students = {}
+    for name in STUDENTS:
+        t0 = time.perf_counter()
+        student = fit_student(name, F, Y, categories, seed)
+        fit_s = time.perf_counter() - t0
+        students[name] = student
+        row = _scores(name, student.predict(X_val), y_val, teacher_val)
+        row.update(single_ms=_single_row_ms(student.predict_one, records),
+                   size_kb=student.n_bytes / 1024, params=student.n_params, fit_s=fit_s)
+        rows.append(row)
+
+    table = pd.DataFrame(rows).sort_values("single_ms").reset_index(drop=True)
+    table["pareto"] = pareto_front(table)
+
+    eligible = table[table["model"].isin(students.keys()) & (table["single_ms"] <= latency_budget_ms)]
+    if eligible.empty:
+        raise SystemExit(f"No surrogate predicts within {latency_budget_ms} ms")
+    best = eligible.sort_values("val_r2", ascending=False).iloc[0]
+    surrogate = students[best["model"]]
+
+    # ✅ Held-out split, scored once: the teacher and the selected surrogate only
+    teacher_test = teacher.predict(X_test)
+    holdout = {
+        teacher_name: r2_score(y_test.values, teacher_test, multioutput="uniform_average"),
+        best["model"]: r2_score(y_test.values, surrogate.predict(X_test), multioutput="uniform_average"),
+    }
+    table["holdout_r2"] = table["model"].map(holdout)
+
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    table_path = os.path.join(ARTIFACT_DIR, "distill_pareto.csv")
+    table.to_csv(table_path, index=False)
+
+    print("\n=== Accuracy vs latency (validation split) ===")
+    cols = ["model", "val_r2", "teacher_fidelity_r2", "mae_daily_kcal_need", "single_ms", "size_kb", "pareto"]
+    print(table[cols].round(4).to_string(index=False))
+    print("(the teacher was trained on the validation rows, so its val_r2 is in-sample)")
+    print(f"\n✅ Table saved to: {table_path}")
+
+    save_surrogate(surrogate, output)
+    print(f"✅ Surrogate {best['model']} (val R2 {best['val_r2']:.3f}, holdout R2 {holdout[best['model']]:.3f}, "
+          f"{best['single_ms']:.3f} ms; teacher holdout R2 {holdout[teacher_name]:.3f}) saved to: {output}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil the nutrition forest into a small surrogate")
+    parser.add_argument("--teacher", choices=list(MODEL_TYPES), default="multioutput_rf")
+    parser.add_argument("--synthetic", type=int, default=20_000, help="synthetic rows labelled by the teacher")
+    parser.add_argument("--latency-budget-ms", type=float, default=1.0, help="single-row latency budget for the saved surrogate")
+    parser.add_argument("--output", default=SURROGATE_PATH)
+    args = parser.parse_args()
+
+    distill(args.teacher, args.synthetic, args.latency_budget_ms, args.output)
+
+
+if __name__ == "__main__":
+    main()
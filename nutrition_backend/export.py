@@ -0,0 +1,126 @@
+"""
+Streaming export of the `predictions` table (compliance dumps).
+
+Rows are read through a server-side cursor (`stream_results` + `yield_per`, a named
+cursor on Postgres) and encoded chunk by chunk, so memory stays constant however
+many rows match. Output is CSV or NDJSON, optionally gzip-compressed on the fly.
+
+    python export.py --user-id user_000042 -o user_000042.csv
+    python export.py --start 2024-01-01 --end 2024-02-01 --format ndjson -o jan.ndjson.gz
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import Prediction
+
+EXPORT_COLUMNS = list(Prediction.__table__.columns)
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+DEFAULT_CHUNK_SIZE = 5_000
+
+
+def export_query(user_id: str = None, start: datetime = None, end: datetime = None):
+    """Predictions for `user_id` (all users if None) with start <= created_at < end, by id."""
+    stmt = select(*EXPORT_COLUMNS)
+    if user_id is not None:
+        stmt = stmt.where(Prediction.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(Prediction.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Prediction.created_at < end)
+    return stmt.order_by(Prediction.id)
+
+
+def stream_rows(engine, stmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of at most chunk_size rows from a server-side cursor."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for partition in result.partitions():
+            yield partition
+
+
+def _csv_chunks(partitions):
+    names = [c.name for c in EXPORT_COLUMNS]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    yield buf.getvalue().encode()
+    for rows in partitions:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _ndjson_chunks(partitions):
+    for rows in partitions:
+        yield "".join(
+            json.dumps(dict(row._mapping), default=_json_default) + "\n" for row in rows
+        ).encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into one gzip stream, chunk by chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)   # wbits=31: gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def encode_export(partitions, fmt="csv", gzip=False):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+    chunks = _csv_chunks(partitions) if fmt == "csv" else _ndjson_chunks(partitions)
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream predictions to CSV or NDJSON")
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="created_at >= (ISO date/time)")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="created_at < (ISO date/time)")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("-o", "--output", default="-", help="file path ('.gz' suffix compresses), or - for stdout")
+    parser.add_argument("--gzip", action="store_true", help="compress even without a .gz suffix")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from db import engine
+
+    gzip = args.gzip or args.output.endswith(".gz")
+    stmt = export_query(args.user_id, args.start, args.end)
+    rows = 0
+
+    def counted(partitions):
+        nonlocal rows
+        for partition in partitions:
+            rows += len(partition)
+            yield partition
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in encode_export(counted(stream_rows(engine, stmt, args.chunk_size)), args.format, gzip):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"✅ Exported {rows:,} predictions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+
+from models import Prediction
+
+# ✅ Only the columns /history returns (no ORM object hydration)
+HISTORY_COLUMNS = [
+    Prediction.id,
+    Prediction.user_id,
+    Prediction.created_at,
+    Prediction.daily_kcal_need,
+    Prediction.protein_g_per_day,
+    Prediction.carbs_g_per_day,
+    Prediction.fat_g_per_day,
+]
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque keyset cursor for the row a page ended on."""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor. Raises ValueError for anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def history_page_query(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None):
+    """
+    Newest-first page of a user's predictions, served from ix_predictions_user_created.
+
+    Fetches limit + 1 rows so the caller can tell whether there is a next page.
+    """
+    stmt = select(*HISTORY_COLUMNS).where(Prediction.user_id == user_id)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(Prediction.created_at, Prediction.id) < tuple_(created_at, row_id))
+    return (
+        stmt.order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        .limit(limit + 1)
+    )
+
+
+def split_page(rows, limit: int):
+    """Turn the limit + 1 fetched rows into (items, next_cursor)."""
+    items = [dict(r._mapping) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return items, next_cursor
@@ -0,0 +1,76 @@
+import threading
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from models import PREDICTION_ID_BLOCK, IdCounter, Prediction, prediction_id_seq
+
+
+class IdAllocator:
+    """
+    Hands out unique Prediction ids without a per-request query.
+
+    Ids are reserved PREDICTION_ID_BLOCK at a time, from `prediction_id_seq` where
+    the database has sequences (Postgres) or from the `id_counters` row otherwise.
+    Both are atomic across workers and hosts, unlike `SELECT max(id) + 1`.
+    Ids are unique and increasing per worker but not gap-free.
+    """
+
+    def __init__(self, engine, block_size=PREDICTION_ID_BLOCK):
+        self.engine = engine
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve_block()
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve_block(self) -> int:
+        if self.engine.dialect.supports_sequences:
+            with self.engine.begin() as conn:
+                return conn.scalar(select(prediction_id_seq.next_value()))
+        return self._reserve_from_counter()
+
+    def _reserve_from_counter(self) -> int:
+        counter = IdCounter.__table__
+        with self.engine.begin() as conn:
+            end = conn.scalar(
+                update(counter)
+                .where(counter.c.name == Prediction.__tablename__)
+                .values(next_value=counter.c.next_value + self.block_size)
+                .returning(counter.c.next_value)
+            )
+            if end is not None:
+                return end - self.block_size
+
+        # First allocation: start after any rows saved before the counter existed
+        try:
+            with self.engine.begin() as conn:
+                start = (conn.scalar(select(func.max(Prediction.id))) or 0) + 1
+                conn.execute(counter.insert().values(
+                    name=Prediction.__tablename__, next_value=start + self.block_size
+                ))
+            return start
+        except IntegrityError:
+            # another worker created the counter first; reserve from it instead
+            return self._reserve_from_counter()
+
+
+def sync_sequence(engine):
+    """Move `prediction_id_seq` past existing rows and reserved blocks (run from init_db.py)."""
+    if not engine.dialect.supports_sequences:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            "SELECT setval('prediction_id_seq', GREATEST("
+            "(SELECT COALESCE(MAX(id), 0) + 1 FROM predictions), "
+            "(SELECT CASE WHEN is_called THEN last_value + :block ELSE last_value END FROM prediction_id_seq)"
+            "), false)"
+        ), {"block": PREDICTION_ID_BLOCK})
@@ -1,5 +1,11 @@
 from db import engine, Base
+from id_allocator import sync_sequence
+from migrations import apply_migrations
+from partitions import maintain
 import models
 
 Base.metadata.create_all(bind=engine)
+apply_migrations(engine)
+maintain(engine)   # monthly partitions of predictions (Postgres) + retention policy
+sync_sequence(engine)
 print("✅ Tables created successfully!")
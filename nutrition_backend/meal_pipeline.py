@@ -0,0 +1,113 @@
+"""
+Profile -> nutrition needs -> meal plan, in one process.
+
+Runs the nutrition predictor, turns the predicted macro grams into the calorie
+target and `target_macro_ratios` the meal planner expects, and calls the meal
+backend's planner (through its plan cache) directly, so the frontend needs one
+request instead of /predict followed by /api/suggest-meals.
+
+The planner is imported from the meal backend checkout (MEAL_BACKEND_DIR, default
+the sibling "meal prediction - backend" directory) on first use; it only needs
+pandas + openpyxl and the dataset/ folder, not TensorFlow.
+"""
+
+import os
+import sys
+import threading
+import time
+
+MEAL_BACKEND_DIR = os.getenv(
+    "MEAL_BACKEND_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "meal prediction - backend"),
+)
+
+KCAL_PER_GRAM = {"protein": 4, "carb": 4, "fat": 9}
+
+_planner = None
+_planner_lock = threading.Lock()
+
+
+def load_planner():
+    """(get_meal_plan, format_meal_suggestions) from the meal backend; RuntimeError if unavailable."""
+    global _planner
+    if _planner is None:
+        with _planner_lock:
+            if _planner is None:
+                path = os.path.abspath(MEAL_BACKEND_DIR)
+                if path not in sys.path:
+                    sys.path.append(path)
+                try:
+                    from services.meal_plan_predictor import format_meal_suggestions
+                    from services.plan_cache import get_meal_plan
+                except ImportError as e:
+                    raise RuntimeError(f"Meal planner not importable from {path}: {e}") from e
+                _planner = (get_meal_plan, format_meal_suggestions)
+    return _planner
+
+
+def needs_from_prediction(pred) -> dict:
+    """Round a model output row the same way /predict does."""
+    return {
+        "daily_kcal_need": int(round(float(pred[0]))),
+        "protein_g_per_day": round(float(pred[1]), 1),
+        "carbs_g_per_day": round(float(pred[2]), 1),
+        "fat_g_per_day": round(float(pred[3]), 1),
+    }
+
+
+def macro_ratios(protein_g: float, carbs_g: float, fat_g: float) -> dict:
+    """Share of macro calories from each macro, summing to 1 (planner's `target_macro_ratios`)."""
+    kcal = {
+        "fat": fat_g * KCAL_PER_GRAM["fat"],
+        "carb": carbs_g * KCAL_PER_GRAM["carb"],
+        "protein": protein_g * KCAL_PER_GRAM["protein"],
+    }
+    total = sum(kcal.values())
+    if total <= 0:
+        return None   # let the planner use its defaults
+    return {macro: round(v / total, 4) for macro, v in kcal.items()}
+
+
+def plan_targets(needs: dict) -> dict:
+    return {
+        "total_calories": float(needs["daily_kcal_need"]),
+        "target_macro_ratios": macro_ratios(
+            needs["protein_g_per_day"], needs["carbs_g_per_day"], needs["fat_g_per_day"]
+        ),
+    }
+
+
+def run_pipeline(profile: dict, predict, meals_per_day: int = 3, calorie_distribution_ratios=None) -> dict:
+    """
+    `predict(profile) -> [kcal, protein_g, carbs_g, fat_g]` (e.g. app.predict_nutrition).
+    Returns needs, planner targets, formatted meals and per-stage timings in ms.
+    """
+    get_meal_plan, format_meal_suggestions = load_planner()
+    timings = {}
+    started = time.perf_counter()
+
+    t0 = time.perf_counter()
+    needs = needs_from_prediction(predict(profile))
+    timings["predict_ms"] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    targets = plan_targets(needs)
+    timings["targets_ms"] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    plan = get_meal_plan(
+        targets["total_calories"], meals_per_day, calorie_distribution_ratios, targets["target_macro_ratios"]
+    )
+    timings["plan_ms"] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    meals = format_meal_suggestions(plan, meals_per_day)
+    timings["format_ms"] = (time.perf_counter() - t0) * 1000
+
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    return {
+        "needs": needs,
+        "targets": targets,
+        "meals": meals,
+        "timings_ms": {k: round(v, 3) for k, v in timings.items()},
+    }
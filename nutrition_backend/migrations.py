@@ -0,0 +1,105 @@
+"""
+Idempotent schema migrations for databases created before a model change.
+
+`Base.metadata.create_all` only creates missing tables, so anything that alters an
+existing table (new indexes, dropped indexes, ...) goes here. init_db.py applies
+pending migrations in order and records them in `schema_migrations`.
+
+The Postgres-only migrations (002 partitioning, 003 created_at default) have only been
+checked against compiled DDL, not run on a live server: dry-run them on a restored copy
+of production before deploying.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select, text
+
+from partitions import ensure_partitions, is_partitioned
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("name", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_index(engine, sql, table="predictions"):
+    """CREATE INDEX, without locking writes on Postgres (CONCURRENTLY needs autocommit)."""
+    with engine.connect() as conn:
+        partitioned = is_partitioned(conn, table)
+    # partitioned parents can't be indexed CONCURRENTLY (the index cascades to each partition)
+    if engine.dialect.name == "postgresql" and not partitioned:
+        sql = sql.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(sql))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(sql))
+
+
+def m001_history_keyset_index(engine):
+    # /history filters on user_id and pages by (created_at, id) descending
+    _create_index(
+        engine,
+        "CREATE INDEX IF NOT EXISTS ix_predictions_user_created "
+        "ON predictions (user_id, created_at DESC, id DESC)",
+    )
+    # the composite index covers plain user_id lookups too
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_predictions_user_id"))
+
+
+def m002_partition_predictions(engine):
+    # Postgres: rebuild `predictions` as a table range-partitioned by month on created_at
+    if engine.dialect.name != "postgresql":
+        return
+    from models import Prediction
+
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return
+        old = "predictions_unpartitioned"
+        conn.execute(text(f"ALTER TABLE predictions RENAME TO {old}"))
+        for index in ("predictions_pkey", "ix_predictions_id", "ix_predictions_user_created"):
+            conn.execute(text(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_old"))
+        Prediction.__table__.create(conn)
+
+        first = conn.scalar(text(f"SELECT MIN(created_at) FROM {old}"))
+        ensure_partitions(conn, since=first)
+        columns = ", ".join(c.name for c in Prediction.__table__.columns)
+        select_columns = columns.replace("created_at", "COALESCE(created_at, now() AT TIME ZONE 'utc')")
+        conn.execute(text(f"INSERT INTO predictions ({columns}) SELECT {select_columns} FROM {old}"))
+        conn.execute(text(f"DROP TABLE {old}"))
+
+
+def m003_created_at_server_default(engine):
+    # Postgres: created_at is in the primary/partition key; default it server-side too so
+    # inserts that bypass the ORM still land in a partition. SQLite can't alter defaults
+    # (the ORM always sets the value there).
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE predictions ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP)"))
+
+
+MIGRATIONS = [
+    ("001_history_keyset_index", m001_history_keyset_index),
+    ("002_partition_predictions", m002_partition_predictions),
+    ("003_created_at_server_default", m003_created_at_server_default),
+]
+
+
+def apply_migrations(engine):
+    _metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.name)).scalars())
+
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        migrate(engine)
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert().values(name=name, applied_at=datetime.utcnow()))
+        print(f"✅ Applied migration {name}")
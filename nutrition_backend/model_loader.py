@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+
+import joblib
+
+from compiled_model import compile_pipeline, load_compiled, read_manifest, save_compiled
+
+ARTIFACT_DIR = "artifacts"
+
+# ✅ Artifact file per training option (see train.py --model-type)
+MODEL_TYPES = {
+    "multioutput_rf": "nutrition_model.pkl",          # 4 x 400-tree forests (original baseline)
+    "native_rf": "nutrition_model_native_rf.pkl",     # 1 x 400-tree multi-output forest
+    "hgb": "nutrition_model_hgb.pkl",                 # 4 x HistGradientBoostingRegressor
+}
+
+
+def artifact_path(model_type: str) -> str:
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Unknown model type '{model_type}'. Choose one of: {', '.join(MODEL_TYPES)}")
+    return os.path.join(ARTIFACT_DIR, MODEL_TYPES[model_type])
+
+
+def compiled_dir(path: str) -> str:
+    """Where the mmap-able compiled layout of a pickle lives, e.g. artifacts/nutrition_model.compiled/"""
+    return os.path.splitext(path)[0] + ".compiled"
+
+
+def _source_stamp(path: str) -> dict:
+    st = os.stat(path)
+    return {"path": os.path.basename(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _is_fresh(directory: str, path: str) -> bool:
+    try:
+        return read_manifest(directory).get("source") == _source_stamp(path)
+    except (OSError, ValueError):
+        return False
+
+
+def export_compiled(pipeline, path: str) -> bool:
+    """Compile `pipeline` (saved at `path`) and write its mmap-able layout next to it."""
+    try:
+        compiled_model = compile_pipeline(pipeline)
+    except ValueError as e:
+        print(f"⚠️ No compiled layout for {path}: {e}")
+        return False
+    save_compiled(compiled_model, compiled_dir(path), source=_source_stamp(path))
+    return True
+
+
+def file_version(path: str):
+    """Cheap artifact version stamp: changes whenever the file is rewritten."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class ServingModel:
+    """
+    The served model and its generation, swapped as one unit.
+
+    `current()` returns (generation, pipeline, compiled_model); the generation starts
+    at 1 and goes up by one with every reload, so a newer model always has a larger
+    one. At most every `check_s` seconds (0 = never) it compares the artifact's
+    size/mtime with the file it loaded and, when the file changed, calls `load()` and
+    swaps the new model in. One
+    request thread does the reload while the others keep serving the old model;
+    callers hold on to the snapshot they got, so a request never mixes the two.
+    A failed load (e.g. a half-written file) keeps the old model and retries.
+    """
+
+    def __init__(self, load, path: str, check_s: float = 5.0):
+        self._load = load
+        self.path = path
+        self.check_s = check_s
+        self._file_version = file_version(path)
+        self._current = (1, *load())
+        self._checked_at = time.monotonic()
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def current(self):
+        if self.check_s and time.monotonic() - self._checked_at >= self.check_s \
+                and self._reload_lock.acquire(blocking=False):
+            try:
+                self._checked_at = time.monotonic()
+                self._reload_if_changed()
+            finally:
+                self._reload_lock.release()
+        return self._current
+
+    def _reload_if_changed(self):
+        version = file_version(self.path)
+        if version is None or version == self._file_version:
+            return
+        try:
+            loaded = self._load()
+        except Exception as e:
+            self.reload_errors += 1
+            print(f"⚠️ Reloading {self.path} failed, still serving the previous model: {e}")
+            return
+        self._file_version = version
+        self._current = (self._current[0] + 1, *loaded)
+        self.reloads += 1
+        print(f"✅ Reloaded model from {self.path}")
+
+
+def set_estimator_n_jobs(pipeline, n_jobs):
+    """Set n_jobs on every estimator in the pipeline that has it (forests, MultiOutputRegressor)."""
+    regressor = pipeline.steps[-1][1]
+    estimators = [regressor] + list(getattr(regressor, "estimators_", []))
+    for est in estimators:
+        if hasattr(est, "n_jobs"):
+            est.n_jobs = n_jobs
+    return pipeline
+
+
+class ThreadLimits:
+    """
+    BLAS and OpenMP thread caps (threadpoolctl), applied in each thread that predicts.
+
+    OpenMP's limit is per thread: a cap set in the main thread does not reach the
+    request threadpool's workers, which start with the default. Call the instance
+    before predicting; it sets the caps the first time it runs in a thread and is a
+    thread-local lookup after that.
+    """
+
+    def __init__(self, limits: dict):
+        self.limits = limits
+        self._local = threading.local()
+
+    def __call__(self):
+        if not getattr(self._local, "applied", False):
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=self.limits)
+            self._local.applied = True
+
+
+def apply_thread_limits(blas: int = None, openmp: int = None):
+    """
+    Cap BLAS and OpenMP thread pools, e.g. so numpy matmuls and HGB predict don't each
+    spawn one thread per core under concurrent requests. None leaves a pool alone.
+    Returns a ThreadLimits to call in every thread that predicts, or None if nothing is capped.
+    """
+    if blas is None and openmp is None:
+        return None
+    try:
+        import threadpoolctl  # noqa: F401
+    except ImportError:
+        print("⚠️ threadpoolctl not installed; BLAS/OpenMP thread limits ignored (pip install threadpoolctl)")
+        return None
+    limits = {}
+    if blas is not None:
+        limits["blas"] = blas
+    if openmp is not None:
+        limits["openmp"] = openmp
+    return ThreadLimits(limits)
+
+
+def thread_pools() -> list:
+    """[{user_api, internal_api, num_threads}] of the native thread pools, as seen from the calling thread."""
+    try:
+        from threadpoolctl import threadpool_info
+    except ImportError:
+        return []
+    return [
+        {k: info[k] for k in ("user_api", "internal_api", "num_threads")}
+        for info in threadpool_info()
+    ]
+
+
+def _memory_mb():
+    """(resident, shared) MB of this process, from /proc on Linux; (None, None) elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared = [int(v) for v in f.read().split()[:3]]
+    except (OSError, ValueError):
+        return None, None
+    page_mb = os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    return resident * page_mb, shared * page_mb
+
+
+def load_model(model_type: str = "multioutput_rf", path: str = None, compiled: bool = True, mmap: bool = True):
+    """
+    Load a trained nutrition model.
+
+    Returns (pipeline, compiled_model):
+    - compiled + mmap: the compiled arrays are memory-mapped read-only from
+      `compiled_dir(path)` (exported on first use if missing or stale), so workers on
+      the same host share one copy of the trees. pipeline is None; it is never loaded.
+    - compiled without mmap: pipeline is loaded and compiled in-process.
+    - compiled_model is None when compilation is disabled or the regressor has no
+      compiled form (e.g. the HGB variant); predictions then go through pipeline.
+    """
+    path = path or artifact_path(model_type)
+    t0 = time.perf_counter()
+
+    pipeline, compiled_model, source = None, None, path
+    directory = compiled_dir(path)
+    if compiled and mmap and _is_fresh(directory, path):
+        compiled_model = load_compiled(directory, mmap_mode="r")
+        source = f"{directory} (mmap)"
+
+    if compiled_model is None:
+        pipeline = joblib.load(path)
+        if compiled:
+            # compile once: unsupported regressors (e.g. HGB) skip both the export and the compiled path
+            try:
+                compiled_model = compile_pipeline(pipeline)
+            except ValueError as e:
+                print(f"⚠️ Serving {path} without compiled inference: {e}")
+        if compiled_model is not None and mmap:
+            try:
+                save_compiled(compiled_model, directory, source=_source_stamp(path))
+            except OSError as e:  # e.g. read-only artifacts dir: serve the in-process copy
+                print(f"⚠️ Could not write {directory}: {e}")
+            else:
+                # drop the private copies, serve from the shared mapping
+                pipeline = None
+                compiled_model = load_compiled(directory, mmap_mode="r")
+                source = f"{directory} (mmap)"
+
+    load_s = time.perf_counter() - t0
+    resident, shared = _memory_mb()
+    memory = f" | RSS {resident:.1f} MB (shared {shared:.1f} MB)" if resident is not None else ""
+    print(f"✅ Model loaded from {source} in {load_s:.2f}s{memory}")
+
+    return pipeline, compiled_model
@@ -1,12 +1,41 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Index, Sequence
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 from datetime import datetime
 from db import Base
 
+
+# ✅ Naive-UTC "now" as a server default (created_at is a timestamp without time zone,
+# so Postgres' now() would be shifted to the session time zone)
+class utcnow(FunctionElement):
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"   # SQLite: already UTC
+
+
+@compiles(utcnow, "postgresql")
+def _utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+# ✅ Race-free id allocation (see id_allocator.py): every nextval() reserves a block
+# of PREDICTION_ID_BLOCK ids for one worker, so most saves need no DB round trip.
+PREDICTION_ID_BLOCK = 100
+prediction_id_seq = Sequence(
+    "prediction_id_seq", start=1, increment=PREDICTION_ID_BLOCK, metadata=Base.metadata
+)
+
+# ✅ Range-partitioned by month on created_at in Postgres (see partitions.py); the partition
+# key has to be part of the primary key. Plain table elsewhere (SQLite).
 class Prediction(Base):
     __tablename__ = "predictions"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=False, index=True)   # from IdAllocator
+    user_id = Column(String)   # indexed together with created_at below
 
     age = Column(Integer)
     gender = Column(String)
@@ -30,4 +59,49 @@ class Prediction(Base):
     carbs_g_per_day = Column(Float)
     fat_g_per_day = Column(Float)
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Part of the primary key and the partition key, so it must never be NULL: the API
+    # sets it explicitly, and the server default covers rows inserted outside the ORM.
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow, server_default=utcnow())
+
+
+# ✅ /history: WHERE user_id = ? ORDER BY created_at DESC, id DESC (keyset pagination).
+# Existing databases get it from migrations.py.
+Index(
+    "ix_predictions_user_created",
+    Prediction.user_id,
+    Prediction.created_at.desc(),
+    Prediction.id.desc(),
+)
+
+
+# Block counter for databases without sequences (e.g. SQLite)
+class IdCounter(Base):
+    __tablename__ = "id_counters"
+
+    name = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False)
+
+
+# ✅ Per-user, per-day aggregates of predictions, maintained incrementally by rollups.py
+class PredictionDailyRollup(Base):
+    __tablename__ = "prediction_daily_rollups"
+
+    user_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+    sum_kcal = Column(Float, nullable=False)
+    min_kcal = Column(Float, nullable=False)
+    max_kcal = Column(Float, nullable=False)
+
+    sum_protein_g = Column(Float, nullable=False)
+    min_protein_g = Column(Float, nullable=False)
+    max_protein_g = Column(Float, nullable=False)
+
+    sum_carbs_g = Column(Float, nullable=False)
+    min_carbs_g = Column(Float, nullable=False)
+    max_carbs_g = Column(Float, nullable=False)
+
+    sum_fat_g = Column(Float, nullable=False)
+    min_fat_g = Column(Float, nullable=False)
+    max_fat_g = Column(Float, nullable=False)
@@ -0,0 +1,202 @@
+"""
+Monthly range partitions of `predictions` on created_at (Postgres).
+
+Partitions are named predictions_pYYYY_MM and cover [first of month, first of next
+month). `ensure_partitions` creates any missing ones from `since` (default: this
+month) up to PARTITION_MONTHS_AHEAD months ahead; the API runs it at startup and
+then every PARTITION_CHECK_INTERVAL_S. A DEFAULT partition (predictions_default)
+takes rows outside those months, e.g. old rows replayed from the write-behind
+dead letter, so such inserts never fail; when a month is created later, its rows
+are moved out of the default first. `apply_retention` removes whole partitions
+older than PREDICTIONS_RETENTION_MONTHS, either dropping them or detaching them
+into the `archive` schema (PREDICTIONS_RETENTION_ACTION=drop|archive). Both are
+metadata-only operations; only old rows that landed in the default partition are
+deleted (or moved) row by row.
+
+On SQLite (local runs, tests) the table is not partitioned: ensure_partitions is a
+no-op and retention falls back to a plain DELETE ("archive" is skipped).
+
+Run from cron (e.g. daily):
+    python partitions.py
+"""
+
+import os
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_CHECK_INTERVAL_S = float(os.getenv("PARTITION_CHECK_INTERVAL_S", "86400"))
+PREDICTIONS_RETENTION_MONTHS = int(os.getenv("PREDICTIONS_RETENTION_MONTHS", "0"))   # 0 = keep everything
+PREDICTIONS_RETENTION_ACTION = os.getenv("PREDICTIONS_RETENTION_ACTION", "drop")
+ARCHIVE_SCHEMA = "archive"
+
+TABLE = "predictions"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def _is_postgres(conn) -> bool:
+    return conn.dialect.name == "postgresql"
+
+
+def is_partitioned(conn, table=TABLE) -> bool:
+    if not _is_postgres(conn):
+        return False
+    return bool(conn.scalar(
+        text("SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+             "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"),
+        {"table": table},
+    ))
+
+
+def _attached(conn) -> list:
+    return list(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+    ), {"table": TABLE}).scalars())
+
+
+def list_partitions(conn) -> dict:
+    """{month: partition name} for the monthly partitions currently attached."""
+    prefix = f"{TABLE}_p"
+    out = {}
+    for name in _attached(conn):
+        if not name.startswith(prefix):
+            continue   # e.g. the default partition
+        try:
+            year, month = name[len(prefix):].split("_")
+            out[date(int(year), int(month), 1)] = name
+        except ValueError:
+            continue   # not one of ours
+    return out
+
+
+def ensure_partitions(conn, since=None, months_ahead=PARTITION_MONTHS_AHEAD, today=None) -> list:
+    """Create missing monthly partitions from `since` through `months_ahead` months after today."""
+    if not is_partitioned(conn):
+        return []
+    today = today or datetime.utcnow().date()
+    month = month_start(since or today)
+    last = add_months(month_start(today), months_ahead)
+    existing = list_partitions(conn)
+
+    created = []
+    has_default = DEFAULT_PARTITION in _attached(conn)
+    if not has_default:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+        created.append(DEFAULT_PARTITION)
+    while month <= last:
+        if month not in existing:
+            name = partition_name(month)
+            _create_month(conn, month, name, move_from_default=has_default)
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def _create_month(conn, month, name, move_from_default):
+    bounds = {"start": datetime.combine(month, datetime.min.time()),
+              "end": datetime.combine(add_months(month, 1), datetime.min.time())}
+    in_month = "created_at >= :start AND created_at < :end"
+    create = (f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} "
+              f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+    if not move_from_default or conn.scalar(
+            text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month} LIMIT 1"), bounds) is None:
+        conn.execute(text(create))
+        return
+    # Postgres refuses a new range while the default partition holds rows in it:
+    # detach the default, create the month, move its rows over, re-attach.
+    conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(create))
+    conn.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds)
+    conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds)
+    conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+def retention_cutoff(months=PREDICTIONS_RETENTION_MONTHS, today=None) -> date:
+    """Rows created before this date are past retention (whole months are kept)."""
+    today = today or datetime.utcnow().date()
+    return add_months(month_start(today), -months)
+
+
+def apply_retention(conn, months=PREDICTIONS_RETENTION_MONTHS, action=PREDICTIONS_RETENTION_ACTION, today=None) -> list:
+    """Drop or archive partitions entirely older than the retention window."""
+    if months <= 0:
+        return []
+    if action not in ("drop", "archive"):
+        raise ValueError(f"Unknown retention action '{action}'. Choose drop or archive.")
+    cutoff = retention_cutoff(months, today)
+
+    if not is_partitioned(conn):
+        if action == "archive":
+            print("⚠️ Archiving needs a partitioned Postgres table; skipping retention")
+            return []
+        deleted = conn.execute(
+            text(f"DELETE FROM {TABLE} WHERE created_at < :cutoff"), {"cutoff": datetime.combine(cutoff, datetime.min.time())}
+        ).rowcount
+        return [f"{deleted} rows"]
+
+    removed = []
+    for month, name in sorted(list_partitions(conn).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        if action == "drop":
+            conn.execute(text(f"DROP TABLE {name}"))
+        else:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+            conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+        removed.append(name)
+
+    # rows past retention that landed in the default partition
+    if DEFAULT_PARTITION not in _attached(conn):
+        return removed
+    old = {"cutoff": datetime.combine(cutoff, datetime.min.time())}
+    if action == "archive":
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{DEFAULT_PARTITION} (LIKE {TABLE} INCLUDING DEFAULTS)"
+        ))
+        conn.execute(text(
+            f"INSERT INTO {ARCHIVE_SCHEMA}.{DEFAULT_PARTITION} "
+            f"SELECT * FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff"
+        ), old)
+    moved = conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff"), old).rowcount
+    if moved:
+        removed.append(f"{moved} rows of {DEFAULT_PARTITION}")
+    return removed
+
+
+def maintain(engine, retention=True):
+    """Create upcoming partitions and (optionally) apply the retention policy."""
+    with engine.begin() as conn:
+        created = ensure_partitions(conn)
+    removed = []
+    if retention:
+        with engine.begin() as conn:
+            removed = apply_retention(conn)
+    if created:
+        print(f"✅ Created partitions: {', '.join(created)}")
+    if removed:
+        verb = "Archived" if PREDICTIONS_RETENTION_ACTION == "archive" else "Removed"
+        print(f"✅ {verb} past retention: {', '.join(removed)}")
+    return created, removed
+
+
+if __name__ == "__main__":
+    from db import engine
+    maintain(engine)
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ✅ Default quantization steps for noisy wearable fields (same units as UserInput)
+DEFAULT_BUCKETS = {
+    "steps_per_day": 250,
+    "avg_heart_rate": 2,
+    "stress_score": 5,
+}
+
+
+def parse_buckets(spec: str) -> dict:
+    """Parse "steps_per_day=250,avg_heart_rate=2" into {"steps_per_day": 250.0, ...}."""
+    buckets = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        field, _, step = part.partition("=")
+        buckets[field.strip()] = float(step)
+    return buckets
+
+
+class PredictionCache:
+    """
+    Bounded LRU + TTL cache in front of the (deterministic) nutrition model.
+
+    Inputs are canonicalized and, unless strict=True, fields listed in `buckets` are
+    snapped to the nearest multiple of their step. The model is then run on the
+    snapped input, so every request in a bucket gets the same answer no matter
+    which one arrived first.
+
+    Entries are keyed on the model version as well (the generation from
+    ServingModel.current(), which only goes up), so a reloaded model never serves its
+    predecessor's outputs; the cache is cleared when a newer version shows up. A
+    request still running on an older version computes without touching the cache.
+    """
+
+    def __init__(self, buckets=None, max_size=10_000, ttl_s=3600.0, strict=False):
+        self.buckets = {} if strict else dict(DEFAULT_BUCKETS if buckets is None else buckets)
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.strict = strict
+
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def canonicalize(self, data: dict) -> dict:
+        """Return the input the model will actually see for `data`."""
+        canonical = {}
+        for field in sorted(data):
+            value = data[field]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                canonical[field] = value
+                continue
+            step = self.buckets.get(field)
+            if step:
+                snapped = round(value / step) * step
+                value = int(snapped) if isinstance(value, int) else float(snapped)
+            canonical[field] = value
+        return canonical
+
+    def _key(self, canonical: dict, version):
+        return (version,) + tuple((field, float(v) if isinstance(v, (int, float)) else v)
+                                  for field, v in canonical.items())
+
+    def get_or_compute(self, data: dict, compute, version=None):
+        """
+        Return the cached prediction for `data`, calling compute(canonical_input) on a miss.
+        `version` identifies the model `compute` runs (increasing with every reload);
+        entries of other versions never match.
+        """
+        canonical = self.canonicalize(data)
+        key = self._key(canonical, version)
+        now = time.monotonic()
+
+        with self._lock:
+            # a snapshot taken before a reload never moves the cache back to its version
+            stale = self._version is not None and (version is None or version < self._version)
+            if not stale:
+                if version != self._version:
+                    self._version = version
+                    if self._entries:
+                        self._entries.clear()
+                        self.invalidations += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at > now:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return value
+                    del self._entries[key]
+                    self.expirations += 1
+            self.misses += 1
+
+        # Compute outside the lock; concurrent misses on the same key just both compute
+        value = compute(canonical)
+
+        with self._lock:
+            if version != self._version:
+                return value   # a newer model arrived while computing
+            self._entries[key] = (now + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "strict": self.strict,
+                "buckets": self.buckets,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def cache_from_env():
+    """Build the cache from NUTRITION_CACHE_* env vars; None unless NUTRITION_CACHE=1."""
+    if os.getenv("NUTRITION_CACHE", "0") != "1":
+        return None
+    buckets_spec = os.getenv("NUTRITION_CACHE_BUCKETS")
+    return PredictionCache(
+        buckets=parse_buckets(buckets_spec) if buckets_spec is not None else None,
+        max_size=int(os.getenv("NUTRITION_CACHE_MAX_SIZE", "10000")),
+        ttl_s=float(os.getenv("NUTRITION_CACHE_TTL_S", "3600")),
+        strict=os.getenv("NUTRITION_CACHE_STRICT", "0") == "1",
+    )
@@ -0,0 +1,162 @@
+"""
+Per-user daily rollups of predictions.
+
+`upsert_rollups` folds a batch of saved prediction rows into `prediction_daily_rollups`
+(count, sum, min, max per metric) with an executemany INSERT ... ON CONFLICT DO UPDATE, so the
+table stays current without rescanning `predictions`. The write-behind queue calls
+it in the same transaction as the insert.
+
+Backfill existing rows (with saves paused, or before enabling rollups):
+    python rollups.py --chunk-size 50000
+"""
+
+import argparse
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Prediction, PredictionDailyRollup
+
+# rollup metric -> Prediction column
+METRICS = {
+    "kcal": "daily_kcal_need",
+    "protein_g": "protein_g_per_day",
+    "carbs_g": "carbs_g_per_day",
+    "fat_g": "fat_g_per_day",
+}
+WINDOWS = (7, 30, 90)
+
+
+def _dialect_name(conn):
+    # works for both Connection and Session
+    return conn.get_bind().dialect.name if hasattr(conn, "get_bind") else conn.dialect.name
+
+
+def aggregate(rows):
+    """{(user_id, day): {count, sum_*, min_*, max_*}} for prediction row mappings."""
+    out = {}
+    for row in rows:
+        if row["created_at"] is None:
+            continue
+        key = (row["user_id"], row["created_at"].date())
+        agg = out.get(key)
+        if agg is None:
+            agg = out[key] = {"user_id": key[0], "day": key[1], "count": 0}
+            for metric, col in METRICS.items():
+                v = float(row[col])
+                agg[f"sum_{metric}"] = 0.0
+                agg[f"min_{metric}"] = v
+                agg[f"max_{metric}"] = v
+        agg["count"] += 1
+        for metric, col in METRICS.items():
+            v = float(row[col])
+            agg[f"sum_{metric}"] += v
+            agg[f"min_{metric}"] = min(agg[f"min_{metric}"], v)
+            agg[f"max_{metric}"] = max(agg[f"max_{metric}"], v)
+    return out
+
+
+def upsert_rollups(conn, rows):
+    """Add `rows` (dicts with user_id, created_at and the METRICS columns) to the rollups."""
+    aggregates = list(aggregate(rows).values())
+    if not aggregates:
+        return
+
+    dialect = _dialect_name(conn)
+    if dialect == "postgresql":
+        stmt = postgresql.insert(PredictionDailyRollup)
+        least, greatest = func.least, func.greatest
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(PredictionDailyRollup)
+        least, greatest = func.min, func.max   # scalar min()/max() with 2 args in SQLite
+    else:
+        raise ValueError(f"Rollup upsert not implemented for '{dialect}'")
+
+    table = PredictionDailyRollup.__table__
+    excluded = stmt.excluded
+    set_ = {"count": table.c.count + excluded.count}
+    for metric in METRICS:
+        set_[f"sum_{metric}"] = table.c[f"sum_{metric}"] + excluded[f"sum_{metric}"]
+        set_[f"min_{metric}"] = least(table.c[f"min_{metric}"], excluded[f"min_{metric}"])
+        set_[f"max_{metric}"] = greatest(table.c[f"max_{metric}"], excluded[f"max_{metric}"])
+
+    conn.execute(stmt.on_conflict_do_update(index_elements=["user_id", "day"], set_=set_), aggregates)
+
+
+def trends_query(user_id: str, as_of: date):
+    """All rollup days inside the largest window: one primary-key range read."""
+    start = as_of - timedelta(days=max(WINDOWS) - 1)
+    return (
+        select(PredictionDailyRollup)
+        .where(
+            PredictionDailyRollup.user_id == user_id,
+            PredictionDailyRollup.day >= start,
+            PredictionDailyRollup.day <= as_of,
+        )
+        .order_by(PredictionDailyRollup.day)
+    )
+
+
+def summarize_trends(rollups, as_of: date) -> dict:
+    """Rolling 7/30/90-day averages and min/max per metric from rollup rows."""
+    windows = {}
+    for days in WINDOWS:
+        start = as_of - timedelta(days=days - 1)
+        in_window = [r for r in rollups if r.day >= start]
+        count = sum(r.count for r in in_window)
+        summary = {"days_with_data": len(in_window), "predictions": count}
+        for metric in METRICS:
+            if count:
+                summary[metric] = {
+                    "avg": round(sum(getattr(r, f"sum_{metric}") for r in in_window) / count, 1),
+                    "min": min(getattr(r, f"min_{metric}") for r in in_window),
+                    "max": max(getattr(r, f"max_{metric}") for r in in_window),
+                }
+            else:
+                summary[metric] = None
+        windows[f"{days}d"] = summary
+    return {"as_of": as_of.isoformat(), "windows": windows}
+
+
+def backfill(engine, chunk_size=50_000, rebuild=True):
+    """Rebuild rollups from `predictions`, walking the table by id in chunks."""
+    columns = [Prediction.id, Prediction.user_id, Prediction.created_at] + [
+        getattr(Prediction, col) for col in METRICS.values()
+    ]
+    if rebuild:
+        with engine.begin() as conn:
+            conn.execute(delete(PredictionDailyRollup))
+
+    last_id, done = 0, 0
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(*columns).where(Prediction.id > last_id).order_by(Prediction.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            upsert_rollups(conn, [r._mapping for r in rows])
+        last_id = rows[-1].id
+        done += len(rows)
+        rate = done / (time.perf_counter() - started)
+        print(f"\rBackfilled {done:,} predictions ({rate:,.0f} rows/s)", end="", flush=True)
+    print(f"\n✅ Rollups built from {done:,} predictions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill prediction_daily_rollups from predictions")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--no-rebuild", action="store_true",
+                        help="add to existing rollups instead of clearing them first")
+    args = parser.parse_args()
+
+    from db import Base, engine
+    Base.metadata.create_all(bind=engine)
+    backfill(engine, chunk_size=args.chunk_size, rebuild=not args.no_rebuild)
+
+
+if __name__ == "__main__":
+    main()
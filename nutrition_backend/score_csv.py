@@ -0,0 +1,153 @@
+"""
+Bulk-score a CSV of user profiles with the saved nutrition model.
+
+The input is read in chunks, gaps are filled exactly as train.py fills them (medians
+come from the training CSV, so every chunk is treated the same way), chunks are
+scored across worker processes and written out in input order as they finish.
+At most `2 x workers` chunks are in flight, so memory stays flat however large
+the file is.
+
+    python score_csv.py population.csv scored.csv --chunk-size 50000 --workers 4
+    python score_csv.py population.csv scored.parquet      # needs pyarrow
+
+Rows still missing a feature after filling get empty predictions instead of
+failing the whole chunk.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_loader import MODEL_TYPES, load_model, set_estimator_n_jobs
+from train import DATA_PATH, feature_cols, fill_missing, missing_value_medians, target_cols
+
+PREDICTION_COLS = [f"pred_{col}" for col in target_cols]
+
+_pipeline = None   # per worker process
+
+
+def _init_worker(model_type, model_path):
+    global _pipeline
+    # one thread per process: the pool is the parallelism
+    _pipeline, _ = load_model(model_type, path=model_path, compiled=False)
+    set_estimator_n_jobs(_pipeline, 1)
+
+
+def score_chunk(chunk, medians):
+    """Fill gaps, predict and return `chunk` with PREDICTION_COLS appended."""
+    missing = [col for col in feature_cols if col not in chunk.columns]
+    if missing:
+        raise ValueError(f"Input is missing columns: {', '.join(missing)}")
+
+    chunk = fill_missing(chunk, medians)
+    preds = np.full((len(chunk), len(PREDICTION_COLS)), np.nan)
+    complete = chunk[feature_cols].notna().all(axis=1).to_numpy()
+    if complete.any():
+        preds[complete] = _pipeline.predict(chunk.loc[complete, feature_cols])
+
+    for i, col in enumerate(PREDICTION_COLS):
+        chunk[col] = preds[:, i]
+    return chunk, int((~complete).sum())
+
+
+class _CsvSink:
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        pass
+
+
+class _ParquetSink:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow") from e
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.writer = None
+
+    def write(self, df):
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_sink(path):
+    return _ParquetSink(path) if path.endswith(".parquet") else _CsvSink(path)
+
+
+def score_csv(input_path, output_path, model_type="multioutput_rf", model_path=None,
+              chunk_size=50_000, workers=None, medians=None):
+    workers = workers or os.cpu_count() or 1
+    medians = medians or missing_value_medians(pd.read_csv(DATA_PATH))
+    sink = open_sink(output_path)
+
+    done, incomplete = 0, 0
+    started = time.perf_counter()
+
+    def drain(future):
+        nonlocal done, incomplete
+        chunk, n_incomplete = future.result()
+        sink.write(chunk)
+        done += len(chunk)
+        incomplete += n_incomplete
+        rate = done / (time.perf_counter() - started)
+        print(f"\rScored {done:,} rows ({rate:,.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_type, model_path)) as pool:
+            in_flight = deque()
+            for chunk in pd.read_csv(input_path, chunksize=chunk_size):
+                in_flight.append(pool.submit(score_chunk, chunk, medians))
+                if len(in_flight) >= 2 * workers:
+                    drain(in_flight.popleft())
+            while in_flight:
+                drain(in_flight.popleft())
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    print(file=sys.stderr)
+    print(f"✅ Scored {done:,} rows in {elapsed:.1f}s ({done / elapsed:,.0f} rows/s) -> {output_path}")
+    if incomplete:
+        print(f"⚠️ {incomplete:,} rows had missing features and were left unscored")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV of user profiles with the nutrition model")
+    parser.add_argument("input", help="CSV with the training feature columns")
+    parser.add_argument("output", help="output .csv or .parquet (input columns + pred_* columns)")
+    parser.add_argument("--model-type", choices=list(MODEL_TYPES), default="multioutput_rf")
+    parser.add_argument("--model-path", default=None, help="override the artifact for --model-type")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: CPU count)")
+    args = parser.parse_args()
+
+    score_csv(args.input, args.output, model_type=args.model_type, model_path=args.model_path,
+              chunk_size=args.chunk_size, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Hyperparameter search for the nutrition model.
+
+Every candidate (forest / extra-trees / HGB settings) is cross-validated on the
+train split used by train.py, in parallel across at most --n-jobs cores (each fit
+is single-threaded, so the pool size is the core budget). The fitted
+ColumnTransformer features of each fold are cached on disk with joblib.Memory
+(keyed on the data), so preprocessing is fitted once per fold per dataset, not
+once per candidate or per run.
+
+Each candidate is then refitted on the full train split and scored on the
+held-out split; the table (CV + holdout metrics, fit time, single-row predict
+latency, artifact size) goes to artifacts/search_results.csv. The best candidate
+by CV R2 (optionally under --max-latency-ms) is saved with a manifest:
+
+    python search.py --n-jobs 8
+    NUTRITION_MODEL_PATH=artifacts/nutrition_model_search.pkl uvicorn app:app
+"""
+
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from joblib import Memory, Parallel, delayed, effective_n_jobs
+from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+
+from model_loader import ARTIFACT_DIR, compiled_dir, export_compiled
+from train import DATA_PATH, build_preprocess, evaluate, load_dataset, split_dataset, target_cols
+
+SEARCH_ARTIFACT = os.path.join(ARTIFACT_DIR, "nutrition_model_search.pkl")
+FEATURE_CACHE_DIR = os.path.join(ARTIFACT_DIR, "feature_cache")
+
+# family -> grid of constructor params
+SEARCH_SPACE = {
+    "rf": {"n_estimators": [100, 200, 400], "max_depth": [None, 12], "min_samples_leaf": [1, 3]},
+    "extra_trees": {"n_estimators": [200, 400], "max_depth": [None, 12], "min_samples_leaf": [1, 3]},
+    "hgb": {"max_iter": [150, 300], "learning_rate": [0.05, 0.1], "max_leaf_nodes": [15, 31]},
+}
+
+
+def candidates(families=None):
+    """[{'name', 'family', 'params'}] for every point of the grid."""
+    out = []
+    for family in families or SEARCH_SPACE:
+        grid = SEARCH_SPACE[family]
+        for values in itertools.product(*grid.values()):
+            params = dict(zip(grid, values))
+            name = family + "(" + ", ".join(f"{k}={v}" for k, v in params.items()) + ")"
+            out.append({"name": name, "family": family, "params": params})
+    return out
+
+
+def build_candidate(family, params):
+    """Single-threaded regressor for one candidate (the search parallelises across fits)."""
+    if family == "rf":
+        # one native multi-output forest: 4x fewer trees than MultiOutputRegressor(RF)
+        return RandomForestRegressor(random_state=42, n_jobs=1, **params)
+    if family == "extra_trees":
+        return ExtraTreesRegressor(random_state=42, n_jobs=1, **params)
+    if family == "hgb":
+        return MultiOutputRegressor(HistGradientBoostingRegressor(random_state=42, **params))
+    raise ValueError(f"Unknown model family '{family}'. Choose one of: {', '.join(SEARCH_SPACE)}")
+
+
+def data_hash(path=DATA_PATH) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _fit_features(X_fit, X_apply):
+    preprocess = build_preprocess().fit(X_fit)
+    return preprocess, [preprocess.transform(X) for X in X_apply]
+
+
+def fold_features(X, y, n_splits=5, seed=42):
+    """[(X_train, y_train, X_val, y_val)] per CV fold, preprocessing fitted on the fold's train part."""
+    folds = []
+    for train_idx, val_idx in KFold(n_splits, shuffle=True, random_state=seed).split(X):
+        _, (Xt, Xv) = _fit_features(X.iloc[train_idx], [X.iloc[train_idx], X.iloc[val_idx]])
+        folds.append((Xt, y.values[train_idx], Xv, y.values[val_idx]))
+    return folds
+
+
+def holdout_features(X_train, X_test):
+    """(fitted preprocess, X_train features, X_test features)."""
+    preprocess, (Xt, Xv) = _fit_features(X_train, [X_train, X_test])
+    return preprocess, Xt, Xv
+
+
+def _cv_fit(candidate, fold_index, fold):
+    Xt, yt, Xv, yv = fold
+    t0 = time.perf_counter()
+    model = build_candidate(candidate["family"], candidate["params"]).fit(Xt, yt)
+    fit_s = time.perf_counter() - t0
+    pred = model.predict(Xv)
+    return candidate["name"], fold_index, {
+        "fit_s": fit_s,
+        "r2": r2_score(yv, pred, multioutput="uniform_average"),
+        **{f"mae_{col}": mean_absolute_error(yv[:, i], pred[:, i]) for i, col in enumerate(target_cols)},
+    }
+
+
+def _holdout_fit(candidate, Xt, yt):
+    t0 = time.perf_counter()
+    model = build_candidate(candidate["family"], candidate["params"]).fit(Xt, yt)
+    return candidate["name"], model, time.perf_counter() - t0
+
+
+def _artifact_cost(pipeline, X_test, repeat=20):
+    """Pickled size and median single-row predict latency (through the whole pipeline)."""
+    buf = io.BytesIO()
+    joblib.dump(pipeline, buf)
+    single = X_test.iloc[[0]]
+    pipeline.predict(single)   # warm up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        pipeline.predict(single)
+        times.append(time.perf_counter() - t0)
+    return {"size_mb": buf.tell() / 1024 ** 2, "single_ms": np.median(times) * 1000}
+
+
+def run_search(families=None, n_jobs=-1, cv=5, max_latency_ms=None, output=SEARCH_ARTIFACT, cache_dir=FEATURE_CACHE_DIR):
+    X, y = load_dataset()
+    X_train, X_test, y_train, y_test = split_dataset(X, y)
+    memory = Memory(cache_dir, verbose=0)
+    todo = candidates(families)
+
+    t0 = time.perf_counter()
+    folds = memory.cache(fold_features)(X_train, y_train, cv)
+    preprocess, Xt, Xv = memory.cache(holdout_features)(X_train, X_test)
+    print(f"Features for {cv} folds + holdout ready in {time.perf_counter() - t0:.2f}s (cache: {cache_dir})")
+
+    # ✅ Cross-validate every candidate x fold, then refit each on the whole train split
+    t0 = time.perf_counter()
+    parallel = Parallel(n_jobs=n_jobs)
+    cv_results = parallel(
+        delayed(_cv_fit)(c, i, fold) for c in todo for i, fold in enumerate(folds)
+    )
+    fitted = parallel(delayed(_holdout_fit)(c, Xt, y_train.values) for c in todo)
+    search_s = time.perf_counter() - t0
+    print(f"{len(todo)} candidates x {cv} folds fitted in {search_s:.1f}s on {effective_n_jobs(n_jobs)} cores")
+
+    by_name = {}
+    for name, _, scores in cv_results:
+        by_name.setdefault(name, []).append(scores)
+
+    rows, models = [], {}
+    for candidate, (name, regressor, fit_s) in zip(todo, fitted):
+        pipeline = Pipeline(steps=[("preprocess", preprocess), ("regressor", regressor)])
+        models[name] = pipeline
+        folds_df = pd.DataFrame(by_name[name])
+        metrics, overall_r2 = evaluate(pipeline, X_test, y_test)
+        rows.append({
+            "name": name,
+            "family": candidate["family"],
+            "params": json.dumps(candidate["params"]),
+            "cv_r2": folds_df["r2"].mean(),
+            "cv_r2_std": folds_df["r2"].std(),
+            **{f"cv_{col}": folds_df[col].mean() for col in folds_df if col.startswith("mae_")},
+            "holdout_r2": overall_r2,
+            **{f"holdout_mae_{m['target']}": m["mae"] for m in metrics},
+            "fit_s": fit_s,
+            **_artifact_cost(pipeline, X_test),
+        })
+
+    table = pd.DataFrame(rows).sort_values("cv_r2", ascending=False).reset_index(drop=True)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    table_path = os.path.join(ARTIFACT_DIR, "search_results.csv")
+    table.to_csv(table_path, index=False)
+
+    print("\n=== Search results (sorted by CV R2) ===")
+    print(table[["name", "cv_r2", "cv_r2_std", "holdout_r2", "fit_s", "single_ms", "size_mb"]]
+          .round(4).to_string(index=False))
+    print(f"\n✅ Results saved to: {table_path}")
+
+    eligible = table if max_latency_ms is None else table[table["single_ms"] <= max_latency_ms]
+    if eligible.empty:
+        raise SystemExit(f"No candidate predicts within {max_latency_ms} ms")
+    best = eligible.iloc[0]
+    pipeline = models[best["name"]]
+
+    joblib.dump(pipeline, output)
+    manifest = {
+        "artifact": os.path.basename(output),
+        "created_at": datetime.utcnow().isoformat(),
+        "data": {"path": DATA_PATH, "sha256": data_hash(), "rows": len(X), "train_rows": len(X_train)},
+        "family": best["family"],
+        "params": json.loads(best["params"]),
+        "cv_folds": cv,
+        "metrics": {k: float(v) for k, v in best.items() if k not in ("name", "family", "params")},
+        "selection": {"by": "cv_r2", "max_latency_ms": max_latency_ms, "candidates": len(table)},
+        "versions": {"sklearn": sklearn.__version__, "numpy": np.__version__},
+    }
+    manifest_path = os.path.splitext(output)[0] + ".manifest.json"
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✅ Best: {best['name']} -> {output} (manifest: {manifest_path})")
+
+    if export_compiled(pipeline, output):
+        print(f"✅ Compiled layout saved to: {compiled_dir(output)}")
+    return table, manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel cross-validated search over nutrition model settings")
+    parser.add_argument("--families", nargs="+", choices=list(SEARCH_SPACE), default=None)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="total cores for the search (default: all)")
+    parser.add_argument("--cv", type=int, default=5)
+    parser.add_argument("--max-latency-ms", type=float, default=None,
+                        help="only pick candidates whose single-row predict is at most this fast")
+    parser.add_argument("--output", default=SEARCH_ARTIFACT)
+    args = parser.parse_args()
+
+    run_search(args.families, n_jobs=args.n_jobs, cv=args.cv, max_latency_ms=args.max_latency_ms, output=args.output)
+
+
+if __name__ == "__main__":
+    main()
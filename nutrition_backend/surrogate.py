@@ -0,0 +1,135 @@
+"""
+Small distilled stand-in for the nutrition forest (see distill.py).
+
+A surrogate is a fixed feature step followed by a few dense layers, all plain
+NumPy, so scoring one user is a couple of tiny matrix products:
+
+- inputs: the numeric columns, BMI and Mifflin-St Jeor BMR, one-hot gender/goal
+- standardised, then optionally expanded with all pairwise products (poly2)
+- dense layers with ReLU between them (a single layer = linear model)
+- outputs mapped back from standardised target units
+
+`save_surrogate` / `load_surrogate` store everything in one .npz file.
+"""
+
+import json
+
+import numpy as np
+
+ENGINEERED_COLS = ["bmi", "bmr"]
+
+
+class SurrogateModel:
+    """Feature step + dense layers. Build with distill.py, load with `load_surrogate`."""
+
+    def __init__(self, kind, numeric_cols, categories, mean, scale, pairs, layers, y_mean, y_scale):
+        self.kind = kind                    # e.g. "linear_poly2", "mlp_32"
+        self.numeric_cols = numeric_cols    # raw numeric inputs, in feature order
+        self.categories = categories        # [(column, [category, ...])] one-hot, in feature order
+        self.mean = mean                    # (n_base,) feature standardisation
+        self.scale = scale
+        self.pairs = pairs                  # (n_pairs, 2) feature index pairs for poly2, or None
+        self.layers = layers                # [(W, b)], ReLU between layers
+        self.y_mean = y_mean                # (n_outputs,) target de-standardisation
+        self.y_scale = y_scale
+
+    @property
+    def n_params(self):
+        return int(sum(W.size + b.size for W, b in self.layers))
+
+    @property
+    def n_bytes(self):
+        arrays = [self.mean, self.scale, self.y_mean, self.y_scale] + [a for layer in self.layers for a in layer]
+        if self.pairs is not None:
+            arrays.append(self.pairs)
+        return int(sum(a.nbytes for a in arrays))
+
+    def base_features(self, columns, n_rows):
+        """Unscaled (n_rows, n_base) matrix from a column mapping (dict of lists or DataFrame)."""
+        return base_features(columns, n_rows, self.numeric_cols, self.categories)
+
+    def predict_features(self, F):
+        z = (F - self.mean) / self.scale
+        if self.pairs is not None:
+            z = np.hstack([z, z[:, self.pairs[:, 0]] * z[:, self.pairs[:, 1]]])
+        last = len(self.layers) - 1
+        for i, (W, b) in enumerate(self.layers):
+            z = z @ W + b
+            if i < last:
+                np.maximum(z, 0.0, out=z)
+        return z * self.y_scale + self.y_mean
+
+    def predict(self, X):
+        """Predict a DataFrame or a list of input dicts; returns (n_rows, n_outputs)."""
+        if isinstance(X, list):
+            X = {col: [r[col] for r in X] for col in self._input_cols()}
+            n_rows = len(next(iter(X.values()))) if X else 0
+        else:
+            n_rows = len(X)
+        return self.predict_features(self.base_features(X, n_rows))
+
+    def predict_one(self, record):
+        """Predict a single input dict, e.g. `UserInput.model_dump()`."""
+        columns = {col: [record[col]] for col in self._input_cols()}
+        return self.predict_features(self.base_features(columns, 1))[0]
+
+    def _input_cols(self):
+        return list(self.numeric_cols) + [col for col, _ in self.categories]
+
+
+def base_features(columns, n_rows, numeric_cols, categories):
+    n_base = len(numeric_cols) + len(ENGINEERED_COLS) + sum(len(c) for _, c in categories)
+    F = np.zeros((n_rows, n_base), dtype=np.float64)
+    for j, col in enumerate(numeric_cols):
+        F[:, j] = np.asarray(columns[col], dtype=np.float64)
+
+    j = len(numeric_cols)
+    weight = np.asarray(columns["weight_kg"], dtype=np.float64)
+    height = np.asarray(columns["height_cm"], dtype=np.float64)
+    age = np.asarray(columns["age"], dtype=np.float64)
+    male = np.array([g == "Male" for g in columns["gender"]], dtype=np.float64)
+    F[:, j] = weight / (height / 100.0) ** 2
+    F[:, j + 1] = 10 * weight + 6.25 * height - 5 * age + np.where(male == 1.0, 5.0, -161.0)
+    j += len(ENGINEERED_COLS)
+
+    for col, values in categories:
+        index = {v: k for k, v in enumerate(values)}
+        for i, v in enumerate(columns[col]):
+            k = index.get(v)
+            if k is not None:   # unknown categories stay all-zero
+                F[i, j + k] = 1.0
+        j += len(values)
+    return F
+
+
+def save_surrogate(model, path):
+    arrays = {
+        "mean": model.mean, "scale": model.scale, "y_mean": model.y_mean, "y_scale": model.y_scale,
+    }
+    if model.pairs is not None:
+        arrays["pairs"] = model.pairs
+    for i, (W, b) in enumerate(model.layers):
+        arrays[f"W{i}"] = W
+        arrays[f"b{i}"] = b
+    meta = {
+        "kind": model.kind,
+        "numeric_cols": list(model.numeric_cols),
+        "categories": [[col, list(values)] for col, values in model.categories],
+        "n_layers": len(model.layers),
+    }
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_surrogate(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        layers = [(data[f"W{i}"], data[f"b{i}"]) for i in range(meta["n_layers"])]
+        return SurrogateModel(
+            kind=meta["kind"],
+            numeric_cols=meta["numeric_cols"],
+            categories=[(col, values) for col, values in meta["categories"]],
+            mean=data["mean"], scale=data["scale"],
+            pairs=data["pairs"] if "pairs" in data else None,
+            layers=layers,
+            y_mean=data["y_mean"], y_scale=data["y_scale"],
+        )
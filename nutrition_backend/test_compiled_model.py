@@ -0,0 +1,53 @@
+import tempfile
+
+import numpy as np
+
+from compiled_model import compile_pipeline, load_compiled, save_compiled
+from train import build_model, load_dataset
+
+# ✅ Compiled inference must give the same numbers as pipeline.predict.
+# Small forests with a fixed seed, fitted on the bundled CSV, so the check is
+# deterministic and needs no trained artifacts. The training rows sit exactly on
+# split thresholds, which is where the folded scaler could go wrong.
+N_TREES = 25
+
+
+def fitted(model_type):
+    X, y = load_dataset()
+    model = build_model(model_type)
+    regressor = model.named_steps["regressor"]
+    forest = regressor.estimator if model_type == "multioutput_rf" else regressor
+    forest.set_params(n_estimators=N_TREES, n_jobs=1)
+    return model.fit(X, y), X
+
+
+def check_parity(model_type):
+    pipeline, X = fitted(model_type)
+    expected = pipeline.predict(X)
+    compiled = compile_pipeline(pipeline)
+    np.testing.assert_allclose(compiled.predict(X), expected, rtol=1e-9, atol=1e-9)
+
+    records = X.to_dict("records")
+    for i in range(0, len(records), 97):
+        np.testing.assert_allclose(compiled.predict_one(records[i]), expected[i], rtol=1e-9, atol=1e-9)
+
+    # same answers after the save / mmap round trip the API serves from
+    with tempfile.TemporaryDirectory() as tmp:
+        save_compiled(compiled, f"{tmp}/model.compiled")
+        mapped = load_compiled(f"{tmp}/model.compiled", mmap_mode="r")
+        np.testing.assert_allclose(mapped.predict(X), expected, rtol=1e-9, atol=1e-9)
+    return len(X)
+
+
+def test_multioutput_rf_parity():
+    check_parity("multioutput_rf")
+
+
+def test_native_rf_parity():
+    check_parity("native_rf")
+
+
+if __name__ == "__main__":
+    for model_type in ("multioutput_rf", "native_rf"):
+        rows = check_parity(model_type)
+        print(f"✅ {model_type}: compiled model matches pipeline.predict on {rows} rows")
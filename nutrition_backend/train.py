@@ -1,4 +1,7 @@
+import argparse
 import os
+import time
+
 import joblib
 import numpy as np
 import pandas as pd
@@ -8,15 +11,15 @@ from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.multioutput import MultiOutputRegressor
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
+from model_loader import ARTIFACT_DIR, MODEL_TYPES, artifact_path, compiled_dir, export_compiled
+
 
-# ✅ 1) Load clean dataset
 DATA_PATH = "sri_lanka_dataset_1000_inputs_outputs_only.csv"
-df = pd.read_csv(DATA_PATH)
 
-# ✅ 2) Inputs (X) and Outputs (y)
+# ✅ Inputs (X) and Outputs (y)
 feature_cols = [
     "age", "gender", "height_cm", "weight_kg", "goal",
     "has_diabetes", "has_hypertension",
@@ -31,24 +34,6 @@ target_cols = [
     "fat_g_per_day"
 ]
 
-# ✅ 3) Handle missing values (safe)
-df["stress_score"] = df["stress_score"].fillna(df["stress_score"].median())
-df["active_minutes"] = df["active_minutes"].fillna(df["active_minutes"].median())
-df["has_diabetes"] = df["has_diabetes"].fillna(0).astype(int)
-df["has_hypertension"] = df["has_hypertension"].fillna(0).astype(int)
-
-# Ensure targets exist
-df = df.dropna(subset=target_cols).reset_index(drop=True)
-
-X = df[feature_cols]
-y = df[target_cols]
-
-# ✅ 4) Split train/test
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-
-# ✅ 5) Preprocess
 numeric_features = [
     "age", "height_cm", "weight_kg",
     "has_diabetes", "has_hypertension",
@@ -57,48 +42,186 @@ numeric_features = [
 ]
 categorical_features = ["gender", "goal"]
 
-preprocess = ColumnTransformer(
-    transformers=[
-        ("num", StandardScaler(), numeric_features),
-        ("cat", OneHotEncoder(handle_unknown="ignore"), categorical_features),
-    ]
-)
 
-# ✅ 6) Model (baseline, strong for PP1)
-rf = RandomForestRegressor(
-    n_estimators=400,
-    random_state=42,
-    n_jobs=-1
-)
+def missing_value_medians(df):
+    """Medians used to fill gaps; computed on the training data."""
+    return {
+        "stress_score": df["stress_score"].median(),
+        "active_minutes": df["active_minutes"].median(),
+    }
+
+
+def fill_missing(df, medians):
+    # ✅ Handle missing values (safe)
+    df["stress_score"] = df["stress_score"].fillna(medians["stress_score"])
+    df["active_minutes"] = df["active_minutes"].fillna(medians["active_minutes"])
+    df["has_diabetes"] = df["has_diabetes"].fillna(0).astype(int)
+    df["has_hypertension"] = df["has_hypertension"].fillna(0).astype(int)
+    return df
+
+
+def load_dataset(path=DATA_PATH):
+    # ✅ 1) Load clean dataset
+    df = pd.read_csv(path)
+
+    # ✅ 2) Handle missing values (safe)
+    df = fill_missing(df, missing_value_medians(df))
+
+    # Ensure targets exist
+    df = df.dropna(subset=target_cols).reset_index(drop=True)
+
+    return df[feature_cols], df[target_cols]
+
+
+def split_dataset(X, y):
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
 
-model = Pipeline(steps=[
-    ("preprocess", preprocess),
-    ("regressor", MultiOutputRegressor(rf))
-])
+def build_preprocess():
+    return ColumnTransformer(
+        transformers=[
+            ("num", StandardScaler(), numeric_features),
+            ("cat", OneHotEncoder(handle_unknown="ignore"), categorical_features),
+        ]
+    )
 
-# ✅ 7) Train
-model.fit(X_train, y_train)
 
-# ✅ 8) Evaluate (Regression metrics: MAE, RMSE, R²)
-pred = model.predict(X_test)
+def build_regressor(model_type):
+    if model_type == "multioutput_rf":
+        # Baseline: one 400-tree forest per target (1,600 trees)
+        rf = RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=-1)
+        return MultiOutputRegressor(rf)
+    if model_type == "native_rf":
+        # One forest whose leaves hold all 4 targets (400 trees)
+        return RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=-1)
+    if model_type == "hgb":
+        # HistGradientBoostingRegressor is single-output, so wrap it per target
+        hgb = HistGradientBoostingRegressor(max_iter=300, learning_rate=0.05, random_state=42)
+        return MultiOutputRegressor(hgb)
+    raise ValueError(f"Unknown model type '{model_type}'. Choose one of: {', '.join(MODEL_TYPES)}")
 
-print("\n=== Model Evaluation (Regression) ===")
-for i, col in enumerate(target_cols):
-    y_true = y_test[col].values
-    y_pred = pred[:, i]
 
-    mae = mean_absolute_error(y_true, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_true, y_pred))
-    r2 = r2_score(y_true, y_pred)
+def build_model(model_type):
+    return Pipeline(steps=[
+        ("preprocess", build_preprocess()),
+        ("regressor", build_regressor(model_type))
+    ])
+
+
+def evaluate(model, X_test, y_test):
+    """Regression metrics (MAE, RMSE, R²) per target."""
+    pred = model.predict(X_test)
+    rows = []
+    for i, col in enumerate(target_cols):
+        y_true = y_test[col].values
+        y_pred = pred[:, i]
+        rows.append({
+            "target": col,
+            "mae": mean_absolute_error(y_true, y_pred),
+            "rmse": np.sqrt(mean_squared_error(y_true, y_pred)),
+            "r2": r2_score(y_true, y_pred),
+        })
+    overall_r2 = r2_score(y_test.values, pred, multioutput="uniform_average")
+    return rows, overall_r2
 
-    print(f"{col}: MAE={mae:.2f} | RMSE={rmse:.2f} | R2={r2:.3f}")
 
-# Optional: one overall score across all outputs (avg)
-overall_r2 = r2_score(y_test.values, pred, multioutput="uniform_average")
-print(f"\nOverall R2 (average across outputs): {overall_r2:.3f}")
+def measure_artifact(path, X_test, repeat=20):
+    """Artifact size on disk, load time and single-row / batch predict latency."""
+    size_mb = os.path.getsize(path) / 1024 ** 2
+
+    t0 = time.perf_counter()
+    model = joblib.load(path)
+    load_s = time.perf_counter() - t0
+
+    single = X_test.iloc[[0]]
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        model.predict(single)
+        times.append(time.perf_counter() - t0)
+    single_ms = np.median(times) * 1000
+
+    t0 = time.perf_counter()
+    model.predict(X_test)
+    batch_ms = (time.perf_counter() - t0) * 1000
+
+    return {"size_mb": size_mb, "load_s": load_s, "single_ms": single_ms, "batch_ms": batch_ms}
+
+
+def train_and_save(model_type, X_train, X_test, y_train, y_test):
+    model = build_model(model_type)
+
+    # ✅ Train
+    t0 = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - t0
+
+    # ✅ Evaluate (Regression metrics: MAE, RMSE, R²)
+    rows, overall_r2 = evaluate(model, X_test, y_test)
+
+    print(f"\n=== Model Evaluation (Regression): {model_type} ===")
+    for r in rows:
+        print(f"{r['target']}: MAE={r['mae']:.2f} | RMSE={r['rmse']:.2f} | R2={r['r2']:.3f}")
+
+    # Optional: one overall score across all outputs (avg)
+    print(f"\nOverall R2 (average across outputs): {overall_r2:.3f}")
+
+    # ✅ Save trained model
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    path = artifact_path(model_type)
+    joblib.dump(model, path)
+    print(f"\n✅ Model saved to: {path} (fit {fit_s:.1f}s)")
+
+    # ✅ Export the mmap-able compiled layout served by app.py (skipped for HGB)
+    if export_compiled(model, path):
+        print(f"✅ Compiled layout saved to: {compiled_dir(path)}")
+
+    return model, rows, path
+
+
+def compare(model_types, X_train, X_test, y_train, y_test):
+    report = []
+    for model_type in model_types:
+        _, rows, path = train_and_save(model_type, X_train, X_test, y_train, y_test)
+        cost = measure_artifact(path, X_test)
+        for r in rows:
+            report.append({"model_type": model_type, **r, **cost})
+
+    report = pd.DataFrame(report)
+    print("\n=== Model Comparison ===")
+    print(report.pivot(index="target", columns="model_type", values=["mae", "rmse", "r2"]).round(3).to_string())
+    print()
+    print(report.drop_duplicates("model_type")[["model_type", "size_mb", "load_s", "single_ms", "batch_ms"]]
+          .round(3).to_string(index=False))
+
+    report_path = os.path.join(ARTIFACT_DIR, "model_comparison.csv")
+    report.to_csv(report_path, index=False)
+    print(f"\n✅ Comparison saved to: {report_path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the nutrition model")
+    parser.add_argument("--model-type", choices=list(MODEL_TYPES), default="multioutput_rf",
+                        help="regressor to train (default: multioutput_rf, the original 4 x 400-tree setup)")
+    parser.add_argument("--compare", action="store_true",
+                        help="train every model type and write a comparison report")
+    parser.add_argument("--distill", action="store_true",
+                        help="then distil the trained model into a small surrogate (see distill.py)")
+    args = parser.parse_args()
+
+    X, y = load_dataset()
+    X_train, X_test, y_train, y_test = split_dataset(X, y)
+
+    if args.compare:
+        compare(list(MODEL_TYPES), X_train, X_test, y_train, y_test)
+    else:
+        train_and_save(args.model_type, X_train, X_test, y_train, y_test)
+
+    if args.distill:
+        from distill import distill
+        distill(teacher_type=args.model_type)
 
-# ✅ 9) Save trained model
-os.makedirs("artifacts", exist_ok=True)
-joblib.dump(model, "artifacts/nutrition_model.pkl")
 
-print("\n✅ Model saved to: artifacts/nutrition_model.pkl")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from datetime import date, datetime
+
+from sqlalchemy import DateTime, insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+
+
+class _PendingWrite:
+    __slots__ = ("row", "done")
+
+    def __init__(self, row, durable):
+        self.row = row
+        self.done = Future() if durable else None
+
+
+class QueueFullError(RuntimeError):
+    """Raised by submit when `max_queue` rows are already waiting (the DB is not keeping up)."""
+
+
+def _row_error(error):
+    """True if the database rejected the rows themselves (a retry cannot help), not the connection or server."""
+    if isinstance(error, (IntegrityError, DataError)):
+        return True
+    # raised while binding parameters (bad value for a column type), before reaching the database
+    return isinstance(error, StatementError) and not isinstance(error, DBAPIError)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class WriteBehindQueue:
+    """
+    In-process write-behind buffer for ORM rows.
+
+    `submit` enqueues a row dict and returns immediately; a background thread inserts
+    queued rows in one executemany per batch, flushing when `max_batch` rows are
+    waiting or the oldest row has waited `max_delay_s`. `submit(..., durable=True)`
+    blocks until the row's batch is committed and re-raises any flush error;
+    `submit_async` does the same without holding a thread while it waits.
+
+    `after_insert(session, rows)`, if given, runs in the same transaction as each
+    batch insert (e.g. to maintain rollups).
+
+    A flush that fails on the connection or server (e.g. the DB is down) is retried
+    `retries` times with exponential backoff from `retry_backoff_s`; if it still
+    fails, the whole batch is appended to `dead_letter_path` (JSON lines) for
+    `replay_dead_letter()` to queue again, e.g. at startup. A flush the database
+    rejects because of the rows (IntegrityError, DataError) is not retried: its rows
+    are written one by one so one bad row does not take the others with it, and the
+    bad rows are dropped. Rows whose submitter is waiting on them (durable) are never
+    spilled; the submitter gets the error.
+
+    At most `max_queue` rows wait at once: past that `submit` waits up to
+    `enqueue_timeout_s` for room and `submit_async` fails at once, both with
+    QueueFullError, instead of buffering without bound while the DB is down.
+
+    The thread starts on first use, so forked workers (gunicorn --preload) each get
+    their own. Call `close()` on shutdown to flush what is left.
+    """
+
+    def __init__(self, session_factory, model, max_batch=500, max_delay_s=0.2, after_insert=None,
+                 max_queue=10_000, enqueue_timeout_s=1.0, retries=3, retry_backoff_s=0.5, dead_letter_path=None):
+        self.session_factory = session_factory
+        self.model = model
+        self.after_insert = after_insert
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self.max_queue = max_queue
+        self.enqueue_timeout_s = enqueue_timeout_s
+        self.retries = retries
+        self.retry_backoff_s = retry_backoff_s
+        self.dead_letter_path = dead_letter_path
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._dead_letter_lock = threading.Lock()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_dead_lettered = 0
+        self.rows_rejected = 0
+        self.retried_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_depth = 0
+
+    def _enqueue(self, row, durable, block):
+        if self._closed:
+            raise RuntimeError("write-behind queue is closed")
+        self._ensure_started()
+
+        pending = _PendingWrite(row, durable)
+        try:
+            if block:
+                self._queue.put(pending, timeout=self.enqueue_timeout_s)
+            else:
+                self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._stats_lock:
+                self.rows_rejected += 1
+            raise QueueFullError(f"write-behind queue is full ({self.max_queue} rows waiting)") from None
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return pending
+
+    def submit(self, row: dict, durable: bool = False, timeout: float = 10.0):
+        pending = self._enqueue(row, durable, block=True)
+        if durable:
+            pending.done.result(timeout)
+
+    async def submit_async(self, row: dict, durable: bool = False, timeout: float = 10.0):
+        # never block the event loop waiting for room
+        pending = self._enqueue(row, durable, block=False)
+        if durable:
+            # shield: a timeout must not cancel the row's future, the writer still settles it
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(pending.done)), timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:   # close() sentinel
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay_s
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _write(self, rows):
+        """Insert rows (plus after_insert) in one transaction; the exception, or None on success."""
+        db = self.session_factory()
+        try:
+            db.execute(insert(self.model), rows)
+            if self.after_insert is not None:
+                self.after_insert(db, rows)
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+
+    def _flush(self, batch):
+        t0 = time.perf_counter()
+        rows = [p.row for p in batch]
+        error = self._write(rows)
+        attempt = 0
+        while error is not None and not _row_error(error) and attempt < self.retries:
+            delay = self.retry_backoff_s * 2 ** attempt
+            attempt += 1
+            print(f"Write-behind flush of {len(rows)} rows failed ({error}); retry {attempt}/{self.retries} in {delay:.1f}s")
+            time.sleep(delay)
+            error = self._write(rows)
+
+        errors = [None] * len(batch)
+        if error is not None and _row_error(error):
+            print(f"Write-behind flush of {len(rows)} rows rejected ({error}); writing them one by one")
+            errors = self._write_each(rows)
+        elif error is not None:
+            print(f"Write-behind flush of {len(rows)} rows failed after {self.retries} retries: {error}")
+            print("".join(traceback.format_exception(error)))
+            errors = [error] * len(batch)
+
+        spill = [p.row for p, e in zip(batch, errors)
+                 if e is not None and p.done is None and not _row_error(e)]
+        if spill:
+            self._dead_letter(spill)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+
+        failed = sum(e is not None for e in errors)
+        with self._stats_lock:
+            self.flushes += 1
+            self.retried_flushes += attempt > 0
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+            self.rows_written += len(batch) - failed
+            self.rows_failed += failed
+            self.rows_dead_lettered += len(spill) if self.dead_letter_path else 0
+
+        for p, e in zip(batch, errors):
+            self._settle(p, e)
+
+    def _write_each(self, rows):
+        """Write rows one per transaction; once a row fails on the connection, the rest get that error too."""
+        errors = []
+        for i, row in enumerate(rows):
+            error = self._write([row])
+            if error is not None and not _row_error(error):
+                return errors + [error] * (len(rows) - i)
+            errors.append(error)
+        return errors
+
+    @staticmethod
+    def _settle(pending, error):
+        if pending.done is None or pending.done.done():
+            return
+        if error is None:
+            pending.done.set_result(None)
+        else:
+            pending.done.set_exception(error)
+
+    def _dead_letter(self, rows):
+        if not self.dead_letter_path:
+            print(f"Write-behind: dropped {len(rows)} rows (no dead-letter file configured)")
+            return
+        with self._dead_letter_lock, open(self.dead_letter_path, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=_json_default) + "\n")
+        print(f"Write-behind: {len(rows)} rows saved to {self.dead_letter_path} for replay")
+
+    def replay_dead_letter(self) -> int:
+        """
+        Queue the rows of the dead-letter file again and remove it; returns how many.
+        The file is claimed by renaming it first, so with several workers only one replays it.
+        """
+        if not self.dead_letter_path:
+            return 0
+        claimed = f"{self.dead_letter_path}.{os.getpid()}.replay"
+        try:
+            os.replace(self.dead_letter_path, claimed)
+        except FileNotFoundError:
+            return 0
+        datetime_columns = {c.name for c in self.model.__table__.columns if isinstance(c.type, DateTime)}
+        with open(claimed) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        for i, row in enumerate(rows):
+            for name in datetime_columns & row.keys():
+                if row[name] is not None:
+                    row[name] = datetime.fromisoformat(row[name])
+            try:
+                self._enqueue(row, durable=False, block=True)
+            except QueueFullError:
+                self._dead_letter(rows[i:])   # try again on the next replay
+                break
+        os.remove(claimed)
+        return len(rows)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Flush queued rows and stop the background thread. Rows still queued after
+        `timeout` (e.g. the DB is down and the queue is full) go to the dead letter.
+        """
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                print(f"Write-behind: queue still full after {timeout}s at shutdown")
+            else:
+                self._thread.join(timeout)
+
+        left = []
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is not None:
+                left.append(pending)
+        if left:
+            print(f"Write-behind: {len(left)} rows not written before shutdown")
+            spill = [p.row for p in left if p.done is None]
+            if spill:
+                self._dead_letter(spill)
+                with self._stats_lock:
+                    self.rows_dead_lettered += len(spill) if self.dead_letter_path else 0
+            for p in left:
+                self._settle(p, RuntimeError("write-behind queue closed before the row was written"))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "rows_failed": self.rows_failed,
+                "rows_dead_lettered": self.rows_dead_lettered,
+                "rows_rejected": self.rows_rejected,
+                "retried_flushes": self.retried_flushes,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+                "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+                "max_flush_ms": round(self.max_flush_ms, 2),
+                "max_batch": self.max_batch,
+                "max_delay_s": self.max_delay_s,
+                "max_queue": self.max_queue,
+            }